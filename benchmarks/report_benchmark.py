@@ -0,0 +1,429 @@
+"""Benchmark of BGCFlow report generation on synthetic projects.
+
+Creates synthetic project results with a configurable number of rules and genomes, then times the
+report scaffolding, the rendering of report pages by the generated macros and the MkDocs build.
+
+Usage:
+    python benchmarks/report_benchmark.py --rules 5,20 --genomes 100,5000 --output results.json
+    python benchmarks/report_benchmark.py --compare baseline.json results.json
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import logging
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+from jinja2 import Template
+
+import bgcflow
+from bgcflow.mkdocs import build_static_report, prepare_mkdocs_report
+
+# categories of the synthetic rules, as in the BGCFlow report navigation
+categories = ["Quality Control", "Genome Mining", "Phylogenomics", "Comparative"]
+
+
+def make_synthetic_project(bgcflow_dir, project_name, n_rules, n_genomes, seed=0):
+    """
+    Creates the results of a synthetic BGCFlow project.
+
+    Every rule gets a report page listing the genomes of its result table with the report macros.
+
+    Args:
+        bgcflow_dir (str or Path): The BGCFlow directory to create the project in.
+        project_name (str): The name of the project.
+        n_rules (int): The number of rules, i.e. report pages.
+        n_genomes (int): The number of genomes, i.e. rows of each result table.
+        seed (int, optional): The seed of the random table values. Defaults to 0.
+
+    Returns:
+        Path: The report directory of the project.
+    """
+    rng = random.Random(seed)
+    report_dir = Path(bgcflow_dir) / f"data/processed/{project_name}"
+    for d in ["metadata", "docs", "tables"]:
+        (report_dir / d).mkdir(parents=True, exist_ok=True)
+
+    rules = [f"rule_{i:03d}" for i in range(n_rules)]
+    project_metadata = {
+        project_name: {
+            "description": f"Synthetic project with {n_rules} rules and {n_genomes} genomes",
+            "sample_size": n_genomes,
+            "references": [f"reference {i}" for i in range(3)],
+            "bgcflow_version": "0.8.0",
+            "rule_used": {
+                r: {
+                    "category": categories[i % len(categories)],
+                    "description": f"Synthetic rule {r}",
+                }
+                for i, r in enumerate(rules)
+            },
+        }
+    }
+    with open(report_dir / "metadata/project_metadata.json", "w") as f:
+        json.dump(project_metadata, f, indent=2)
+    with open(report_dir / "metadata/dependency_versions.json", "w") as f:
+        json.dump({"antismash": "7.1.0"}, f, indent=2)
+
+    genome_ids = [f"GCA_{i:09d}.1" for i in range(n_genomes)]
+    sources = [rng.choice(["ncbi", "patric", "custom"]) for _ in genome_ids]
+    strains = [f"strain_{rng.randrange(10**6)}" for _ in genome_ids]
+    for r in rules:
+        pd.DataFrame(
+            {
+                "genome_id": genome_ids,
+                "source": sources,
+                "strain": strains,
+                "bgc_count": [rng.randrange(50) for _ in genome_ids],
+                "gc_content": [round(rng.uniform(0.3, 0.75), 4) for _ in genome_ids],
+            }
+        ).to_csv(report_dir / f"tables/df_{r}.csv", index=False)
+        (report_dir / f"docs/{r}.md").write_text(page_source(r))
+    return report_dir
+
+
+def page_source(rule, revision=0):
+    """
+    Returns the markdown of a synthetic report page.
+
+    Args:
+        rule (str): The rule name.
+        revision (int, optional): A number written in the page, to simulate an edited page. Defaults to 0.
+
+    Returns:
+        str: The page markdown.
+    """
+    return (
+        f"# {rule}\n\n"
+        "Project: {{ project().name }}, antiSMASH {{ project().dependency_version() }}\n\n"
+        f"Revision {revision}\n\n"
+        f'{{{{ read_csv_html("tables/df_{rule}.csv", "{rule}") }}}}\n'
+    )
+
+
+def load_macros(report_dir):
+    """
+    Imports the generated `main.py` macros of a report and registers them like mkdocs-macros.
+
+    Args:
+        report_dir (Path): The report directory.
+
+    Returns:
+        dict: The macros, keyed by name.
+    """
+
+    class Env(object):
+        def __init__(self):
+            self.macros = {}
+
+        def macro(self, f):
+            self.macros[f.__name__] = f
+            return f
+
+    spec = importlib.util.spec_from_file_location(
+        f"bgcflow_benchmark_macros_{time.monotonic_ns()}", report_dir / "main.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    env = Env()
+    module.define_env(env)
+    return env.macros
+
+
+def render_pages(report_dir):
+    """
+    Renders the macros of every synthetic page, as mkdocs-macros does during a build.
+
+    Args:
+        report_dir (Path): The report directory.
+
+    Returns:
+        int: The total size of the rendered pages in characters.
+    """
+    # mkdocs runs the macros from the report directory
+    with contextlib.chdir(report_dir):
+        macros = load_macros(report_dir)
+        size = 0
+        for page in sorted((report_dir / "docs").glob("rule_*.md")):
+            size += len(Template(page.read_text()).render(**macros))
+    return size
+
+
+def measure(func, repeat):
+    """
+    Times a function.
+
+    Args:
+        func (callable): The function to time, called without arguments.
+        repeat (int): The number of runs.
+
+    Returns:
+        dict: The `min`, `median` and `max` run time in seconds and the individual `runs`.
+    """
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return {
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "max": max(runs),
+        "runs": runs,
+    }
+
+
+def benchmark_case(n_rules, n_genomes, repeat=3, build=True, work_dir=None):
+    """
+    Benchmarks the report generation of one synthetic project.
+
+    Args:
+        n_rules (int): The number of rules of the project.
+        n_genomes (int): The number of genomes of the project.
+        repeat (int, optional): The number of runs of each step. Defaults to 3.
+        build (bool, optional): Whether to time the MkDocs build steps. Defaults to True.
+        work_dir (str or Path, optional): The directory to create the project in. Defaults to a temporary directory.
+
+    Returns:
+        dict: The case parameters and the timings of each step.
+    """
+    bgcflow_dir = Path(tempfile.mkdtemp(dir=work_dir, prefix="bgcflow_benchmark_"))
+    project_name = f"synthetic_{n_rules}x{n_genomes}"
+    try:
+        report_dir = make_synthetic_project(
+            bgcflow_dir, project_name, n_rules, n_genomes
+        )
+
+        def scaffold_cold():
+            for f in ["mkdocs.yml", "main.py", ".bgcflow_scaffold.json"]:
+                (report_dir / f).unlink(missing_ok=True)
+            prepare_mkdocs_report(bgcflow_dir, project_name, ipynb=False)
+
+        steps = {
+            "scaffold_cold": measure(scaffold_cold, repeat),
+            "scaffold_warm": measure(
+                lambda: prepare_mkdocs_report(bgcflow_dir, project_name, ipynb=False),
+                repeat,
+            ),
+            "render_pages": measure(lambda: render_pages(report_dir), repeat),
+        }
+
+        if build:
+            revisions = iter(range(1, repeat + 1))
+
+            def edit_one_page():
+                page = report_dir / "docs/rule_000.md"
+                page.write_text(page_source("rule_000", next(revisions)))
+                build_static_report(bgcflow_dir, project_name)
+
+            steps["build_full"] = measure(
+                lambda: build_static_report(bgcflow_dir, project_name, full=True),
+                repeat,
+            )
+            steps["build_noop"] = measure(
+                lambda: build_static_report(bgcflow_dir, project_name), repeat
+            )
+            steps["build_one_page"] = measure(edit_one_page, repeat)
+    finally:
+        shutil.rmtree(bgcflow_dir, ignore_errors=True)
+    return {"rules": n_rules, "genomes": n_genomes, "steps": steps}
+
+
+def run_benchmark(rules, genomes, repeat=3, build=True, work_dir=None):
+    """
+    Benchmarks every combination of rule and genome counts.
+
+    Args:
+        rules (list): The rule counts.
+        genomes (list): The genome counts.
+        repeat (int, optional): The number of runs of each step. Defaults to 3.
+        build (bool, optional): Whether to time the MkDocs build steps. Defaults to True.
+        work_dir (str or Path, optional): The directory to create the projects in. Defaults to a temporary directory.
+
+    Returns:
+        dict: The environment `meta` data and the `results` of each case.
+    """
+    results = []
+    for n_rules in rules:
+        for n_genomes in genomes:
+            print(
+                f"Benchmarking {n_rules} rule(s) x {n_genomes} genome(s)...",
+                file=sys.stderr,
+            )
+            results.append(benchmark_case(n_rules, n_genomes, repeat, build, work_dir))
+    return {"meta": get_metadata(repeat), "results": results}
+
+
+def get_metadata(repeat):
+    """
+    Describes the environment of a benchmark run.
+
+    Args:
+        repeat (int): The number of runs of each step.
+
+    Returns:
+        dict: The versions, platform, git commit and time of the run.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "bgcflow_wrapper": bgcflow.__version__,
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    Compares the median timings of two benchmark runs.
+
+    Args:
+        baseline (dict): The results of the reference run.
+        current (dict): The results of the new run.
+        threshold (float, optional): The relative slowdown reported as a regression. Defaults to 0.1.
+
+    Returns:
+        list: One dictionary per step present in both runs, with the `rules`, `genomes`, `step`,
+            `baseline` and `current` median seconds, their `ratio` and whether it is a `regression`.
+    """
+    baseline_steps = {
+        (r["rules"], r["genomes"], step): t["median"]
+        for r in baseline["results"]
+        for step, t in r["steps"].items()
+    }
+    rows = []
+    for r in current["results"]:
+        for step, t in r["steps"].items():
+            key = (r["rules"], r["genomes"], step)
+            if key not in baseline_steps:
+                continue
+            ratio = t["median"] / baseline_steps[key] if baseline_steps[key] else None
+            rows.append(
+                {
+                    "rules": r["rules"],
+                    "genomes": r["genomes"],
+                    "step": step,
+                    "baseline": baseline_steps[key],
+                    "current": t["median"],
+                    "ratio": ratio,
+                    "regression": ratio is not None and ratio > 1 + threshold,
+                }
+            )
+    return rows
+
+
+def print_comparison(rows):
+    """
+    Prints a comparison table.
+
+    Args:
+        rows (list): The output of `compare_results`.
+    """
+    print(
+        f"{'rules':>6} {'genomes':>8} {'step':<16} {'base (s)':>10} {'new (s)':>10} ratio"
+    )
+    for r in rows:
+        ratio = "n/a" if r["ratio"] is None else f"{r['ratio']:.2f}x"
+        flag = "  REGRESSION" if r["regression"] else ""
+        print(
+            f"{r['rules']:>6} {r['genomes']:>8} {r['step']:<16} {r['baseline']:>10.3f} {r['current']:>10.3f} {ratio}{flag}"
+        )
+
+
+def print_results(benchmark):
+    """
+    Prints the median timings of a benchmark run.
+
+    Args:
+        benchmark (dict): The output of `run_benchmark`.
+    """
+    print(f"{'rules':>6} {'genomes':>8} {'step':<16} {'median (s)':>10}")
+    for r in benchmark["results"]:
+        for step, t in r["steps"].items():
+            print(f"{r['rules']:>6} {r['genomes']:>8} {step:<16} {t['median']:>10.3f}")
+
+
+def parse_counts(value):
+    """
+    Parses a comma separated list of counts.
+
+    Args:
+        value (str): e.g. "5,20".
+
+    Returns:
+        list: The counts as integers.
+    """
+    return [int(v) for v in value.split(",") if v.strip() != ""]
+
+
+def main():
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rules", default="5,20", type=parse_counts)
+    parser.add_argument("--genomes", default="100,1000", type=parse_counts)
+    parser.add_argument("--repeat", default=3, type=int)
+    parser.add_argument(
+        "--no-build", action="store_true", help="Skip the MkDocs build steps."
+    )
+    parser.add_argument("--work-dir", default=None)
+    parser.add_argument("--output", default=None, help="Write the results as JSON.")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BASELINE", "CURRENT"),
+        help="Compare two result files instead of running the benchmark.",
+    )
+    parser.add_argument(
+        "--threshold",
+        default=0.1,
+        type=float,
+        help="Relative slowdown reported as a regression. (DEFAULT: 0.1)",
+    )
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        with open(args.compare[0], "r") as f:
+            baseline = json.load(f)
+        with open(args.compare[1], "r") as f:
+            current = json.load(f)
+        rows = compare_results(baseline, current, args.threshold)
+        print_comparison(rows)
+        sys.exit(1 if any(r["regression"] for r in rows) else 0)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    benchmark = run_benchmark(
+        args.rules, args.genomes, args.repeat, not args.no_build, args.work_dir
+    )
+    print_results(benchmark)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(benchmark, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,39 @@
 """Main module."""
+import contextlib
+import fcntl
+import json
 import multiprocessing
 import os
+import shlex
 import subprocess
-import time
+from datetime import datetime
 from pathlib import Path
 
 import click
-import requests
 import yaml
 from git import GitCommandError, Repo
 
+from bgcflow.cache import load_json_state, save_json_state
+from bgcflow.history import (
+    estimate_run,
+    get_genome_targets,
+    print_estimate,
+    recording_output_sizes,
+)
+from bgcflow.rules import RuleCatalog
+from bgcflow.services import ServiceSupervisor
+
+bgcflow_repository = "https://github.com/NBChub/bgcflow.git"
+
+# bare mirror of the BGCFlow repository shared by clones made with `--reference` or `--offline`
+mirror_dir = Path.home() / ".cache/bgcflow/mirror/bgcflow.git"
+
+# worktrees of the mirror added with `bgcflow clone --worktree`, keyed by their path
+worktree_registry = Path.home() / ".cache/bgcflow/worktrees.json"
+
+# conda environments shared by every worktree, so that switching versions does not solve them again
+shared_conda_prefix = Path.home() / ".cache/bgcflow/conda"
+
 
 def snakemake_wrapper(**kwargs):
     """
@@ -21,7 +45,10 @@ def snakemake_wrapper(**kwargs):
     Returns:
         None
     """
-    p = "Empty process catcher"
+    if kwargs.get("estimate"):
+        cores = min(kwargs["cores"], multiprocessing.cpu_count())
+        print_estimate(estimate_run(kwargs["bgcflow_dir"], cores))
+        return
 
     dryrun = ""
     touch = ""
@@ -41,45 +68,56 @@ def snakemake_wrapper(**kwargs):
         until = f"--until {kwargs['until']}"
     if kwargs["profile"] is not None:
         profile = f"--profile {kwargs['profile']}"
-
-    if not kwargs["monitor_on"]:
-        pass
-    else:
-        click.echo("Monitoring BGCFlow jobs with Panoptes...")
-        # Run Panoptes if not yet run
-        port = int(kwargs["wms_monitor"].split(":")[-1])
-
+    targets = ""
+    if kwargs.get("genome"):
+        genome_ids = [g.strip() for g in kwargs["genome"].split(",") if g.strip()]
         try:
-            item = requests.get(f"{kwargs['wms_monitor']}/api/service-info")
-            status = item.json()["status"]
-            assert status == "running"
-            click.echo(f"Panoptes already {status} on {kwargs['wms_monitor']}")
-        except requests.exceptions.RequestException:  # This is the correct syntax
+            genome_targets = get_genome_targets(kwargs["bgcflow_dir"], genome_ids)
+        except ValueError as e:
+            click.echo(f"ERROR: {e}")
+            return
+        if len(genome_targets["without_history"]) > 0:
             click.echo(
-                f"Running Panoptes to monitor BGCFlow jobs at {kwargs['wms_monitor']}"
+                "WARNING: No previous run of these rules, their outputs are not targeted: "
+                + ", ".join(genome_targets["without_history"])
             )
-            p = subprocess.Popen(
-                ["panoptes", "--port", str(port)], stderr=subprocess.DEVNULL
+        if len(genome_targets["skipped"]) > 0:
+            click.echo(
+                f"WARNING: No rule produces {len(genome_targets['skipped'])} output(s) found in previous runs, they are not targeted: "
+                + ", ".join(genome_targets["skipped"][:5])
+            )
+        if len(genome_targets["targets"]) == 0:
+            click.echo(
+                "ERROR: Cannot find the outputs of the selected rules for these genomes. Run the whole project once first."
             )
-            click.echo(f"Panoptes job id: {p.pid}")
+            return
+        click.echo(
+            f"Targeting {len(genome_targets['targets'])} output(s) of {len(genome_ids)} genome(s)."
+        )
+        targets = " ".join(shlex.quote(t) for t in genome_targets["targets"])
+    conda_prefix = get_conda_prefix(kwargs["bgcflow_dir"], kwargs.get("conda_prefix"))
+    if conda_prefix is not None:
+        conda_prefix = f"--conda-prefix {conda_prefix}"
+    else:
+        conda_prefix = ""
 
-        # Connect to Panoptes
-        click.echo("Connecting to Panoptes...")
-        ctr = 1
-        for tries in range(10):
-            try:
-                item = requests.get(f"{kwargs['wms_monitor']}/api/service-info")
-                status = item.json()["status"]
-                if status == "running":
-                    click.echo(f"Panoptes status: {status}")
-                    break
-            except requests.exceptions.RequestException:  # This is the correct syntax
-                click.echo(f"Retrying to connect: {ctr}x")
-                ctr = ctr + 1
-                time.sleep(1)
-                pass
-            else:
-                time.sleep(1)
+    if kwargs["monitor_on"]:
+        click.echo("Monitoring BGCFlow jobs with Panoptes...")
+        # Run Panoptes if not yet run
+        port = int(kwargs["wms_monitor"].split(":")[-1])
+        supervisor = ServiceSupervisor(kwargs["bgcflow_dir"])
+        panoptes = supervisor.start(
+            "panoptes",
+            ["panoptes", "--port", "{port}"],
+            port=port,
+            cwd=kwargs["bgcflow_dir"],
+            health_path="/api/service-info",
+            reuse_external=True,
+        )
+        kwargs["wms_monitor"] = panoptes["url"]
+        if panoptes["started"]:
+            click.echo(f"Panoptes job id: {panoptes['pid']}")
+        click.echo(f"Panoptes status: running on {panoptes['url']}")
 
     # Check Snakefile
     valid_workflows = {
@@ -141,42 +179,261 @@ def snakemake_wrapper(**kwargs):
         params_monitor = ""
     else:
         params_monitor = f"--wms-monitor {kwargs['wms_monitor']}"
-    snakemake_command = f"cd {kwargs['bgcflow_dir']} && snakemake --snakefile {snakefile} --use-conda --keep-going --rerun-incomplete --rerun-triggers mtime -c {kwargs['cores']} {dryrun} {touch} {until} {unlock} {profile} {params_monitor}"
+    snakemake_command = f"cd {kwargs['bgcflow_dir']} && snakemake --snakefile {snakefile} --use-conda --keep-going --rerun-incomplete --rerun-triggers mtime -c {kwargs['cores']} {dryrun} {touch} {until} {unlock} {profile} {conda_prefix} {params_monitor} {targets}"
     click.echo(f"Running Snakemake with command:\n{snakemake_command}")
-    subprocess.call(snakemake_command, shell=True)
+    if kwargs["dryrun"] or kwargs["unlock"]:
+        subprocess.call(snakemake_command, shell=True)
+    else:
+        # measured while they exist, the temp() outputs are part of later disk estimates
+        with recording_output_sizes(kwargs["bgcflow_dir"]):
+            subprocess.call(snakemake_command, shell=True)
 
-    # Kill Panoptes
-    try:
-        if not type(p) == str:
-            click.echo(f"Stopping panoptes server: PID {p.pid}")
-            p.kill()
-    except UnboundLocalError as e:
-        click.echo(e)
+    # Stop Panoptes if it was started for this run
+    if kwargs["monitor_on"] and panoptes["started"]:
+        click.echo(f"Stopping panoptes server: PID {panoptes['pid']}")
+        supervisor.stop("panoptes")
     return
 
 
+def get_conda_prefix(bgcflow_dir, conda_prefix=None):
+    """
+    Returns the directory where Snakemake creates the conda environments of a run.
+
+    Worktrees added with `bgcflow clone --worktree` share `~/.cache/bgcflow/conda`, so the
+    environments of files that did not change between versions are reused.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        conda_prefix (str, optional): The directory chosen by the user.
+
+    Returns:
+        str: The conda prefix, or None to use the default `.snakemake/conda` of the directory.
+    """
+    if conda_prefix is not None:
+        return str(conda_prefix)
+    if str(Path(bgcflow_dir).resolve()) in load_json_state(worktree_registry):
+        return str(shared_conda_prefix)
+    return None
+
+
+@contextlib.contextmanager
+def mirror_lock(mirror):
+    """
+    Serializes changes of the mirror and its worktrees between BGCFlow processes.
+
+    Args:
+        mirror (Path): The mirror directory.
+    """
+    mirror.parent.mkdir(parents=True, exist_ok=True)
+    with open(mirror.parent / f".{mirror.name}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def update_mirror(mirror=None, url=None, offline=False):
+    """
+    Creates or updates the local mirror of the BGCFlow repository.
+
+    The mirror is a bare `git clone --mirror` shared by every clone made with `--reference` or
+    `--offline`. Concurrent updates are serialized with a file lock. Those clones read objects from
+    the mirror through their alternates, so refs deleted or rewritten upstream are not pruned and
+    garbage collection never deletes unreachable objects of the mirror.
+
+    Args:
+        mirror (str, optional): The mirror directory. Defaults to `~/.cache/bgcflow/mirror/bgcflow.git`.
+        url (str, optional): The URL of the BGCFlow repository. Defaults to the GitHub repository.
+        offline (bool, optional): Use the mirror as it is, without fetching. Defaults to False.
+
+    Returns:
+        Path: The mirror directory.
+
+    Raises:
+        FileNotFoundError: If the mirror does not exist and cannot be created offline.
+    """
+    mirror = Path(mirror or mirror_dir)
+    url = url or bgcflow_repository
+    with mirror_lock(mirror):
+        if not (mirror / "HEAD").is_file():
+            if offline:
+                raise FileNotFoundError(
+                    f"No BGCFlow mirror in {mirror}. Run `bgcflow clone --reference` once with network access."
+                )
+            click.echo(f"Creating BGCFlow mirror in {mirror}...")
+            Repo.clone_from(url, mirror, mirror=True)
+        repo = Repo(mirror)
+        # objects borrowed by clones may no longer be reachable from any ref of the mirror
+        with repo.config_writer() as config:
+            config.set_value("gc", "pruneExpire", "never")
+            config.set_value("fetch", "prune", "false")
+        if not offline:
+            click.echo(f"Updating BGCFlow mirror in {mirror}...")
+            try:
+                repo.git.fetch("--no-prune", "origin")
+            except GitCommandError as e:
+                click.echo(
+                    f"WARNING: Cannot update the mirror, using it as is: {e.stderr.strip()}"
+                )
+    return mirror
+
+
+def add_worktree(destination, ref, offline=False):
+    """
+    Checks out a version of BGCFlow as a worktree of the local mirror.
+
+    Worktrees share the history of the mirror, so adding one only writes the files of the
+    version. The worktree is detached at the commit of `ref`, which keeps it pinned when
+    the mirror is updated, and recorded in `~/.cache/bgcflow/worktrees.json`.
+
+    Args:
+        destination (str): The worktree directory.
+        ref (str): The branch, tag or commit to check out.
+        offline (bool, optional): Use the mirror as it is, without fetching. Defaults to False.
+
+    Returns:
+        dict: The registered worktree, or None if it cannot be added.
+    """
+    mirror = update_mirror(offline=offline)
+    destination_dir = Path(destination).resolve()
+    click.echo(f"Adding BGCFlow {ref} worktree in {destination_dir}...")
+    with mirror_lock(mirror):
+        repo = Repo(mirror)
+        try:
+            commit = repo.git.rev_parse("--verify", f"{ref}^{{commit}}")
+            repo.git.worktree("add", "--detach", str(destination_dir), commit)
+        except GitCommandError as e:
+            print(f"ERROR: Cannot add BGCFlow worktree: {e.stderr.strip()}")
+            return None
+        registry = load_json_state(worktree_registry)
+        worktree = {
+            "ref": ref,
+            "commit": commit,
+            "mirror": str(mirror.resolve()),
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
+        registry[str(destination_dir)] = worktree
+        save_json_state(worktree_registry, registry)
+    click.echo(
+        f"Conda environments of runs in this worktree are shared in {shared_conda_prefix}."
+    )
+    return worktree
+
+
+def list_worktrees():
+    """
+    Lists the worktrees added with `bgcflow clone --worktree`.
+
+    Returns:
+        dict: For each worktree path, its ref, the registered and current commits, and whether
+            its directory still exists.
+    """
+    worktrees = {}
+    current = {}
+    for path, worktree in load_json_state(worktree_registry).items():
+        mirror = worktree["mirror"]
+        if mirror not in current:
+            current[mirror] = {}
+            if Path(mirror).is_dir():
+                porcelain = Repo(mirror).git.worktree("list", "--porcelain")
+                for block in porcelain.split("\n\n"):
+                    fields = dict(
+                        line.split(" ", 1) for line in block.splitlines() if " " in line
+                    )
+                    if "worktree" in fields:
+                        current[mirror][fields["worktree"]] = fields.get("HEAD")
+        worktrees[path] = {
+            **worktree,
+            "head": current[mirror].get(path),
+            "exists": Path(path).is_dir(),
+        }
+    return worktrees
+
+
+def prune_worktrees():
+    """
+    Forgets the worktrees whose directory was deleted.
+
+    Runs `git worktree prune` in the mirror.
+
+    Returns:
+        list: The paths of the pruned worktrees.
+    """
+    with mirror_lock(Path(mirror_dir)):
+        worktrees = list_worktrees()
+        for mirror in {w["mirror"] for w in worktrees.values()}:
+            if Path(mirror).is_dir():
+                Repo(mirror).git.worktree("prune")
+        pruned = [path for path, w in worktrees.items() if not w["exists"]]
+        registry = {k: v for k, v in worktrees.items() if k not in pruned}
+        for worktree in registry.values():
+            worktree.pop("head")
+            worktree.pop("exists")
+        save_json_state(worktree_registry, registry)
+    return pruned
+
+
 def cloner(**kwargs):
     """
     Clone the BGCFlow repository to a specified destination.
 
     Args:
-        **kwargs (dict): Keyword arguments for the cloning.
+        **kwargs (dict): Keyword arguments for the cloning:
+            destination (str): The destination directory.
+            branch (str): The branch or tag to check out.
+            depth (int, optional): Only fetch the last `depth` commits.
+            filter (str, optional): A partial clone filter, e.g. `blob:none` to fetch file contents on demand.
+            reference (bool, optional): Borrow the objects of the local mirror instead of copying them.
+            offline (bool, optional): Clone from the local mirror without network access.
+            dissociate (bool, optional): Copy the objects borrowed from the local mirror, so that the
+                clone does not depend on it.
+            worktree (str, optional): Add a worktree of the local mirror at this ref instead of a clone.
 
     Returns:
         None
     """
+    if kwargs.get("worktree"):
+        if kwargs.get("depth") or kwargs.get("filter"):
+            click.echo("WARNING: --depth and --filter do not apply to worktrees.")
+        add_worktree(
+            kwargs["destination"], kwargs["worktree"], kwargs.get("offline", False)
+        )
+        return
     destination_dir = Path(kwargs["destination"])
+    url = bgcflow_repository
+    options = {"branch": kwargs["branch"]}
+    if kwargs.get("depth"):
+        options["depth"] = kwargs["depth"]
+    if kwargs.get("filter"):
+        options["filter"] = kwargs["filter"]
+    if kwargs.get("reference") or kwargs.get("offline") or kwargs.get("dissociate"):
+        mirror = update_mirror(offline=kwargs.get("offline", False))
+        options["reference"] = str(mirror.resolve())
+        if kwargs.get("dissociate"):
+            options["dissociate"] = True
+        if kwargs.get("offline"):
+            # depth and filter only apply to local clones over the file:// protocol
+            url = mirror.resolve().as_uri()
+
     click.echo(f"Cloning BGCFlow to {destination_dir}...")
     destination_dir.mkdir(parents=True, exist_ok=True)
     try:
-        Repo.clone_from(
-            "https://github.com/NBChub/bgcflow.git",
-            Path(kwargs["destination"]),
-            branch=kwargs["branch"],
-        )
-    except GitCommandError:
-        print(
-            f"Oops, it seems {kwargs['destination']} already exists and is not an empty directory."
+        repo = Repo.clone_from(url, destination_dir, **options)
+    except GitCommandError as e:
+        if any(destination_dir.iterdir()):
+            print(
+                f"Oops, it seems {kwargs['destination']} already exists and is not an empty directory."
+            )
+        else:
+            print(f"ERROR: Cannot clone BGCFlow: {e.stderr.strip()}")
+        return
+    if url != bgcflow_repository:
+        repo.remotes.origin.set_url(bgcflow_repository)
+    if "reference" in options and "dissociate" not in options:
+        click.echo(
+            f"The clone borrows objects from {options['reference']}, do not delete the mirror. "
+            "Use `--dissociate` for a clone that does not depend on it."
         )
     return
 
@@ -195,32 +452,57 @@ def get_all_rules(**kwargs):
     rule_file = path / "workflow/rules.yaml"
 
     if rule_file.is_file():
-        with open(rule_file, "r") as file:
-            data = yaml.safe_load(file)
+        catalog = RuleCatalog(path)
+        as_json = kwargs.get("json", False)
         try:
+            if type(kwargs.get("search")) is str:
+                results = catalog.search(kwargs["search"])
+                if as_json:
+                    print(
+                        json.dumps(
+                            [
+                                {"name": name, "score": score, **catalog.get(name)}
+                                for name, score in results
+                            ],
+                            indent=2,
+                        )
+                    )
+                elif len(results) == 0:
+                    print(f"No rules found for '{kwargs['search']}'.")
+                else:
+                    print(f"Rules matching '{kwargs['search']}':")
+                    for name, score in results:
+                        description = catalog.get(name).get("description", "")
+                        print(f" - {name}: {description}")
+                return
+
+            rule_names = [
+                r for r in [kwargs["describe"], kwargs["cite"]] if type(r) is str
+            ]
+            if as_json:
+                print(catalog.to_json(rule_names or None))
+                return
+
             if type(kwargs["describe"]) is str:
                 rule_name = kwargs["describe"]
+                rule = catalog.get(rule_name)
                 print(f"Description for {rule_name}:")
-                print(f" - {data[rule_name]['description']}")
+                print(f" - {rule['description']}")
 
             if type(kwargs["cite"]) is str:
                 rule_name = kwargs["cite"]
+                rule = catalog.get(rule_name)
                 print(f"Citations for {rule_name}:")
-                [print("-", c) for c in data[rule_name]["references"]]
+                [print("-", c) for c in rule["references"]]
 
-            if (not type(kwargs["describe"]) is str) and (
-                not type(kwargs["cite"]) is str
-            ):
+            if len(rule_names) == 0:
                 print("Printing available rules:")
-                for item in data.keys():
+                for item in catalog.names():
                     print(f" - {item}")
 
-        except KeyError:
-            rule_name = [
-                r for r in [kwargs["describe"], kwargs["cite"]] if type(r) is str
-            ]
+        except KeyError as e:
             print(
-                f"ERROR: Cannot find rule {rule_name} in dictionary. Find available rules with `bgcflow rules`."
+                f"ERROR: {e.args[0]} Find available rules with `bgcflow pipelines` or `bgcflow pipelines --search <text>`."
             )
 
     else:
@@ -0,0 +1,92 @@
+"""Content hashing and on-disk state helpers."""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+
+def file_hash(path):
+    """
+    Computes the SHA-256 hash of a file's content.
+
+    Args:
+        path (str or Path): The file to hash.
+
+    Returns:
+        str: The hex digest of the file content.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def path_fingerprint(path):
+    """
+    Fingerprints a file or a directory tree.
+
+    Files are hashed by content. Directories (e.g. antiSMASH or BiG-SCAPE results) can hold
+    thousands of large files, so they are fingerprinted by the relative path, size and modification
+    time of every file below them.
+
+    Args:
+        path (str or Path): The file or directory to fingerprint.
+
+    Returns:
+        str: A hex digest, or None if the path does not exist.
+    """
+    path = Path(path)
+    if path.is_file():
+        return file_hash(path)
+    if not path.is_dir():
+        return None
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(path, followlinks=True):
+        dirs.sort()
+        for f in sorted(files):
+            item = Path(root) / f
+            try:
+                stat = item.stat()
+            except FileNotFoundError:
+                continue
+            relative = item.relative_to(path).as_posix()
+            h.update(f"{relative}\t{stat.st_size}\t{stat.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def load_json_state(path, default=None):
+    """
+    Reads a JSON state file.
+
+    Args:
+        path (str or Path): The state file.
+        default (optional): The value returned if the file does not exist or is corrupted. Defaults to an empty dict.
+
+    Returns:
+        The parsed state.
+    """
+    if default is None:
+        default = {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+def save_json_state(path, state):
+    """
+    Writes a JSON state file atomically, so that concurrent readers never see a partial file.
+
+    Args:
+        path (str or Path): The state file.
+        state: The JSON serializable state.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
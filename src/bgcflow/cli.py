@@ -1,16 +1,42 @@
 """Console script for bgcflow."""
+import signal
 import subprocess
 import sys
 from pathlib import Path
 
 import click
-import yaml
+import duckdb
 
 import bgcflow
-from bgcflow.bgcflow import cloner, get_all_rules, snakemake_wrapper
-from bgcflow.metabase import upload_and_sync_to_metabase
-from bgcflow.mkdocs import generate_mkdocs_report
-from bgcflow.projects_util import copy_final_output, projects_util
+from bgcflow.bgcflow import (
+    cloner,
+    get_all_rules,
+    list_worktrees,
+    prune_worktrees,
+    snakemake_wrapper,
+)
+from bgcflow.database import (
+    connect_catalog,
+    export_parquet,
+    get_database_mtime,
+    query_database,
+    record_database_state,
+    refresh_catalog,
+    update_database,
+    write_result,
+)
+from bgcflow.hub import serve_report_hub
+from bgcflow.metabase import sync_projects_to_metabase, upload_and_sync_to_metabase
+from bgcflow.mkdocs import (
+    build_static_report,
+    generate_mkdocs_report,
+    prepare_mkdocs_report,
+    run_for_projects,
+    signal_handler,
+)
+from bgcflow.notebook import execute_notebooks
+from bgcflow.projects_util import copy_final_output, list_project_names, projects_util
+from bgcflow.services import ServiceSupervisor, find_free_port
 
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 
@@ -31,6 +57,38 @@ def main():
     default="main",
     help="BGCFlow branch. (DEFAULT: `main`)",
 )
+@click.option(
+    "--depth",
+    type=int,
+    default=None,
+    help="Only fetch the last N commits of the history.",
+)
+@click.option(
+    "--filter",
+    default=None,
+    help="Partial clone filter, e.g. `blob:none` to download file contents only when they are checked out.",
+)
+@click.option(
+    "--reference",
+    is_flag=True,
+    help="Borrow git objects from a local mirror of BGCFlow kept in ~/.cache/bgcflow/mirror, which is created or updated first.",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    help="Clone from the local mirror without network access. Implies `--reference`.",
+)
+@click.option(
+    "--dissociate",
+    is_flag=True,
+    help="Copy the git objects borrowed from the local mirror after cloning, so that the clone keeps working if the mirror is deleted. Implies `--reference`.",
+)
+@click.option(
+    "--worktree",
+    default=None,
+    metavar="REF",
+    help="Add a worktree of the local mirror at a branch, tag or commit instead of a full clone. Worktrees share the git history and the conda environments.",
+)
 def clone(**kwargs):
     """
     Get a clone of BGCFlow to local directory.
@@ -42,6 +100,40 @@ def clone(**kwargs):
     cloner(**kwargs)
 
 
+@main.command()
+@click.option(
+    "--prune",
+    is_flag=True,
+    help="Forget the worktrees whose directory was deleted.",
+)
+def worktrees(**kwargs):
+    """
+    List the BGCFlow worktrees added with `bgcflow clone --worktree`.
+    """
+    if kwargs["prune"]:
+        pruned = prune_worktrees()
+        click.echo(f"Pruned {len(pruned)} worktree(s).")
+        for path in pruned:
+            click.echo(f" - {path}")
+        return
+    registered = list_worktrees()
+    if len(registered) == 0:
+        click.echo(
+            "No worktrees. Add one with `bgcflow clone <destination> --worktree <ref>`."
+        )
+        return
+    for path, worktree in registered.items():
+        if not worktree["exists"]:
+            status = "missing, remove with `bgcflow worktrees --prune`"
+        elif worktree["head"] != worktree["commit"]:
+            status = f"moved to {(worktree['head'] or 'unknown')[:8]}"
+        else:
+            status = "ok"
+        click.echo(
+            f" - {path}: {worktree['ref']} ({worktree['commit'][:8]}) [{status}]"
+        )
+
+
 @main.command()
 @click.option(
     "-d",
@@ -98,6 +190,21 @@ def clone(**kwargs):
     help="Which antiSMASH mode to run. Available parameters are 'bacteria' or 'fungi'.",
     show_default=True,
 )
+@click.option(
+    "--conda-prefix",
+    default=None,
+    help="Directory of the conda environments. (DEFAULT: ~/.cache/bgcflow/conda for worktrees, .snakemake/conda otherwise)",
+)
+@click.option(
+    "--genome",
+    default=None,
+    help="Only build the outputs of the selected rules for these genomes, as a comma-separated list of genome ids.",
+)
+@click.option(
+    "--estimate",
+    is_flag=True,
+    help="Predict the runtime, peak disk use and critical path of a full rerun from previous runs, without running any jobs.",
+)
 def run(**kwargs):
     """
     A snakemake CLI wrapper to run BGCFlow. Automatically run panoptes.
@@ -114,10 +221,18 @@ def run(**kwargs):
 )
 @click.option("--describe", help="Get description of a given pipeline.")
 @click.option("--cite", help="Get citation of a given pipeline.")
+@click.option(
+    "--search",
+    help="Search pipelines by name, description and references. Tolerates typos.",
+)
+@click.option(
+    "--json", is_flag=True, help="Print the pipelines as machine-readable JSON."
+)
 def pipelines(**kwargs):
     """
     Get description of available pipelines from BGCFlow.
 
+    bgcflow pipelines --search "gene cluster" finds pipelines by name, description and references.
     """
     get_all_rules(**kwargs)
 
@@ -181,6 +296,12 @@ def init(**kwargs):
     default="True",
     help="Resolve symlinks as actual files/folders when copying. Set this to False if you want to keep them as symlinks. (DEFAULT: True)",
 )
+@click.option(
+    "--dedupe",
+    type=click.Choice(["none", "auto", "reflink", "hardlink"]),
+    default="none",
+    help="When resolving symlinks, share file data with the source if both are on the same filesystem. `auto` and `reflink` use copy-on-write reflinks and fall back to a byte copy. `hardlink` makes the copies the same files as in the source, so editing them edits the original results. (DEFAULT: none)",
+)
 def get_result(**kwargs):
     """
     View a tree of a project results or get a copy using Rsync.
@@ -212,7 +333,7 @@ def get_result(**kwargs):
 @click.option(
     "--file_server",
     default="http://localhost:8002",
-    help="Port to use for fileserver. (DEFAULT: http://localhost:8002)",
+    help="Address of the fileserver. The default starts the built-in threaded file server with Range and caching support. (DEFAULT: http://localhost:8002)",
 )
 @click.option(
     "--bgcflow_dir",
@@ -230,46 +351,175 @@ def get_result(**kwargs):
     help="Run Panoptes server to monitor workflow at http://localhost:5000",
 )
 @click.option("--project", help="Name of the project. (DEFAULT: all)")
+@click.option(
+    "--all",
+    "serve_all",
+    is_flag=True,
+    help="Serve the reports of every project in `config/config.yaml` from one server on --port_markdown. Each report is built on its first visit and rebuilt once its results change.",
+)
+@click.option(
+    "--max_memory",
+    default=256,
+    help="Memory limit in MB for the report files and result tables cached by `--all`. (DEFAULT: 256)",
+)
+@click.option(
+    "--notebook_workers",
+    default=None,
+    type=int,
+    help="Maximum number of report notebooks executed at once. (DEFAULT: number of CPUs)",
+)
+@click.option(
+    "--notebook_timeout",
+    default=600,
+    help="Time limit in seconds for executing a single report notebook. (DEFAULT: 600)",
+)
+@click.option(
+    "--ipynb",
+    is_flag=True,
+    help="Use the Jupyter notebooks in the report `docs` directory as pages of the report.",
+)
+@click.option(
+    "--execute_notebooks",
+    is_flag=True,
+    help="Execute the report notebooks in parallel before serving the report.",
+)
+@click.option(
+    "--no_notebook_cache",
+    is_flag=True,
+    help="Execute every notebook instead of reusing cached outputs of notebooks whose source and project results are unchanged.",
+)
+@click.option(
+    "--detach",
+    is_flag=True,
+    help="Leave the servers running in the background. Use --shutdown to stop them.",
+)
+@click.option(
+    "--status",
+    is_flag=True,
+    help="List the BGCFlow servers running in the BGCFlow directory.",
+)
+@click.option(
+    "--shutdown",
+    is_flag=True,
+    help="Stop every BGCFlow server running in the BGCFlow directory.",
+)
 def serve(**kwargs):
     """
     Serve static HTML report or other utilities (Metabase, etc.).
+
+    Servers run as supervised background services. A server already running for the same purpose is
+    reused, busy ports are replaced by free ones, and servers started by this command are stopped on
+    exit unless --detach is used.
     """
     workflow_dir = Path(kwargs["bgcflow_dir"]) / "workflow"
+    supervisor = ServiceSupervisor(kwargs["bgcflow_dir"])
 
-    # METABASE
-    if kwargs["metabase"]:
-        subprocess.call(
-            f"(cd {workflow_dir.parent.resolve()} && snakemake --snakefile workflow/Metabase -c 1)",
-            shell=True,
-        )
+    # SERVICE MANAGEMENT
+    if kwargs["status"]:
+        running = supervisor.status()
+        if len(running) == 0:
+            click.echo(" - No BGCFlow services are running.")
+        for name, service in running.items():
+            pid = "external" if service.get("external") else f"pid {service['pid']}"
+            click.echo(f" - {name}: {service['url']} ({pid})")
+        return
+    if kwargs["shutdown"]:
+        stopped = supervisor.stop_all()
+        click.echo(f" - Stopped {len(stopped)} BGCFlow service(s).")
+        return
 
-    # PANOPTES
-    if kwargs["panoptes"]:
-        subprocess.call(
-            f"(cd {workflow_dir.parent.resolve()} && panoptes --port {kwargs['port_panoptes']})",
-            shell=True,
+    signal.signal(signal.SIGTERM, signal_handler)
+    services = []
+    try:
+        # METABASE
+        if kwargs["metabase"]:
+            services.append(
+                supervisor.start(
+                    "metabase",
+                    ["snakemake", "--snakefile", "workflow/Metabase", "-c", "1"],
+                    port=3000,
+                    cwd=workflow_dir.parent.resolve(),
+                    health_path="/api/health",
+                    fixed_port=True,
+                    reuse_external=True,
+                    timeout=1800,
+                )
+            )
+
+        # PANOPTES
+        if kwargs["panoptes"]:
+            services.append(
+                supervisor.start(
+                    "panoptes",
+                    ["panoptes", "--port", "{port}"],
+                    port=kwargs["port_panoptes"],
+                    cwd=workflow_dir.parent.resolve(),
+                    health_path="/api/service-info",
+                    reuse_external=True,
+                )
+            )
+        for service in services:
+            click.echo(f" - {service['name']} is running at {service['url']}")
+
+        serve_project(workflow_dir, supervisor, services, **kwargs)
+
+        if len(services) > 0 and not kwargs["detach"]:
+            supervisor.wait([service["name"] for service in services])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if not kwargs["detach"]:
+            for service in reversed(services):
+                if service["started"]:
+                    supervisor.stop(service["name"])
+
+
+def serve_project(workflow_dir, supervisor, services, **kwargs):
+    """
+    Serves the project reports selected by the `serve` command options.
+
+    Args:
+        workflow_dir (Path): The BGCFlow workflow directory.
+        supervisor (ServiceSupervisor): The supervisor of the BGCFlow directory.
+        services (list): The services started by the command, extended with the report file server.
+        **kwargs: The `serve` command options.
+    """
+    notebook_options = {
+        "ipynb": kwargs["ipynb"],
+        "execute": kwargs["execute_notebooks"],
+        "workers": kwargs["notebook_workers"],
+        "timeout": kwargs["notebook_timeout"],
+        "cache": not kwargs["no_notebook_cache"],
+    }
+
+    # PANOPTES OR METABASE ONLY
+    if len(services) > 0 and kwargs["project"] is None and not kwargs["serve_all"]:
+        return
+
+    # ALL PROJECTS
+    elif kwargs["serve_all"]:
+        project_names = list_project_names(kwargs["bgcflow_dir"])
+        if not project_names:
+            click.echo(
+                " - No projects found. Use --bgcflow_dir to set the right location."
+            )
+            return
+        serve_report_hub(
+            kwargs["bgcflow_dir"],
+            project_names,
+            port=find_free_port(kwargs["port_markdown"]),
+            max_memory=kwargs["max_memory"],
+            build_options=notebook_options,
         )
+
     # PROJECT DEFAULT
     elif kwargs["project"] is None:
         click.echo(" - Use bgcflow serve --metabase to start a metabase server.")
         click.echo(
             "\n - Use bgcflow serve --project <PROJECT_NAME> to serve a specific project report."
         )
-        bgcflow_dir = Path(kwargs["bgcflow_dir"])
-        global_config = bgcflow_dir / "config/config.yaml"
-        if global_config.is_file():
-            # grab available projects
-            with open(global_config, "r") as file:
-                config_yaml = yaml.safe_load(file)
-                project_names = [p for p in config_yaml["projects"]]
-                available_projects = []
-                for p in project_names:
-                    if "pep" in p.keys():
-                        p["name"] = p.pop("pep")
-                    if p["name"].endswith(".yaml") or p["name"].endswith(".yml"):
-                        with open(bgcflow_dir / p["name"], "r") as pep_file:
-                            pep_yaml = yaml.safe_load(pep_file)
-                            available_projects.append(pep_yaml["name"])
+        available_projects = list_project_names(kwargs["bgcflow_dir"])
+        if available_projects is not None:
             if available_projects == []:
                 click.echo(" - No projects found.")
             else:
@@ -292,19 +542,39 @@ def serve(**kwargs):
             f"(cd {workflow_dir.parent.resolve()} && snakemake --report index.html)",
             shell=True,
         )
-        subprocess.call(
-            f"(cd {workflow_dir.resolve()} && jupyter nbconvert --execute --to html --output {output_dir.resolve()}/processed/index.html {workflow_dir.resolve()}/notebook/99-entry_point.ipynb --no-input --template classic)",
-            shell=True,
-        )
-        subprocess.call(
+        results = execute_notebooks(
             [
-                "python",
-                "-m",
-                "http.server",
-                "--directory",
-                kwargs["bgcflow_dir"],
-                str(kwargs["port"]),
-            ]
+                {
+                    "notebook": workflow_dir / "notebook/99-entry_point.ipynb",
+                    "output": output_dir / "processed/index.html",
+                    "to": "html",
+                    "cwd": workflow_dir.resolve(),
+                    "extra_args": ["--no-input", "--template", "classic"],
+                }
+            ],
+            workers=kwargs["notebook_workers"],
+            timeout=kwargs["notebook_timeout"],
+        )
+        if not all(r["status"] == "ok" for r in results):
+            click.echo(" - Some report notebooks failed. See the summary above.")
+        bgcflow_dir = Path(kwargs["bgcflow_dir"]).resolve()
+        services.append(
+            supervisor.start(
+                "file_server:snakemake_report",
+                [
+                    sys.executable,
+                    "-m",
+                    "bgcflow.fileserver",
+                    "--directory",
+                    bgcflow_dir,
+                    "{port}",
+                ],
+                port=kwargs["port_markdown"],
+                key=str(bgcflow_dir),
+            )
+        )
+        click.echo(
+            f" - Snakemake report available at: {services[-1]['url']}/data/processed/index.html"
         )
 
     # PROJECT MKDOCS_REPORT
@@ -323,7 +593,12 @@ def serve(**kwargs):
         port_id = kwargs["port_markdown"]
         file_server = kwargs["file_server"]
         generate_mkdocs_report(
-            bgcflow_dir, project_name, port_id, file_server, ipynb=False
+            bgcflow_dir,
+            project_name,
+            port_id,
+            file_server,
+            detach=kwargs["detach"],
+            **notebook_options,
         )
 
 
@@ -339,6 +614,74 @@ def serve(**kwargs):
     help="Use at most N CPU cores/jobs in parallel. (DEFAULT: 8)",
 )
 @click.option("-n", "--dryrun", is_flag=True, help="Test run.")
+@click.option(
+    "--static",
+    is_flag=True,
+    help="Build a deployable static site of a project report with MkDocs, rebuilding only pages whose inputs changed. Use with `--project`.",
+)
+@click.option("--project", help="Name of the project to build a static report for.")
+@click.option(
+    "--all",
+    "all_projects",
+    is_flag=True,
+    help="Build the report of every project in `config/config.yaml` in parallel, using up to `--cores` workers. Use with `--static` or `--scaffold_only`.",
+)
+@click.option(
+    "--scaffold_only",
+    is_flag=True,
+    help="Only generate the MkDocs config, homepage, macros and assets of the report. Unchanged files are not rewritten.",
+)
+@click.option(
+    "--file_server",
+    default="http://localhost:8002",
+    help="Address of the fileserver linked from the static report. (DEFAULT: http://localhost:8002)",
+)
+@click.option(
+    "--paginate_tables",
+    is_flag=True,
+    help="Load tables above 1000 rows page by page from the `api/table` endpoint of the built-in file server. Only use it if the report is viewed with `bgcflow serve`.",
+)
+@click.option(
+    "--site_dir",
+    default=None,
+    help="Output directory of the static report. (DEFAULT: <project report>/site)",
+)
+@click.option(
+    "--full",
+    is_flag=True,
+    help="Rebuild every page of the static report.",
+)
+@click.option(
+    "--ipynb",
+    is_flag=True,
+    help="Use the Jupyter notebooks in the report `docs` directory as pages of the static report.",
+)
+@click.option(
+    "--execute_notebooks",
+    is_flag=True,
+    help="Execute the report notebooks in parallel before building the static report.",
+)
+@click.option(
+    "--notebook_workers",
+    default=None,
+    type=int,
+    help="Maximum number of notebooks executed at once. (DEFAULT: number of CPUs)",
+)
+@click.option(
+    "--notebook_timeout",
+    default=600,
+    help="Time limit in seconds for executing a single notebook. (DEFAULT: 600)",
+)
+@click.option(
+    "--no_notebook_cache",
+    is_flag=True,
+    help="Execute every notebook instead of reusing cached outputs of notebooks whose source and project results are unchanged.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Merge only the rows of new, changed and removed genomes into the tables loaded from changed result tables, and rebuild with `dbt build --select` only the dbt models built from them. Projects without a previous build, or with changed tables that no model reads, are built in full. Use `--project` to update a single project.",
+)
 @click.argument("build_type", type=click.Choice(["report", "database"]))
 @main.command()
 def build(build_type, **kwargs):
@@ -347,25 +690,154 @@ def build(build_type, **kwargs):
 
     bgcflow build "report" will generate a Markdown report from the Jupyter notebook.
 
+    bgcflow build "report" --static --project <PROJECT_NAME> will build a static site of the project report.
+
     bgcflow build "database" will use dbt to build a DuckDB database from the BGCFlow results.
+
+    bgcflow build "database" --incremental will only update the genomes whose results changed since the last build.
     """
     dryrun = ""
     bgcflow_dir = Path(kwargs["bgcflow_dir"])
+
+    if build_type == "report" and (
+        kwargs["static"] or kwargs["scaffold_only"] or kwargs["all_projects"]
+    ):
+        if kwargs["all_projects"]:
+            if not (kwargs["static"] or kwargs["scaffold_only"]):
+                raise click.UsageError("--all requires --static or --scaffold_only")
+            if kwargs["site_dir"] is not None:
+                raise click.UsageError("--site_dir cannot be used with --all")
+            projects = list_project_names(bgcflow_dir)
+            if not projects:
+                raise click.UsageError(
+                    f"No projects found in {bgcflow_dir / 'config/config.yaml'}"
+                )
+        elif kwargs["project"] is None:
+            raise click.UsageError(
+                "--static and --scaffold_only require --project <PROJECT_NAME> or --all"
+            )
+        else:
+            projects = [kwargs["project"]]
+
+        if kwargs["scaffold_only"]:
+            results = run_for_projects(
+                prepare_mkdocs_report,
+                bgcflow_dir,
+                projects,
+                max_workers=kwargs["cores"],
+                fileserver=kwargs["file_server"],
+                ipynb=kwargs["ipynb"],
+                table_api=kwargs["paginate_tables"],
+            )
+            message = "Report scaffolding available at"
+        else:
+            results = run_for_projects(
+                build_static_report,
+                bgcflow_dir,
+                projects,
+                max_workers=kwargs["cores"],
+                fileserver=kwargs["file_server"],
+                site_dir=kwargs["site_dir"],
+                ipynb=kwargs["ipynb"],
+                full=kwargs["full"],
+                execute=kwargs["execute_notebooks"],
+                workers=kwargs["notebook_workers"],
+                timeout=kwargs["notebook_timeout"],
+                cache=not kwargs["no_notebook_cache"],
+                table_api=kwargs["paginate_tables"],
+            )
+            message = "Static report available at"
+        failed = [k for k, v in results.items() if v["status"] != "ok"]
+        for project, result in results.items():
+            if result["status"] == "ok":
+                click.echo(f"{project}: {message}: {result['result']}")
+            else:
+                click.echo(f"{project}: failed: {result['error']}", err=True)
+        if len(failed) > 0:
+            raise click.ClickException(
+                f"{len(failed)} of {len(projects)} project report(s) failed: {failed}"
+            )
+        return
+
+    if build_type == "database" and kwargs["incremental"] and not kwargs["dryrun"]:
+        if kwargs["project"] is not None:
+            projects = [kwargs["project"]]
+        else:
+            projects = list_project_names(bgcflow_dir) or []
+        results = run_for_projects(
+            update_database, bgcflow_dir, projects, max_workers=kwargs["cores"]
+        )
+        full_build = []
+        for project, result in results.items():
+            if result["status"] != "ok" or result["result"] is None:
+                full_build.append(project)
+            else:
+                merged = result["result"]["merged"]
+                genomes = sum(v["updated"] + v["removed"] for v in merged.values())
+                rebuilt = len(result["result"]["select"])
+                click.echo(
+                    f"{project}: {genomes} genome(s) merged into {len(merged)} table(s), {rebuilt} dbt model(s) rebuilt"
+                )
+        if len(full_build) == 0:
+            return
+        click.echo(f"Running a full database build for: {', '.join(full_build)}")
+
     if kwargs["dryrun"]:
         dryrun = "--dryrun"
 
+    # the databases written by the full build are recorded as the baseline of incremental builds
+    if build_type == "database" and not kwargs["dryrun"]:
+        if kwargs["incremental"]:
+            projects = full_build
+        else:
+            projects = list_project_names(bgcflow_dir) or []
+        database_mtimes = {p: get_database_mtime(bgcflow_dir, p) for p in projects}
+
     if build_type == "report":
         snakefile = "workflow/Report"
     elif build_type == "database":
         snakefile = "workflow/Database"
 
-    subprocess.call(
+    returncode = subprocess.call(
         f"cd {bgcflow_dir.resolve()} && snakemake --use-conda -c {kwargs['cores']} --snakefile {snakefile} --keep-going {dryrun} --rerun-incomplete",
         shell=True,
     )
 
+    if build_type == "database" and returncode == 0 and not kwargs["dryrun"]:
+        built = [
+            p
+            for p, mtime in database_mtimes.items()
+            if get_database_mtime(bgcflow_dir, p) not in [None, mtime]
+        ]
+        run_for_projects(
+            record_database_state, bgcflow_dir, built, max_workers=kwargs["cores"]
+        )
+
 
-@click.argument("project-name", type=str)
+@click.argument("project-name", type=str, required=False)
+@click.option(
+    "--all",
+    "sync_all",
+    is_flag=True,
+    help="Sync the databases of every project in `config/config.yaml`, several at a time.",
+)
+@click.option(
+    "--if-exists",
+    type=click.Choice(["prompt", "overwrite", "skip"]),
+    default=None,
+    help="What to do if the database already exists in Metabase. Required with --all, which cannot prompt. (DEFAULT: prompt)",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=4,
+    help="Maximum number of projects synced at once with --all. (DEFAULT: 4)",
+)
+@click.option(
+    "--full-sync",
+    is_flag=True,
+    help="Sync every dbt model, not only those changed since the last sync.",
+)
 @click.option(
     "--bgcflow-dir",
     type=click.Path(exists=True, file_okay=False, dir_okay=True),
@@ -430,8 +902,197 @@ def build(build_type, **kwargs):
 def sync(project_name, **kwargs):
     """
     Upload and sync DuckDB database to Metabase.
+
+    bgcflow sync <PROJECT_NAME> syncs a single project.
+
+    bgcflow sync --all --if-exists [overwrite|skip] syncs every project concurrently.
     """
-    upload_and_sync_to_metabase(project_name, **kwargs)
+    sync_all = kwargs.pop("sync_all")
+    workers = kwargs.pop("workers")
+    if_exists = kwargs.pop("if_exists")
+    if not sync_all:
+        if project_name is None:
+            raise click.UsageError("Missing argument PROJECT_NAME, or use --all")
+        upload_and_sync_to_metabase(
+            project_name, if_exists=if_exists or "prompt", **kwargs
+        )
+        return
+
+    if project_name is not None:
+        raise click.UsageError("PROJECT_NAME cannot be used with --all")
+    if if_exists in [None, "prompt"]:
+        raise click.UsageError("--all requires --if-exists overwrite or skip")
+    for option in ["dbt_dir", "metabase_database"]:
+        if kwargs.pop(option) is not None:
+            raise click.UsageError(
+                f"--{option.replace('_', '-')} cannot be used with --all"
+            )
+    project_names = list_project_names(kwargs["bgcflow_dir"])
+    if not project_names:
+        raise click.UsageError(
+            "No projects found. Use --bgcflow-dir to set the right location."
+        )
+    results = sync_projects_to_metabase(
+        project_names, workers=workers, if_exists=if_exists, **kwargs
+    )
+    failed = [k for k, v in results.items() if v["status"] == "failed"]
+    if len(failed) > 0:
+        raise click.ClickException(
+            f"{len(failed)} of {len(project_names)} project(s) failed: {failed}"
+        )
+
+
+@main.command()
+@click.argument("export_format", type=click.Choice(["parquet"]))
+@click.argument("project")
+@click.option(
+    "--bgcflow_dir",
+    default=".",
+    help="Location of BGCFlow directory. (DEFAULT: Current working directory.)",
+)
+@click.option(
+    "--output",
+    default=None,
+    help="Output directory of the export. (DEFAULT: <project report>/parquet)",
+)
+@click.option(
+    "-c",
+    "--cores",
+    default=None,
+    type=int,
+    help="Maximum number of tables written at once. (DEFAULT: number of CPUs)",
+)
+@click.option(
+    "--full",
+    is_flag=True,
+    help="Export every table, not only those changed since the last export.",
+)
+def export(export_format, project, **kwargs):
+    """
+    Export the DuckDB database of a project.
+
+    bgcflow export parquet <PROJECT> writes every dbt model as zstd-compressed Parquet files,
+    partitioned by project and genus.
+    """
+    results = export_parquet(
+        kwargs["bgcflow_dir"],
+        project,
+        output_dir=kwargs["output"],
+        workers=kwargs["cores"],
+        full=kwargs["full"],
+    )
+    failed = [k for k, v in results.items() if v not in ["exported", "skipped"]]
+    exported = [k for k, v in results.items() if v == "exported"]
+    click.echo(
+        f"{len(exported)} table(s) exported, {len(results) - len(exported) - len(failed)} unchanged"
+    )
+    if len(failed) > 0:
+        raise click.ClickException(
+            f"{len(failed)} of {len(results)} table(s) failed: {failed}"
+        )
+
+
+@main.command()
+@click.argument("project")
+@click.argument("sql")
+@click.option(
+    "--bgcflow_dir",
+    default=".",
+    help="Location of BGCFlow directory. (DEFAULT: Current working directory.)",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["table", "csv", "json", "arrow"]),
+    default="table",
+    help="Output format. `json` writes one JSON object per line, `arrow` writes an Arrow IPC stream and requires pyarrow. (DEFAULT: table)",
+)
+@click.option(
+    "--output",
+    default=None,
+    help="Write the result to a file instead of the standard output.",
+)
+def query(project, sql, **kwargs):
+    """
+    Run a SQL query on the DuckDB database of a project.
+
+    bgcflow query <PROJECT> "SELECT * FROM genomes LIMIT 10" opens the database read-only and
+    streams the result, without starting a server.
+    """
+    binary = kwargs["output_format"] == "arrow"
+    if kwargs["output"] is not None and binary:
+        output = open(kwargs["output"], "wb")
+    elif kwargs["output"] is not None:
+        output = open(kwargs["output"], "w", newline="")
+    elif binary:
+        output = click.get_binary_stream("stdout")
+    else:
+        output = click.get_text_stream("stdout")
+    try:
+        query_database(
+            kwargs["bgcflow_dir"],
+            project,
+            sql,
+            output,
+            output_format=kwargs["output_format"],
+        )
+    except (duckdb.Error, ImportError) as e:
+        raise click.ClickException(str(e))
+    finally:
+        if kwargs["output"] is not None:
+            output.close()
+
+
+@main.command()
+@click.argument("sql", required=False)
+@click.option(
+    "--bgcflow_dir",
+    default=".",
+    help="Location of BGCFlow directory. (DEFAULT: Current working directory.)",
+)
+@click.option(
+    "--catalog",
+    "catalog_path",
+    default=None,
+    help="Location of the catalog database. (DEFAULT: data/processed/bgcflow_catalog.duckdb)",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["table", "csv", "json", "arrow"]),
+    default="table",
+    help="Output format of the SQL query. (DEFAULT: table)",
+)
+def catalog(sql, **kwargs):
+    """
+    Build a catalog of the DuckDB databases of every project.
+
+    bgcflow catalog creates or refreshes a catalog with a view per dbt model over all projects,
+    with a `project` column. Only the views of changed project databases are refreshed.
+
+    bgcflow catalog "SQL" refreshes the catalog and runs a SQL query across projects.
+    """
+    bgcflow_dir = kwargs["bgcflow_dir"]
+    projects = list_project_names(bgcflow_dir)
+    if not projects:
+        raise click.UsageError(
+            f"No projects found in {Path(bgcflow_dir) / 'config/config.yaml'}"
+        )
+    summary = refresh_catalog(bgcflow_dir, projects, kwargs["catalog_path"])
+    if sql is None:
+        for status in ["added", "updated", "removed", "unchanged"]:
+            if len(summary[status]) > 0:
+                click.echo(f"{status}: {', '.join(summary[status])}")
+        return
+    binary = kwargs["output_format"] == "arrow"
+    output = (
+        click.get_binary_stream("stdout") if binary else click.get_text_stream("stdout")
+    )
+    try:
+        with connect_catalog(bgcflow_dir, kwargs["catalog_path"]) as con:
+            write_result(con.execute(sql), output, kwargs["output_format"])
+    except (duckdb.Error, ImportError) as e:
+        raise click.ClickException(str(e))
 
 
 if __name__ == "__main__":
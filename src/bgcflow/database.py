@@ -0,0 +1,867 @@
+"""Incremental updates of the DuckDB databases built by the BGCFlow `Database` workflow."""
+import csv
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import duckdb
+
+from bgcflow.cache import file_hash, load_json_state, path_fingerprint, save_json_state
+
+log_format = "%(levelname)-8s %(asctime)s   %(message)s"
+date_format = "%d/%m %H:%M:%S"
+logging.basicConfig(format=log_format, datefmt=date_format, level=logging.DEBUG)
+
+# fingerprints of the genomes loaded into a project database, stored next to the database
+database_state_file = ".bgcflow_database.json"
+
+# fingerprints of the exported tables, stored in the export directory
+export_state_file = ".bgcflow_export.json"
+
+# the catalog of every project database, relative to the BGCFlow directory
+catalog_file = "data/processed/bgcflow_catalog.duckdb"
+
+# rows fetched at once when streaming query results
+query_batch_size = 10_000
+
+# rows per Parquet row group, the granularity of the min/max statistics used to skip data
+parquet_row_group_size = 100_000
+
+
+def get_project_database(bgcflow_dir, project_name):
+    """
+    Finds the dbt directory and the DuckDB database of a project.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        project_name (str): The name of the project.
+
+    Returns:
+        tuple: The report directory, the dbt directory and the DuckDB database path.
+    """
+    report_dir = Path(bgcflow_dir) / f"data/processed/{project_name}"
+    with open(report_dir / "metadata/dependency_versions.json", "r") as f:
+        antismash_version = json.load(f)["antismash"]
+    dbt_dir = report_dir / f"dbt/antiSMASH_{antismash_version}"
+    return report_dir, dbt_dir, dbt_dir / "dbt_bgcflow.duckdb"
+
+
+def read_dbt_manifest(dbt_dir):
+    """
+    Reads the manifest of the last dbt build of a project.
+
+    Args:
+        dbt_dir (Path): The dbt project directory.
+
+    Returns:
+        dict: The manifest, or None if it is missing or older than the model files.
+    """
+    manifest_path = dbt_dir / "target/manifest.json"
+    if not manifest_path.is_file():
+        return None
+    manifest_mtime = manifest_path.stat().st_mtime
+    for model_file in (dbt_dir / "models").rglob("*"):
+        if model_file.suffix in [".yml", ".yaml", ".sql"]:
+            if model_file.stat().st_mtime > manifest_mtime:
+                return None
+    return load_json_state(manifest_path)
+
+
+def find_dbt_loaders(manifest, csv_names):
+    """
+    Finds the dbt models that load the given result tables.
+
+    A result table is read by a source whose external location names the CSV file (e.g.
+    `meta: {external_location: "../../tables/df_{name}.csv"}`), or by a model whose SQL names it.
+    It is loaded by the models that read it, directly or through such a source. Model and table
+    names do not need to match.
+
+    Args:
+        manifest (dict): The dbt manifest of the project.
+        csv_names (list): The CSV paths relative to the report directory, e.g. `tables/df_seqfu_stats.csv`.
+
+    Returns:
+        tuple: The unique ids of the models loading each CSV table that is read by dbt, and the CSV
+            tables that are not.
+    """
+    source_locations = {}
+    for unique_id, source in manifest.get("sources", {}).items():
+        locations = [
+            source.get("meta", {}).get("external_location"),
+            source.get("source_meta", {}).get("external_location"),
+            source.get("config", {}).get("meta", {}).get("external_location"),
+            (source.get("external") or {}).get("location"),
+        ]
+        names = {k: source.get(k) for k in ["name", "identifier", "schema"]}
+        for location in filter(None, locations):
+            try:
+                location = location.format(**names)
+            except (KeyError, IndexError, ValueError):
+                pass
+            source_locations.setdefault(unique_id, []).append(location)
+
+    loaders = {}
+    uncovered = []
+    for csv_name in csv_names:
+        file_name = Path(csv_name).name
+        sources = {
+            unique_id
+            for unique_id, locations in source_locations.items()
+            if any(file_name in location for location in locations)
+        }
+        models = {
+            unique_id
+            for unique_id, node in manifest.get("nodes", {}).items()
+            if node.get("resource_type") == "model"
+            and (
+                file_name in (node.get("raw_code") or node.get("raw_sql") or "")
+                or not sources.isdisjoint(node.get("depends_on", {}).get("nodes", []))
+            )
+        }
+        if len(sources) > 0 or len(models) > 0:
+            loaders[csv_name] = sorted(models)
+        else:
+            uncovered.append(csv_name)
+    return loaders, uncovered
+
+
+def find_dbt_descendants(manifest, unique_ids):
+    """
+    Finds the dbt models built from the given nodes, directly or through other models.
+
+    Args:
+        manifest (dict): The dbt manifest of the project.
+        unique_ids (list): The unique ids of the dbt nodes.
+
+    Returns:
+        set: The unique ids of the downstream models.
+    """
+    nodes = manifest.get("nodes", {})
+    children = manifest.get("child_map")
+    if not children:
+        children = {}
+        for unique_id, node in nodes.items():
+            for parent in node.get("depends_on", {}).get("nodes", []):
+                children.setdefault(parent, []).append(unique_id)
+    descendants = set()
+    pending = list(unique_ids)
+    while len(pending) > 0:
+        for child in children.get(pending.pop(), []):
+            if (
+                child not in descendants
+                and nodes.get(child, {}).get("resource_type") == "model"
+            ):
+                descendants.add(child)
+                pending.append(child)
+    return descendants
+
+
+def get_genome_fingerprints(con, csv_path):
+    """
+    Fingerprints the rows of each genome in a result table.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): A DuckDB connection.
+        csv_path (str): The path to the CSV table.
+
+    Returns:
+        dict: The fingerprint of the rows of each genome, keyed by genome id, or None if the table
+            has no `genome_id` column.
+    """
+    columns = [
+        c[0]
+        for c in con.execute(
+            "DESCRIBE SELECT * FROM read_csv_auto(?)", [str(csv_path)]
+        ).fetchall()
+    ]
+    if "genome_id" not in columns:
+        return None
+    rows = con.execute(
+        """
+        SELECT genome_id::VARCHAR,
+            md5(string_agg(md5(t::VARCHAR), ',' ORDER BY md5(t::VARCHAR)))
+        FROM read_csv_auto(?) t
+        GROUP BY 1
+        """,
+        [str(csv_path)],
+    ).fetchall()
+    return dict(rows)
+
+
+def get_database_inputs(report_dir, dbt_dir, previous=None):
+    """
+    Fingerprints the inputs of a project database: the genomes of its result tables and its dbt models.
+
+    Args:
+        report_dir (Path): The report directory of the project.
+        dbt_dir (Path): The dbt project directory.
+        previous (dict, optional): The inputs of the last build. The genomes of tables whose file
+            hash did not change are taken from it instead of reading the table again.
+
+    Returns:
+        dict: The file hash and genome fingerprints of every CSV table, keyed by its path relative to
+            the report directory, and the fingerprint of the dbt models.
+    """
+    previous_tables = (previous or {}).get("tables", {})
+    tables = {}
+    with duckdb.connect() as con:
+        for csv_path in sorted((report_dir / "tables").glob("*.csv")):
+            csv_name = csv_path.relative_to(report_dir).as_posix()
+            current_hash = file_hash(csv_path)
+            table = previous_tables.get(csv_name)
+            if not isinstance(table, dict) or table.get("file_hash") != current_hash:
+                table = {
+                    "file_hash": current_hash,
+                    "genomes": get_genome_fingerprints(con, csv_path),
+                }
+            tables[csv_name] = table
+    return {"tables": tables, "models": path_fingerprint(dbt_dir / "models")}
+
+
+def get_database_mtime(bgcflow_dir, project_name):
+    """
+    Returns when the database of a project was last written.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        project_name (str): The name of the project.
+
+    Returns:
+        int: The modification time of the DuckDB database in nanoseconds, or None if the project has
+            no database.
+    """
+    try:
+        _, _, duckdb_path = get_project_database(bgcflow_dir, project_name)
+    except (OSError, KeyError, ValueError):
+        return None
+    if not duckdb_path.is_file():
+        return None
+    return duckdb_path.stat().st_mtime_ns
+
+
+def record_database_state(bgcflow_dir, project_name):
+    """
+    Records the inputs of a freshly built project database, as a baseline for incremental builds.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        project_name (str): The name of the project.
+
+    Returns:
+        Path: The state file, or None if the project has no database.
+    """
+    report_dir, dbt_dir, duckdb_path = get_project_database(bgcflow_dir, project_name)
+    if not duckdb_path.is_file():
+        return None
+    state = get_database_inputs(report_dir, dbt_dir)
+    state_path = dbt_dir / database_state_file
+    save_json_state(state_path, state)
+    logging.info(
+        f"Recorded {len(state['tables'])} table(s) of [{project_name}] for incremental builds"
+    )
+    return state_path
+
+
+def merge_genomes(con, table, columns, csv_path, genome_ids):
+    """
+    Replaces the rows of some genomes in a DuckDB table with their rows in a result table.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): A connection to the project database.
+        table (str): The DuckDB table.
+        columns (list): The columns of the DuckDB table, which are all in the result table.
+        csv_path (Path): The CSV result table.
+        genome_ids (list): The genomes to replace. Genomes missing from the result table are deleted.
+    """
+    con.execute("CREATE OR REPLACE TEMP TABLE bgcflow_genomes (genome_id VARCHAR)")
+    con.executemany(
+        "INSERT INTO bgcflow_genomes VALUES (?)",
+        [[genome_id] for genome_id in genome_ids],
+    )
+    con.execute(
+        f"""
+        DELETE FROM "{table}"
+        WHERE genome_id::VARCHAR IN (SELECT genome_id FROM bgcflow_genomes)
+        """
+    )
+    select = ", ".join(f'"{c}"' for c in columns)
+    con.execute(
+        f"""
+        INSERT INTO "{table}" BY NAME
+        SELECT {select} FROM read_csv_auto(?) t
+        WHERE genome_id::VARCHAR IN (SELECT genome_id FROM bgcflow_genomes)
+        """,
+        [str(csv_path)],
+    )
+
+
+def update_database(bgcflow_dir, project_name):
+    """
+    Updates a project database with the rows of the new, changed and removed genomes only.
+
+    The rows of each genome in the result tables are fingerprinted and compared with the last
+    build. The dbt models loading a changed table are found in the dbt manifest. A model built as a
+    plain copy of the table (a DuckDB table with `genome_id` whose columns are all in the CSV) is
+    updated in place: the rows of changed and removed genomes are deleted and the rows of new and
+    changed genomes are inserted, in one transaction. Views need no update. Other models loading
+    the table and the downstream models built as tables are rebuilt with `dbt build --select`.
+
+    A full build is needed if a table was added or removed, if a changed table has no `genome_id`
+    column or is not read by any dbt node, if the dbt models changed, or if dbt cannot run.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        project_name (str): The name of the project.
+
+    Returns:
+        dict: The changed `tables`, the number of `updated` and `removed` genomes of each merged
+            DuckDB table, and the dbt models rebuilt with `select`, or None if a full build is needed.
+    """
+    report_dir, dbt_dir, duckdb_path = get_project_database(bgcflow_dir, project_name)
+    state_path = dbt_dir / database_state_file
+    if not duckdb_path.is_file() or not state_path.is_file():
+        logging.info(f"No previous database build of [{project_name}] to update")
+        return None
+    state = load_json_state(state_path)
+    if not isinstance(state.get("tables"), dict) or state.get(
+        "models"
+    ) != path_fingerprint(dbt_dir / "models"):
+        logging.info(f"The dbt models of [{project_name}] changed")
+        return None
+    current = get_database_inputs(report_dir, dbt_dir, state)
+    if set(state["tables"]) != set(current["tables"]):
+        logging.info(f"Result tables of [{project_name}] were added or removed")
+        return None
+
+    changed = sorted(k for k, v in current["tables"].items() if state["tables"][k] != v)
+    if len(changed) == 0:
+        logging.info(f"The database of [{project_name}] is up to date")
+        return {"tables": [], "merged": {}, "select": []}
+    no_genomes = [
+        k
+        for k in changed
+        if current["tables"][k]["genomes"] is None
+        or not isinstance(state["tables"][k].get("genomes"), dict)
+    ]
+    if len(no_genomes) > 0:
+        logging.info(
+            f"Tables of [{project_name}] without genome_id changed: {', '.join(no_genomes)}"
+        )
+        return None
+
+    manifest = read_dbt_manifest(dbt_dir)
+    if manifest is None:
+        logging.info(f"No up-to-date dbt manifest of [{project_name}]")
+        return None
+    loaders, uncovered = find_dbt_loaders(manifest, changed)
+    if len(uncovered) > 0:
+        logging.info(
+            f"Tables of [{project_name}] not read by a dbt model changed: {', '.join(uncovered)}"
+        )
+        return None
+
+    nodes = manifest.get("nodes", {})
+    merged = {}
+    rebuild = set()
+    with duckdb.connect(str(duckdb_path)) as con:
+        relations = {
+            name: table_type
+            for name, table_type in con.execute(
+                "SELECT table_name, table_type FROM information_schema.tables WHERE table_schema = 'main'"
+            ).fetchall()
+        }
+        models = list_models(con)
+        con.execute("BEGIN TRANSACTION")
+        for csv_name in changed:
+            csv_path = report_dir / csv_name
+            previous = state["tables"][csv_name]["genomes"]
+            genomes = current["tables"][csv_name]["genomes"]
+            updated = [k for k, v in genomes.items() if previous.get(k) != v]
+            removed = [k for k in previous if k not in genomes]
+            csv_columns = {
+                c[0]
+                for c in con.execute(
+                    "DESCRIBE SELECT * FROM read_csv_auto(?)", [str(csv_path)]
+                ).fetchall()
+            }
+            for unique_id in loaders[csv_name]:
+                relation = nodes[unique_id].get("alias") or nodes[unique_id]["name"]
+                columns = models.get(relation, [])
+                if relations.get(relation) == "VIEW":
+                    continue
+                if (
+                    relations.get(relation) == "BASE TABLE"
+                    and "genome_id" in columns
+                    and set(columns) <= csv_columns
+                ):
+                    merge_genomes(con, relation, columns, csv_path, updated + removed)
+                    merged[relation] = {
+                        "updated": len(updated),
+                        "removed": len(removed),
+                    }
+                    logging.info(
+                        f"[{project_name}] {relation}: {len(updated)} genome(s) updated, {len(removed)} removed"
+                    )
+                else:
+                    rebuild.add(unique_id)
+            # downstream views read the updated tables, only tables are rebuilt
+            for unique_id in find_dbt_descendants(manifest, loaders[csv_name]):
+                relation = nodes[unique_id].get("alias") or nodes[unique_id]["name"]
+                if relations.get(relation) == "BASE TABLE":
+                    rebuild.add(unique_id)
+        con.execute("COMMIT")
+
+    select = sorted(nodes[unique_id]["name"] for unique_id in rebuild)
+    if len(select) > 0:
+        command = ["dbt", "build", "--select"] + select
+        if (dbt_dir / "profiles.yml").is_file():
+            command += ["--profiles-dir", str(dbt_dir)]
+        logging.debug(f'Running command: {" ".join(command)}')
+        try:
+            process = subprocess.run(
+                command, cwd=dbt_dir, capture_output=True, text=True
+            )
+        except FileNotFoundError:
+            logging.warning(f"dbt is not installed, unable to update [{project_name}]")
+            return None
+        if process.returncode != 0:
+            output = (process.stdout + process.stderr).strip().splitlines()
+            logging.error(
+                f"dbt build of [{project_name}] failed:\n" + "\n".join(output[-10:])
+            )
+            return None
+        logging.info(f"[{project_name}] rebuilt with dbt: {' '.join(select)}")
+
+    save_json_state(state_path, current)
+    return {"tables": changed, "merged": merged, "select": select}
+
+
+def list_models(con, database=None):
+    """
+    Lists the tables and views built by dbt in a project database.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): A connection to the project database.
+        database (str, optional): The name of an attached project database. Defaults to the
+            database of the connection.
+
+    Returns:
+        dict: The column names of each table and view, keyed by name.
+    """
+    models = {}
+    for table, column in con.execute(
+        """
+        SELECT table_name, column_name FROM information_schema.columns
+        WHERE table_schema = 'main' AND table_catalog = coalesce(?, current_database())
+        ORDER BY table_name, ordinal_position
+        """,
+        [database],
+    ).fetchall():
+        models.setdefault(table, []).append(column)
+    return models
+
+
+def get_table_fingerprint(con, table):
+    """
+    Fingerprints the content of a table or view.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): A connection to the project database.
+        table (str): The table name.
+
+    Returns:
+        str: The schema, row count and combined hash of all rows of the table.
+    """
+    schema = con.execute(f'DESCRIBE "{table}"').fetchall()
+    # a sum, unlike a xor, does not cancel out duplicate rows
+    rows, content = con.execute(
+        f'SELECT count(*), sum(hash(t)::HUGEINT) FROM "{table}" t'
+    ).fetchone()
+    return json.dumps([[list(c[:2]) for c in schema], rows, str(content)])
+
+
+def export_parquet(
+    bgcflow_dir, project_name, output_dir=None, workers=None, full=False
+):
+    """
+    Exports every table and view of a project database as zstd-compressed Parquet files.
+
+    Each model is written to `<output_dir>/<model>/project=<project>/[genus=<genus>/]*.parquet`,
+    partitioned by the project and by the genus if the model has a `genus` column, so that Spark,
+    Polars or DuckDB read the partitions with Hive partitioning. Rows are sorted by `genome_id`
+    when available, so that the min/max statistics of each row group allow predicate pushdown.
+    Models are exported in parallel, and models whose content did not change since the last export
+    are skipped. A model is written to a temporary directory that replaces its previous export
+    only once complete.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        project_name (str): The name of the project.
+        output_dir (str, optional): The export directory. Defaults to `<project report>/parquet`.
+        workers (int, optional): Maximum number of models written at once. Defaults to the number of CPUs.
+        full (bool, optional): Export every model, even if it did not change. Defaults to False.
+
+    Returns:
+        dict: The status of each model: "exported", "skipped" or the error message.
+
+    Raises:
+        AssertionError: If the project database does not exist.
+    """
+    report_dir, dbt_dir, duckdb_path = get_project_database(bgcflow_dir, project_name)
+    assert duckdb_path.is_file(), f"Error: {duckdb_path} does not exist"
+    output_dir = Path(output_dir or report_dir / "parquet")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if workers is None:
+        workers = os.cpu_count()
+    state_path = output_dir / export_state_file
+    state = {} if full else load_json_state(state_path)
+    exported = {}
+
+    def export_model(con, model, columns):
+        # every worker needs its own cursor on the shared connection
+        with con.cursor() as cursor:
+            fingerprint = get_table_fingerprint(cursor, model)
+            model_dir = output_dir / model
+            if state.get(model) == fingerprint and model_dir.is_dir():
+                return "skipped"
+            partitions = ["project"] + (["genus"] if "genus" in columns else [])
+            select = "*" if "project" in columns else f"*, '{project_name}' AS project"
+            order = "ORDER BY genome_id" if "genome_id" in columns else ""
+            # the previous export is only replaced once the new one is complete
+            staging_dir = Path(tempfile.mkdtemp(prefix=f".{model}.", dir=output_dir))
+            try:
+                cursor.execute(
+                    f"""
+                    COPY (SELECT {select} FROM "{model}" {order}) TO '{staging_dir}' (
+                        FORMAT PARQUET,
+                        COMPRESSION ZSTD,
+                        PARTITION_BY ({', '.join(partitions)}),
+                        ROW_GROUP_SIZE {parquet_row_group_size}
+                    )
+                    """
+                )
+                if model_dir.exists():
+                    previous_dir = staging_dir.with_name(f"{staging_dir.name}.old")
+                    model_dir.rename(previous_dir)
+                    staging_dir.rename(model_dir)
+                    shutil.rmtree(previous_dir)
+                else:
+                    staging_dir.rename(model_dir)
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            exported[model] = fingerprint
+            return "exported"
+
+    def run(con, model, columns):
+        try:
+            status = export_model(con, model, columns)
+        except Exception as e:
+            logging.error(f"[{project_name}] {model}: export failed: {e}")
+            return str(e)
+        logging.info(f"[{project_name}] {model}: {status}")
+        return status
+
+    with duckdb.connect(str(duckdb_path), read_only=True) as con:
+        models = list_models(con)
+        logging.info(
+            f"Exporting {len(models)} model(s) of [{project_name}] to {output_dir} with {workers} worker(s)..."
+        )
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            statuses = executor.map(lambda m: run(con, m, models[m]), models)
+            results = dict(zip(models, statuses))
+
+    # forget the models that no longer exist
+    state = {k: v for k, v in {**state, **exported}.items() if k in models}
+    save_json_state(state_path, state)
+    return results
+
+
+def query_database(
+    bgcflow_dir,
+    project_name,
+    sql,
+    output,
+    output_format="table",
+    batch_size=query_batch_size,
+):
+    """
+    Runs a SQL query on a project database opened read-only, streaming the result in batches.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        project_name (str): The name of the project.
+        sql (str): The SQL query.
+        output (file): The text output, or the binary output for the "arrow" format.
+        output_format (str, optional): "table", "csv", "json" (one JSON object per line) or "arrow"
+            (an Arrow IPC stream, requires pyarrow). Defaults to "table".
+        batch_size (int, optional): The number of rows fetched at once. Defaults to 10000.
+
+    Returns:
+        int: The number of rows written.
+
+    Raises:
+        AssertionError: If the project database does not exist.
+        ImportError: If the "arrow" format is used without pyarrow.
+    """
+    _, _, duckdb_path = get_project_database(bgcflow_dir, project_name)
+    assert duckdb_path.is_file(), f"Error: {duckdb_path} does not exist"
+    with duckdb.connect(str(duckdb_path), read_only=True) as con:
+        return write_result(con.execute(sql), output, output_format, batch_size)
+
+
+def write_result(result, output, output_format="table", batch_size=query_batch_size):
+    """
+    Writes the result of a DuckDB query in batches.
+
+    Args:
+        result (duckdb.DuckDBPyConnection): The connection holding the result of a query.
+        output (file): The text output, or the binary output for the "arrow" format.
+        output_format (str, optional): "table", "csv", "json" or "arrow". Defaults to "table".
+        batch_size (int, optional): The number of rows fetched at once. Defaults to 10000.
+
+    Returns:
+        int: The number of rows written.
+    """
+    if output_format == "arrow":
+        import pyarrow as pa
+
+        # to_arrow_reader replaces fetch_record_batch in recent DuckDB versions
+        to_reader = getattr(result, "to_arrow_reader", result.fetch_record_batch)
+        reader = to_reader(batch_size)
+        n_rows = 0
+        with pa.ipc.new_stream(output, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                n_rows += batch.num_rows
+        return n_rows
+
+    columns = [d[0] for d in result.description or []]
+    widths = None
+    n_rows = 0
+    if output_format == "csv":
+        writer = csv.writer(output)
+        writer.writerow(columns)
+    while True:
+        rows = result.fetchmany(batch_size)
+        if output_format == "csv":
+            writer.writerows(rows)
+        elif output_format == "json":
+            for row in rows:
+                output.write(json.dumps(dict(zip(columns, row)), default=str))
+                output.write("\n")
+        else:
+            # column widths are taken from the first batch
+            if widths is None:
+                widths = [len(c) for c in columns]
+                for row in rows:
+                    widths = [max(w, len(str(v))) for w, v in zip(widths, row)]
+                widths = [min(w, 50) for w in widths]
+                output.write(format_row(columns, widths))
+                output.write(format_row(["-" * w for w in widths], widths))
+            for row in rows:
+                output.write(format_row(row, widths))
+        n_rows += len(rows)
+        output.flush()
+        if len(rows) < batch_size:
+            return n_rows
+
+
+def format_row(values, widths):
+    """
+    Formats a row of a text table.
+
+    Args:
+        values (list): The values of the row.
+        widths (list): The width of each column. Longer values are truncated.
+
+    Returns:
+        str: The formatted row, ending with a newline.
+    """
+    cells = []
+    for value, width in zip(values, widths):
+        value = "NULL" if value is None else str(value).replace("\n", " ")
+        if len(value) > width:
+            value = value[: width - 1] + "…"
+        cells.append(value.ljust(width))
+    return " | ".join(cells).rstrip() + "\n"
+
+
+def get_file_fingerprint(path):
+    """
+    Fingerprints a DuckDB database file by its size and modification time, including its WAL file.
+
+    Args:
+        path (Path): The database file.
+
+    Returns:
+        str: The fingerprint.
+    """
+    stats = [p.stat() for p in [path, Path(f"{path}.wal")] if p.is_file()]
+    return ";".join(f"{s.st_size}:{s.st_mtime_ns}" for s in stats)
+
+
+def get_catalog_path(bgcflow_dir, catalog_path=None):
+    """
+    Returns the path of the catalog database.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        catalog_path (str, optional): A custom catalog path. Defaults to `data/processed/bgcflow_catalog.duckdb`.
+
+    Returns:
+        Path: The catalog path.
+    """
+    return Path(catalog_path or Path(bgcflow_dir) / catalog_file)
+
+
+def attach_projects(con, databases):
+    """
+    Attaches project databases read-only, named after the projects.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): A connection to the catalog.
+        databases (dict): The path of each project database, keyed by project name.
+    """
+    for project, path in sorted(databases.items()):
+        con.execute(f"ATTACH '{path}' AS \"{project}\" (READ_ONLY)")
+
+
+def connect_catalog(bgcflow_dir, catalog_path=None):
+    """
+    Opens the catalog read-only with every project database attached.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        catalog_path (str, optional): A custom catalog path.
+
+    Returns:
+        duckdb.DuckDBPyConnection: The connection.
+    """
+    catalog_path = get_catalog_path(bgcflow_dir, catalog_path)
+    assert catalog_path.is_file(), f"Error: {catalog_path} does not exist"
+    con = duckdb.connect(str(catalog_path), read_only=True)
+    attach_projects(
+        con, dict(con.execute("SELECT project, path FROM bgcflow_projects").fetchall())
+    )
+    return con
+
+
+def refresh_catalog(bgcflow_dir, projects, catalog_path=None):
+    """
+    Creates or refreshes the catalog of several project databases.
+
+    The catalog is a small DuckDB database that records the project databases and holds, for
+    every model, a view over the model of all projects with an added `project` column. No data
+    is copied: the project databases are attached read-only when the catalog is opened with
+    `connect_catalog`. Only the views of the models of new, changed or removed project databases
+    are recreated.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        projects (list): The names of the projects to include. Projects without a database are left out.
+        catalog_path (str, optional): A custom catalog path.
+
+    Returns:
+        dict: The projects by status ("added", "updated", "removed", "unchanged") and the
+            refreshed `views`.
+    """
+    catalog_path = get_catalog_path(bgcflow_dir, catalog_path)
+    catalog_path.parent.mkdir(parents=True, exist_ok=True)
+    databases = {}
+    for project in projects:
+        try:
+            _, _, duckdb_path = get_project_database(bgcflow_dir, project)
+        except FileNotFoundError:
+            continue
+        if duckdb_path.is_file():
+            databases[project] = duckdb_path.resolve()
+
+    summary = {"added": [], "updated": [], "removed": [], "unchanged": []}
+    with duckdb.connect(str(catalog_path)) as con:
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS bgcflow_projects (
+                project VARCHAR PRIMARY KEY,
+                path VARCHAR,
+                fingerprint VARCHAR,
+                models VARCHAR
+            )
+            """
+        )
+        previous = {
+            project: {
+                "path": path,
+                "fingerprint": fingerprint,
+                "models": json.loads(models),
+            }
+            for project, path, fingerprint, models in con.execute(
+                "SELECT * FROM bgcflow_projects"
+            ).fetchall()
+        }
+        current = {}
+        affected = set()
+        for project, duckdb_path in databases.items():
+            fingerprint = get_file_fingerprint(duckdb_path)
+            old = previous.get(project)
+            if (
+                old is not None
+                and old["path"] == str(duckdb_path)
+                and old["fingerprint"] == fingerprint
+            ):
+                current[project] = old
+                summary["unchanged"].append(project)
+                continue
+            attach_projects(con, {project: duckdb_path})
+            models = list_models(con, project)
+            con.execute(f'DETACH "{project}"')
+            current[project] = {
+                "path": str(duckdb_path),
+                "fingerprint": fingerprint,
+                "models": models,
+            }
+            summary["added" if old is None else "updated"].append(project)
+            affected |= set(models) | set(old["models"] if old else [])
+        for project, old in previous.items():
+            if project not in current:
+                summary["removed"].append(project)
+                affected |= set(old["models"])
+
+        attach_projects(con, {k: v["path"] for k, v in current.items()})
+        con.execute("BEGIN TRANSACTION")
+        con.execute("DELETE FROM bgcflow_projects")
+        con.executemany(
+            "INSERT INTO bgcflow_projects VALUES (?, ?, ?, ?)",
+            [
+                [k, v["path"], v["fingerprint"], json.dumps(v["models"])]
+                for k, v in current.items()
+            ],
+        )
+        for model in sorted(affected):
+            selects = []
+            for project, database in sorted(current.items()):
+                columns = database["models"].get(model)
+                if columns is None:
+                    continue
+                if "project" in columns:
+                    select = f"SELECT * REPLACE ('{project}' AS project)"
+                else:
+                    select = f"SELECT '{project}' AS project, *"
+                selects.append(f'{select} FROM "{project}".main."{model}"')
+            if len(selects) == 0:
+                con.execute(f'DROP VIEW IF EXISTS "{model}"')
+            else:
+                con.execute(
+                    f'CREATE OR REPLACE VIEW "{model}" AS {" UNION ALL BY NAME ".join(selects)}'
+                )
+        con.execute("COMMIT")
+
+    summary["views"] = sorted(affected)
+    logging.info(
+        f"Catalog {catalog_path}: {len(current)} project(s), {len(affected)} view(s) refreshed"
+    )
+    return summary
@@ -0,0 +1,520 @@
+"""Threaded static file server for BGCFlow reports."""
+import argparse
+import email.utils
+import json
+import logging
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+log_format = "%(levelname)-8s %(asctime)s   %(message)s"
+date_format = "%d/%m %H:%M:%S"
+logging.basicConfig(format=log_format, datefmt=date_format, level=logging.DEBUG)
+
+# pre-compressed siblings to look for, in order of preference
+precompressed_encodings = [("br", ".br"), ("gzip", ".gz")]
+
+range_pattern = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# maximum number of rows returned by one table request
+max_page_size = 1000
+
+# default memory limit in MB of the parsed tables cached by the table endpoint
+default_max_memory = 256
+
+
+class LRUCache(object):
+    """
+    A thread-safe LRU cache with a limit on the total size of its values.
+
+    Keys should include the version of what they cache (e.g. the modification time of a file), so
+    that stale values are never returned and are evicted once unused.
+
+    Args:
+        max_bytes (int): The maximum total size of the cached values.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Initializes an empty cache.
+
+        Args:
+            max_bytes (int): The maximum total size of the cached values.
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, load, sizeof=len):
+        """
+        Returns a cached value, loading it on a miss.
+
+        Values larger than the whole cache are returned without being cached.
+
+        Args:
+            key (hashable): The key of the value.
+            load (callable): Returns the value on a cache miss.
+            sizeof (callable, optional): Returns the size of a value in bytes. Defaults to `len`.
+
+        Returns:
+            object: The value.
+        """
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                return self.items[key][0]
+        value = load()
+        size = sizeof(value)
+        with self.lock:
+            if size <= self.max_bytes and key not in self.items:
+                self.items[key] = (value, size)
+                self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self.items.popitem(last=False)
+                self.size -= evicted_size
+        return value
+
+
+# parsed tables served by the table endpoint, keyed by path and modification time
+table_cache = LRUCache(default_max_memory * 1024 * 1024)
+
+
+def table_size(table):
+    """
+    Measures the memory used by a table loaded by `load_table`.
+
+    Args:
+        table (tuple): The DataFrame and its search index.
+
+    Returns:
+        int: The size in bytes.
+    """
+    df, search_index = table
+    return int(df.memory_usage(deep=True).sum() + search_index.memory_usage(deep=True))
+
+
+def load_table(path, cache=None):
+    """
+    Reads a CSV table and a lowercase search index of its rows, cached by modification time.
+
+    Args:
+        path (str or Path): The CSV file to read.
+        cache (LRUCache, optional): The cache to use. Defaults to the module `table_cache`.
+
+    Returns:
+        tuple: The table as a pandas DataFrame and a Series of tab-joined lowercase row values.
+    """
+    path = Path(path)
+    fs = path.stat()
+
+    def load():
+        df = pd.read_csv(path)
+        search_index = pd.Series("", index=df.index)
+        for column in df.columns:
+            search_index = search_index + "\t" + df[column].astype(str).str.lower()
+        return df, search_index
+
+    cache = table_cache if cache is None else cache
+    key = ("table", str(path), fs.st_mtime_ns, fs.st_size)
+    return cache.get(key, load, table_size)
+
+
+def query_table(
+    path,
+    start=0,
+    length=100,
+    sort=None,
+    order="asc",
+    search=None,
+    columns=None,
+    cache=None,
+):
+    """
+    Returns one page of a CSV table, optionally filtered and sorted.
+
+    Args:
+        path (str or Path): The CSV file to query.
+        start (int, optional): Index of the first row of the page. Defaults to 0.
+        length (int, optional): Number of rows in the page, at most `max_page_size`. Defaults to 100.
+        sort (str, optional): Column to sort by. Defaults to None (file order).
+        order (str, optional): "asc" or "desc". Defaults to "asc".
+        search (str, optional): Case-insensitive text that a row must contain. Defaults to None.
+        columns (list, optional): Columns to return. Defaults to None (all columns).
+        cache (LRUCache, optional): The cache of parsed tables. Defaults to the module `table_cache`.
+
+    Returns:
+        dict: The `columns` and `rows` of the page, the `total` number of rows and the number of
+            rows matching the search (`filtered`).
+
+    Raises:
+        ValueError: If a requested column does not exist.
+    """
+    df, search_index = load_table(path, cache)
+    if columns is None:
+        columns = list(df.columns)
+    unknown_columns = [c for c in columns + [sort] if c is not None and c not in df]
+    if len(unknown_columns) > 0:
+        raise ValueError(f"Unknown columns: {unknown_columns}")
+
+    view = df
+    if search:
+        view = view[search_index.str.contains(search.lower(), regex=False)]
+    if sort is not None:
+        view = view.sort_values(sort, ascending=order != "desc", kind="stable")
+
+    start = max(int(start), 0)
+    length = min(max(int(length), 0), max_page_size)
+    page = view.iloc[start : start + length].loc[:, columns]
+    page = page.astype(object).where(page.notna(), None)
+    return {
+        "columns": columns,
+        "rows": page.values.tolist(),
+        "total": len(df),
+        "filtered": len(view),
+        "start": start,
+    }
+
+
+class ReportRequestHandler(SimpleHTTPRequestHandler):
+    """
+    A static file handler with Range support, cache validation and pre-compressed files.
+
+    Compared to `http.server.SimpleHTTPRequestHandler`, the handler:
+        - answers single `Range: bytes=start-end` requests with `206 Partial Content`.
+        - sends `ETag` and `Last-Modified` headers and answers `If-None-Match` and
+          `If-Modified-Since` with `304 Not Modified`.
+        - serves `<file>.br` or `<file>.gz` if present and accepted by the client.
+        - keeps connections alive (HTTP/1.1) and sends file bodies with `sendfile`.
+        - serves pages of CSV tables as JSON at `api/table?path=<csv>&start=&length=&sort=&order=&search=&columns=`,
+          with `path` relative to the directory of the `api/table` URL.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "BGCFlowFileServer"
+
+    def __init__(self, *args, table_cache=None, **kwargs):
+        """
+        Initializes the handler for a request.
+
+        Args:
+            table_cache (LRUCache, optional): The cache of parsed tables. Defaults to the module `table_cache`.
+        """
+        self.table_cache = table_cache
+        super().__init__(*args, **kwargs)
+
+    def end_headers(self):
+        """
+        Adds CORS headers, so that reports served from another port can fetch files.
+        """
+        self.send_header("Access-Control-Allow-Origin", "*")
+        super().end_headers()
+
+    def do_GET(self):
+        """
+        Serves a GET request.
+        """
+        url_path = urlsplit(self.path).path
+        if url_path.endswith("/api/table"):
+            self.send_table(url_path[: -len("api/table")])
+            return
+        f, start, length = self.send_file_head()
+        if f is None:
+            return
+        try:
+            self.copy_range(f, start, length)
+        finally:
+            f.close()
+
+    def do_HEAD(self):
+        """
+        Serves a HEAD request.
+        """
+        f, _, _ = self.send_file_head()
+        if f is not None:
+            f.close()
+
+    def send_table(self, prefix="/"):
+        """
+        Sends one page of a CSV table below the served directory as JSON.
+
+        Args:
+            prefix (str, optional): The URL path the table path is relative to. Defaults to "/".
+        """
+        query = {k: v[-1] for k, v in parse_qs(urlsplit(self.path).query).items()}
+        if "path" not in query:
+            self.send_error(HTTPStatus.BAD_REQUEST, "Missing table path")
+            return
+        path = self.translate_path(prefix + query["path"].lstrip("/"))
+        if not os.path.isfile(path):
+            self.send_error(HTTPStatus.NOT_FOUND, "Table not found")
+            return
+        try:
+            page = query_table(
+                path,
+                start=query.get("start", 0),
+                length=query.get("length", 100),
+                sort=query.get("sort") or None,
+                order=query.get("order", "asc"),
+                search=query.get("search"),
+                columns=query["columns"].split(",") if query.get("columns") else None,
+                cache=self.table_cache,
+            )
+        except ValueError as e:
+            self.send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        body = json.dumps(page, default=str).encode("utf-8")
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file_head(self):
+        """
+        Sends the response code and headers for a file request.
+
+        Returns:
+            tuple: The opened file (or None if nothing more should be sent), the offset and the
+                number of bytes to send.
+        """
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            for index in ["index.html", "index.htm"]:
+                if os.path.isfile(os.path.join(path, index)):
+                    if not self.path.split("?", 1)[0].endswith("/"):
+                        self.send_response(HTTPStatus.MOVED_PERMANENTLY)
+                        parts = self.path.split("?", 1)
+                        parts[0] = parts[0] + "/"
+                        self.send_header("Location", "?".join(parts))
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return None, 0, 0
+                    path = os.path.join(path, index)
+                    break
+            else:
+                f = self.list_directory(path)
+                if f is not None:
+                    self.copyfile(f, self.wfile)
+                    f.close()
+                return None, 0, 0
+
+        if path.endswith("/") or not os.path.isfile(path):
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None, 0, 0
+
+        ctype = self.guess_type(path)
+        encoding, path = self.select_encoding(path)
+        try:
+            fs = os.stat(path)
+            f = self.open_file(path, fs)
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None, 0, 0
+
+        etag = (
+            f'"{fs.st_mtime_ns:x}-{fs.st_size:x}{"-" + encoding if encoding else ""}"'
+        )
+        last_modified = self.date_time_string(int(fs.st_mtime))
+        if self.is_not_modified(etag, fs.st_mtime):
+            f.close()
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            return None, 0, 0
+
+        start, length = 0, fs.st_size
+        byte_range = self.parse_range(fs.st_size, etag) if encoding is None else None
+        if byte_range == "unsatisfiable":
+            f.close()
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{fs.st_size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None, 0, 0
+        elif byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{fs.st_size}")
+        else:
+            self.send_response(HTTPStatus.OK)
+
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        if self.command == "HEAD":
+            f.close()
+            return None, 0, 0
+        return f, start, length
+
+    def open_file(self, path, fs):
+        """
+        Opens a file to send.
+
+        Args:
+            path (str): The path of the file.
+            fs (os.stat_result): The status of the file.
+
+        Returns:
+            file: A binary file object.
+        """
+        return open(path, "rb")
+
+    def select_encoding(self, path):
+        """
+        Picks a pre-compressed sibling of a file accepted by the client.
+
+        Args:
+            path (str): The path of the requested file.
+
+        Returns:
+            tuple: The content encoding (or None) and the path of the file to serve.
+        """
+        accepted = [
+            e.split(";")[0].strip()
+            for e in self.headers.get("Accept-Encoding", "").split(",")
+        ]
+        if self.headers.get("Range") is None:
+            for encoding, suffix in precompressed_encodings:
+                if encoding in accepted and os.path.isfile(path + suffix):
+                    return encoding, path + suffix
+        return None, path
+
+    def is_not_modified(self, etag, mtime):
+        """
+        Checks the conditional request headers against the current file version.
+
+        Args:
+            etag (str): The entity tag of the file.
+            mtime (float): The modification time of the file.
+
+        Returns:
+            bool: True if the client copy is still valid.
+        """
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            return "*" in tags or etag in tags
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return int(mtime) <= since.timestamp()
+        return False
+
+    def parse_range(self, size, etag):
+        """
+        Parses a single byte range from the `Range` header.
+
+        Multiple ranges and ranges not matching `If-Range` are ignored and served in full.
+
+        Args:
+            size (int): The file size.
+            etag (str): The entity tag of the file.
+
+        Returns:
+            tuple or str or None: The first and last byte to send, "unsatisfiable", or None to
+                send the whole file.
+        """
+        header = self.headers.get("Range")
+        if header is None:
+            return None
+        if_range = self.headers.get("If-Range")
+        if if_range is not None and if_range.strip() != etag:
+            return None
+        match = range_pattern.match(header.strip())
+        if match is None:
+            return None
+        first, last = match.groups()
+        if first == "" and last == "":
+            return None
+        if first == "":
+            # suffix range: the last N bytes
+            length = int(last)
+            if length == 0:
+                return "unsatisfiable"
+            return max(size - length, 0), size - 1
+        first = int(first)
+        last = size - 1 if last == "" else min(int(last), size - 1)
+        if first >= size or first > last:
+            return "unsatisfiable"
+        return first, last
+
+    def copy_range(self, f, start, length):
+        """
+        Sends `length` bytes of a file starting at `start`.
+
+        Args:
+            f (file): The opened file.
+            start (int): The offset of the first byte.
+            length (int): The number of bytes to send.
+        """
+        self.wfile.flush()
+        try:
+            self.connection.sendfile(f, start, length)
+        except (BrokenPipeError, ConnectionResetError):
+            logging.debug(f"Connection closed by client: {self.path}")
+
+
+def run_file_server(directory, port=8002, bind="", max_memory=default_max_memory):
+    """
+    Serves a directory with the threaded report file server until interrupted.
+
+    Args:
+        directory (str or pathlib.PosixPath): The directory to serve.
+        port (int, optional): The port to listen on. Defaults to 8002.
+        bind (str, optional): The address to bind to. Defaults to "" (all interfaces), like `http.server`.
+        max_memory (int, optional): The memory limit in MB of the tables cached by the table endpoint. Defaults to 256.
+    """
+    mimetypes.add_type("application/json", ".json")
+    handler = partial(
+        ReportRequestHandler,
+        directory=str(Path(directory).resolve()),
+        table_cache=LRUCache(max_memory * 1024 * 1024),
+    )
+    with ThreadingHTTPServer((bind, port), handler) as httpd:
+        httpd.daemon_threads = True
+        logging.info(f"Serving {directory} at http://{bind or '0.0.0.0'}:{port}")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def main():
+    """
+    Command line entry point, a drop-in for `python -m http.server --directory DIR PORT`.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("port", nargs="?", default=8002, type=int)
+    parser.add_argument("-d", "--directory", default=os.getcwd())
+    parser.add_argument("-b", "--bind", default="")
+    parser.add_argument("--max_memory", default=default_max_memory, type=int)
+    args = parser.parse_args()
+    run_file_server(args.directory, args.port, args.bind, args.max_memory)
+
+
+if __name__ == "__main__":
+    main()
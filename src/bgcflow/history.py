@@ -0,0 +1,754 @@
+"""Run history of a BGCFlow directory, read from the Snakemake metadata, and run estimates based on it."""
+import base64
+import contextlib
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+from bgcflow.cache import load_json_state, save_json_state
+from bgcflow.projects_util import format_bytes
+
+log_format = "%(levelname)-8s %(asctime)s   %(message)s"
+date_format = "%d/%m %H:%M:%S"
+logging.basicConfig(format=log_format, datefmt=date_format, level=logging.DEBUG)
+
+# values of the `rules` config blocks that select a rule
+selected_values = [True, "TRUE", "True", "true", "yes", 1]
+
+# sizes of job outputs measured during runs, so that temp() outputs keep a size once deleted
+output_sizes_file = ".snakemake/bgcflow_output_sizes.json"
+
+# seconds between two measurements of the new outputs of a run
+size_record_interval = 10
+
+
+def decode_record_path(metadata_dir, record):
+    """
+    Decodes the output path of a Snakemake metadata record.
+
+    Snakemake names records after the urlsafe base64 encoding of the output path, split into
+    directories prefixed with `@` when the encoding is longer than a file name can be.
+
+    Args:
+        metadata_dir (Path): The `.snakemake/metadata` directory.
+        record (Path): The record file.
+
+    Returns:
+        str: The output path, relative to the BGCFlow directory.
+    """
+    parts = record.relative_to(metadata_dir).parts
+    encoded = "".join(p.lstrip("@") for p in parts)
+    return base64.urlsafe_b64decode(encoded).decode()
+
+
+def read_history(bgcflow_dir):
+    """
+    Reads the jobs of previous runs from the Snakemake metadata.
+
+    Snakemake keeps one record per output file, so the records of the outputs of a job are
+    grouped by rule, job hash and start time.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+
+    Returns:
+        list: The finished jobs, with their rule, duration in seconds, outputs and inputs.
+    """
+    metadata_dir = Path(bgcflow_dir) / ".snakemake/metadata"
+    jobs = {}
+    if not metadata_dir.is_dir():
+        return []
+    for root, dirs, files in os.walk(metadata_dir):
+        for f in files:
+            record_path = Path(root) / f
+            try:
+                output = decode_record_path(metadata_dir, record_path)
+                with open(record_path, "r") as record_file:
+                    record = json.load(record_file)
+            except (ValueError, UnicodeDecodeError, OSError):
+                continue
+            start, end = record.get("starttime"), record.get("endtime")
+            if record.get("incomplete") or start is None or end is None:
+                continue
+            key = (record.get("rule"), record.get("job_hash"), start)
+            job = jobs.setdefault(
+                key,
+                {
+                    "rule": record.get("rule"),
+                    "duration": max(end - start, 0),
+                    "outputs": [],
+                    "inputs": set(),
+                },
+            )
+            job["outputs"].append(output)
+            job["inputs"].update(record.get("input") or [])
+    return list(jobs.values())
+
+
+def path_size(path):
+    """
+    Measures the disk usage of a file or a directory tree.
+
+    Args:
+        path (Path): The file or directory.
+
+    Returns:
+        int: The size in bytes, 0 if the path does not exist.
+    """
+    if path.is_file():
+        return path.stat().st_size
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            try:
+                size += (Path(root) / f).stat().st_size
+            except FileNotFoundError:
+                continue
+    return size
+
+
+def find_new_records(metadata_dir, seen):
+    """
+    Finds the Snakemake metadata records written since the last call.
+
+    Snakemake writes a record to a temporary file and renames it into place, so a new or rewritten
+    record has a new inode and changes the modification time of its directory. Only the directories
+    modified since the last call are listed, and records are compared by the inode returned by the
+    directory listing, without reading the status of every record.
+
+    Args:
+        metadata_dir (Path): The `.snakemake/metadata` directory.
+        seen (dict): The directories and records found by the previous calls, updated in place.
+
+    Returns:
+        list: The new or rewritten records.
+    """
+    new_records = []
+    pending = [str(metadata_dir)]
+    while len(pending) > 0:
+        directory = pending.pop()
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            continue
+        previous = seen.get(directory)
+        if previous is not None and previous["mtime"] == mtime:
+            pending.extend(previous["subdirs"])
+            continue
+        subdirs = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif seen.get(entry.path) != entry.inode():
+                    seen[entry.path] = entry.inode()
+                    new_records.append(Path(entry.path))
+        seen[directory] = {"mtime": mtime, "subdirs": subdirs}
+        pending.extend(subdirs)
+    return new_records
+
+
+def record_output_sizes(bgcflow_dir, records=None):
+    """
+    Measures the outputs of the given Snakemake metadata records, and stores their sizes.
+
+    Snakemake deletes `temp()` outputs once the jobs using them finished, so their size is only
+    known if they were measured in the meantime. Outputs that no longer exist keep their last
+    recorded size.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        records (list, optional): The record files to measure the outputs of. Defaults to every record.
+
+    Returns:
+        dict: The recorded size in bytes of every measured output, keyed by output path.
+    """
+    bgcflow_dir = Path(bgcflow_dir)
+    metadata_dir = bgcflow_dir / ".snakemake/metadata"
+    state_path = bgcflow_dir / output_sizes_file
+    sizes = load_json_state(state_path)
+    if records is None:
+        if not metadata_dir.is_dir():
+            return sizes
+        records = [
+            Path(root) / f for root, dirs, files in os.walk(metadata_dir) for f in files
+        ]
+    for record_path in records:
+        try:
+            output = decode_record_path(metadata_dir, record_path)
+        except (ValueError, UnicodeDecodeError):
+            # e.g. the temporary file of a record being written
+            continue
+        if (bgcflow_dir / output).exists():
+            sizes[output] = path_size(bgcflow_dir / output)
+    save_json_state(state_path, sizes)
+    return sizes
+
+
+@contextlib.contextmanager
+def recording_output_sizes(bgcflow_dir, interval=size_record_interval):
+    """
+    Records the sizes of the outputs of the jobs finishing while the context is active.
+
+    Every `interval` seconds, only the records written since the previous pass are looked up with
+    `find_new_records`, and only their outputs are measured.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        interval (int, optional): Seconds between two measurements. Defaults to 10.
+    """
+    metadata_dir = Path(bgcflow_dir) / ".snakemake/metadata"
+    stop = threading.Event()
+    # the records of previous runs are not measured again
+    seen = {}
+    find_new_records(metadata_dir, seen)
+
+    def scan():
+        try:
+            records = find_new_records(metadata_dir, seen)
+            if len(records) > 0:
+                record_output_sizes(bgcflow_dir, records)
+        except OSError as e:
+            logging.warning(f"Cannot record the sizes of the outputs: {e}")
+
+    def poll():
+        while not stop.wait(interval):
+            scan()
+
+    thread = threading.Thread(target=poll, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+        scan()
+
+
+def find_genome_id(path, genome_ids):
+    """
+    Finds the genome id in an output path, e.g. `GCF_000012345.1` in
+    `data/interim/prokka/GCF_000012345.1/GCF_000012345.1.gbk`.
+
+    Args:
+        path (str): The output path.
+        genome_ids (set): The known genome ids.
+
+    Returns:
+        str: The genome id, or None if the path belongs to no genome.
+    """
+    for part in reversed(Path(path).parts):
+        candidates = [part] + [part.rsplit(".", n)[0] for n in (1, 2)]
+        for candidate in candidates:
+            if candidate in genome_ids:
+                return candidate
+    return None
+
+
+def get_rule_statistics(bgcflow_dir, jobs, genome_ids, recorded_sizes=None):
+    """
+    Summarizes the history of every Snakemake rule.
+
+    A rule runs once per genome if most of its jobs wrote outputs named after a genome, and once
+    per project otherwise. The upstream rules are the rules which produced the inputs of its jobs.
+    Outputs that no longer exist are measured by their recorded size; a rule whose outputs are
+    mostly gone is considered to write `temp()` outputs.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        jobs (list): The jobs returned by `read_history`.
+        genome_ids (set): The known genome ids.
+        recorded_sizes (dict, optional): The sizes returned by `record_output_sizes`.
+
+    Returns:
+        dict: For each rule, the number of jobs, the mean duration in seconds and output size
+            in bytes of a job, whether it runs per genome, whether its outputs are `temporary`,
+            the size of its outputs still `on_disk`, whether its outputs were ever `measured`,
+            and its upstream rules.
+    """
+    bgcflow_dir = Path(bgcflow_dir)
+    recorded_sizes = recorded_sizes or {}
+    producers = {o: job["rule"] for job in jobs for o in job["outputs"]}
+    statistics = {}
+    for job in jobs:
+        rule = statistics.setdefault(
+            job["rule"],
+            {
+                "jobs": 0,
+                "duration": 0,
+                "size": 0,
+                "measured": 0,
+                "missing": 0,
+                "outputs": 0,
+                "on_disk": 0,
+                "per_genome": 0,
+                "upstream": set(),
+            },
+        )
+        rule["jobs"] += 1
+        rule["duration"] += job["duration"]
+        sizes = []
+        for output in job["outputs"]:
+            if (bgcflow_dir / output).exists():
+                sizes.append(path_size(bgcflow_dir / output))
+                rule["on_disk"] += sizes[-1]
+            else:
+                rule["missing"] += 1
+                if output in recorded_sizes:
+                    sizes.append(recorded_sizes[output])
+        rule["outputs"] += len(job["outputs"])
+        if len(sizes) > 0:
+            # outputs of the job that were never measured count as its measured mean
+            rule["size"] += sum(sizes) / len(sizes) * len(job["outputs"])
+            rule["measured"] += 1
+        if any(find_genome_id(o, genome_ids) for o in job["outputs"]):
+            rule["per_genome"] += 1
+        rule["upstream"].update(
+            producers[i]
+            for i in job["inputs"]
+            if i in producers and producers[i] != job["rule"]
+        )
+    for rule in statistics.values():
+        rule["duration"] = rule["duration"] / rule["jobs"]
+        rule["size"] = rule["size"] / max(rule["measured"], 1)
+        rule["measured"] = rule["measured"] > 0
+        rule["temporary"] = rule.pop("missing") > rule.pop("outputs") / 2
+        rule["per_genome"] = rule["per_genome"] > rule["jobs"] / 2
+        rule["upstream"] = sorted(rule["upstream"])
+    return statistics
+
+
+def is_selected(value):
+    """
+    Checks whether a value of a `rules` config block selects the rule.
+    """
+    return value in selected_values
+
+
+def get_project_plan(bgcflow_dir):
+    """
+    Reads the genomes and the selected rules of every project in the global config.
+
+    Projects are PEP files, whose `rules` block replaces the rules of the global config, or
+    legacy entries with a `samples` table.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+
+    Returns:
+        dict: For each project name, its genome ids and the names of its selected rules from
+            `workflow/rules.yaml`.
+    """
+    bgcflow_dir = Path(bgcflow_dir)
+    with open(bgcflow_dir / "config/config.yaml", "r") as f:
+        config = yaml.safe_load(f)
+    global_rules = config.get("rules", config.get("pipelines")) or {}
+    plan = {}
+    for project in config["projects"]:
+        name = project.get("name", project.get("pep"))
+        rules = project.get("rules") or global_rules
+        samples = project.get("samples")
+        if name.endswith((".yaml", ".yml")):
+            pep_path = bgcflow_dir / name
+            with open(pep_path, "r") as f:
+                pep = yaml.safe_load(f)
+            name = pep["name"]
+            rules = pep.get("rules") or rules
+            samples = pep_path.parent / pep.get("sample_table", "samples.csv")
+        elif samples is not None:
+            samples = bgcflow_dir / samples
+        genome_ids = []
+        if samples is not None and Path(samples).is_file():
+            genome_ids = pd.read_csv(samples, dtype=str)["genome_id"].tolist()
+        plan[name] = {
+            "genome_ids": genome_ids,
+            "rules": [r for r, value in rules.items() if is_selected(value)],
+        }
+    return plan
+
+
+def get_snakemake_rules(bgcflow_dir, rule_name):
+    """
+    Lists the Snakemake rules implementing a rule of `workflow/rules.yaml`.
+
+    The Snakemake rules are read from `workflow/rules/<rule_name>.smk`, with dashes in the name
+    also tried as underscores.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        rule_name (str): The rule name, e.g. `bigscape`.
+
+    Returns:
+        list: The Snakemake rule names, or the rule name itself if it has no rule file.
+    """
+    rule_dir = Path(bgcflow_dir) / "workflow/rules"
+    for stem in [rule_name, rule_name.replace("-", "_")]:
+        rule_file = rule_dir / f"{stem}.smk"
+        if rule_file.is_file():
+            return re.findall(r"^rule\s+(\w+)\s*:", rule_file.read_text(), re.M)
+    return [rule_name]
+
+
+def wildcard_pattern_regex(pattern):
+    """
+    Converts a Snakemake output pattern into a regular expression matching the files it produces.
+
+    Args:
+        pattern (str): The output pattern, e.g. `data/interim/prokka/{strains}/{strains}.gbk`.
+
+    Returns:
+        re.Pattern: The regular expression. A wildcard matches its own regular expression if it has
+            one, e.g. `{strains,[^/]+}`, and `.+` otherwise; a repeated wildcard matches the same value.
+    """
+    regex = ""
+    names = set()
+    end = 0
+    for match in re.finditer(
+        r"\{\s*(\w+)\s*(?:,\s*((?:[^{}]|\{[^{}]*\})+))?\}", pattern
+    ):
+        regex += re.escape(pattern[end : match.start()])
+        name = match.group(1)
+        if name in names:
+            regex += f"(?P={name})"
+        else:
+            regex += f"(?P<{name}>{match.group(2) or '.+'})"
+            names.add(name)
+        end = match.end()
+    return re.compile(regex + re.escape(pattern[end:]))
+
+
+def get_rule_output_patterns(bgcflow_dir):
+    """
+    Reads the output patterns of every Snakemake rule in `workflow/rules/*.smk`.
+
+    Only the quoted paths of the `output:` directive are read, so outputs computed by Python code
+    are not known.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+
+    Returns:
+        dict: The regular expressions of the outputs of each Snakemake rule, keyed by rule name.
+    """
+    patterns = {}
+    for rule_file in sorted((Path(bgcflow_dir) / "workflow/rules").glob("*.smk")):
+        text = rule_file.read_text()
+        for block in re.split(r"^(?=rule\s+\w+\s*:)", text, flags=re.M):
+            rule = re.match(r"rule\s+(\w+)\s*:", block)
+            if rule is None:
+                continue
+            # the directive ends at the next directive of the same indentation
+            output = re.search(
+                r"^([ \t]+)output\s*:(.*?)(?=^\1\w+\s*:|\Z)", block, re.M | re.S
+            )
+            if output is None:
+                continue
+            patterns[rule.group(1)] = [
+                wildcard_pattern_regex(path)
+                for path in re.findall(r"[\"']([^\"'\n]+)[\"']", output.group(2))
+            ]
+    return patterns
+
+
+def template_genome_output(path, genome_ids):
+    """
+    Replaces the genome id in an output path by `{genome_id}`.
+
+    The genome id is a whole path part or a part of it delimited by `.`, `_` or `-`, e.g.
+    `data/interim/prokka/{genome_id}/{genome_id}.gbk` or `data/interim/gtdb/{genome_id}_summary.json`.
+
+    Args:
+        path (str): The output path.
+        genome_ids (set): The known genome ids.
+
+    Returns:
+        str: The template, or None if the path names no genome, or several genomes like the outputs
+            of jobs aggregating genomes.
+    """
+    found = set()
+    for part in Path(path).parts:
+        delimiters = [i for i, c in enumerate(part) if c in "._-"]
+        starts = [0] + [i + 1 for i in delimiters]
+        ends = delimiters + [len(part)]
+        found.update(
+            part[start:end]
+            for start in starts
+            for end in ends
+            if end > start and part[start:end] in genome_ids
+        )
+    # e.g. `g1` within the longer genome id `g1_v2`
+    found = {g for g in found if not any(g != other and g in other for other in found)}
+    if len(found) != 1:
+        return None
+    genome_id = found.pop()
+    return re.sub(
+        rf"(?<![^/._-]){re.escape(genome_id)}(?![^/._-])",
+        lambda _: "{genome_id}",
+        path,
+    )
+
+
+def get_genome_targets(bgcflow_dir, genome_ids):
+    """
+    Lists the output files of the selected rules for some genomes only.
+
+    The output paths of every Snakemake rule of the selected rules are taken from the jobs it ran
+    for other genomes, with the genome id replaced. Paths inside the directory of a project, e.g.
+    `data/processed/<project>/...`, are only used for the genomes of that project. Passing them
+    as targets lets Snakemake build the DAG of these genomes instead of the DAG of every project.
+
+    Snakemake aborts on a target that no rule produces, so targets that match no output pattern
+    of the rules in `workflow/rules` are skipped with a warning, as are the outputs of jobs
+    aggregating several genomes.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        genome_ids (list): The genome ids.
+
+    Returns:
+        dict: The `targets` paths, the `skipped` paths that no rule produces, and the Snakemake
+            rules `without_history` which never ran, so their outputs are unknown.
+
+    Raises:
+        ValueError: If a genome is not in the samples of any project.
+    """
+    plan = get_project_plan(bgcflow_dir)
+    known_ids = {g for p in plan.values() for g in p["genome_ids"]}
+    unknown = [g for g in genome_ids if g not in known_ids]
+    if len(unknown) > 0:
+        raise ValueError(
+            f"Genomes not found in the samples of any project: {', '.join(unknown)}"
+        )
+
+    # templates are keyed by the project named in their path, None if they name no project
+    templates = {}
+    jobs = read_history(bgcflow_dir)
+    for job in jobs:
+        for output in job["outputs"]:
+            template = template_genome_output(output, known_ids)
+            if template is None:
+                continue
+            project = next((p for p in Path(template).parts if p in plan), None)
+            templates.setdefault((project, job["rule"]), set()).add(template)
+    output_patterns = [
+        p
+        for patterns in get_rule_output_patterns(bgcflow_dir).values()
+        for p in patterns
+    ]
+
+    # rules which only ran once per project have no outputs per genome
+    ran = {job["rule"] for job in jobs}
+    targets = set()
+    skipped = set()
+    without_history = set()
+    for project, project_plan in plan.items():
+        project_genomes = [g for g in genome_ids if g in project_plan["genome_ids"]]
+        if len(project_genomes) == 0:
+            continue
+        for rule_name in project_plan["rules"]:
+            for rule in get_snakemake_rules(bgcflow_dir, rule_name):
+                if rule not in ran:
+                    without_history.add(rule)
+                rule_templates = templates.get((None, rule), set()) | templates.get(
+                    (project, rule), set()
+                )
+                for target in {
+                    t.replace("{genome_id}", g)
+                    for t in rule_templates
+                    for g in project_genomes
+                }:
+                    if any(p.fullmatch(target) for p in output_patterns):
+                        targets.add(target)
+                    else:
+                        skipped.add(target)
+    if len(skipped) > 0:
+        logging.warning(
+            f"Skipping {len(skipped)} target(s) that no rule produces, e.g. {sorted(skipped)[0]}"
+        )
+    return {
+        "targets": sorted(targets),
+        "skipped": sorted(skipped),
+        "without_history": sorted(without_history),
+    }
+
+
+def estimate_run(bgcflow_dir, cores):
+    """
+    Predicts the runtime and disk use of a full rerun of every project, from the history of
+    previous runs.
+
+    Each Snakemake rule of the selected rules, and the rules upstream of them, runs once per
+    genome or once per project with the mean duration and output size of its previous jobs.
+    Outputs that already exist are counted as if they were made again. The runtime on `cores`
+    cores assumes one core per job and greedy scheduling: the work off the critical path is
+    shared by the cores, while the critical path runs one job after another. The peak disk use
+    counts every output, including the `temp()` outputs measured by `bgcflow run`, as Snakemake
+    may keep them all until the jobs using them finish.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        cores (int): The number of cores of the run.
+
+    Returns:
+        dict: The estimate, with the `rules` that have a history, the rules `without_history`,
+            the total `work` and predicted `runtime` in seconds, the peak `disk` use in bytes with
+            its `temporary_disk` share, the size of the outputs already `on_disk`, the rules
+            whose output size is `unmeasured` and the `critical_path`.
+    """
+    plan = get_project_plan(bgcflow_dir)
+    genome_ids = {g for p in plan.values() for g in p["genome_ids"]}
+    statistics = get_rule_statistics(
+        bgcflow_dir,
+        read_history(bgcflow_dir),
+        genome_ids,
+        load_json_state(Path(bgcflow_dir) / output_sizes_file),
+    )
+
+    rules = {}
+    without_history = set()
+    critical_path = []
+    for project, project_plan in plan.items():
+        pending = [
+            r
+            for rule_name in project_plan["rules"]
+            for r in get_snakemake_rules(bgcflow_dir, rule_name)
+        ]
+        selected = set()
+        while len(pending) > 0:
+            rule = pending.pop()
+            if rule in selected:
+                continue
+            selected.add(rule)
+            if rule not in statistics:
+                without_history.add(rule)
+                continue
+            pending.extend(statistics[rule]["upstream"])
+        selected = selected - without_history
+
+        for rule in selected:
+            jobs = (
+                len(project_plan["genome_ids"]) if statistics[rule]["per_genome"] else 1
+            )
+            estimate = rules.setdefault(
+                rule,
+                {
+                    "jobs": 0,
+                    "duration": statistics[rule]["duration"],
+                    "temporary": statistics[rule]["temporary"],
+                },
+            )
+            estimate["jobs"] += jobs
+            estimate["size"] = estimate["jobs"] * statistics[rule]["size"]
+
+        # the longest chain of rules, running one job of each rule
+        finish = {}
+
+        def longest_chain(rule):
+            if rule not in finish:
+                # a placeholder ends the recursion on cycles of rules
+                finish[rule] = (statistics[rule]["duration"], [rule])
+                upstream = [u for u in statistics[rule]["upstream"] if u in selected]
+                before = max(upstream, key=lambda u: longest_chain(u)[0], default=None)
+                length, chain = longest_chain(before) if before else (0, [])
+                finish[rule] = (length + statistics[rule]["duration"], chain + [rule])
+            return finish[rule]
+
+        paths = [longest_chain(r) for r in sorted(selected)]
+        path = max(paths, key=lambda p: p[0], default=(0, []))
+        if path[0] > sum(statistics[r]["duration"] for r in critical_path):
+            critical_path = path[1]
+
+    work = sum(r["jobs"] * r["duration"] for r in rules.values())
+    span = sum(statistics[r]["duration"] for r in critical_path)
+    return {
+        "cores": cores,
+        "rules": rules,
+        "without_history": sorted(without_history),
+        "work": work,
+        "runtime": (work - span) / max(cores, 1) + span,
+        "disk": sum(r["size"] for r in rules.values()),
+        "temporary_disk": sum(r["size"] for r in rules.values() if r["temporary"]),
+        "on_disk": sum(statistics[r]["on_disk"] for r in rules),
+        "free_disk": shutil.disk_usage(bgcflow_dir).free,
+        "unmeasured": sorted(r for r in rules if not statistics[r]["measured"]),
+        "critical_path": [(r, statistics[r]["duration"]) for r in critical_path],
+        "samples": {p: len(v["genome_ids"]) for p, v in plan.items()},
+    }
+
+
+def format_duration(seconds):
+    """
+    Formats a duration in seconds as hours, minutes and seconds.
+
+    Args:
+        seconds (float): The duration.
+
+    Returns:
+        str: The duration, e.g. `2h 05m 10s`.
+    """
+    seconds = math.ceil(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours > 0:
+        return f"{hours}h {minutes:02d}m {seconds:02d}s"
+    if minutes > 0:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+
+def print_estimate(estimate):
+    """
+    Prints the estimate of a run.
+
+    Args:
+        estimate (dict): The estimate returned by `estimate_run`.
+    """
+    print("Projects:")
+    for project, n_samples in estimate["samples"].items():
+        print(f" - {project}: {n_samples} genome(s)")
+    print("\nRules of a full rerun (jobs x mean duration, output size):")
+    for rule, r in sorted(
+        estimate["rules"].items(),
+        key=lambda item: -item[1]["jobs"] * item[1]["duration"],
+    ):
+        temporary = ", temporary" if r["temporary"] else ""
+        print(
+            f" - {rule}: {r['jobs']} x {format_duration(r['duration'])}, {format_bytes(int(r['size']))}{temporary}"
+        )
+    if len(estimate["without_history"]) > 0:
+        print(
+            "\nWARNING: No previous run of these rules, they are not part of the estimate:"
+        )
+        for rule in estimate["without_history"]:
+            print(f" - {rule}")
+    if len(estimate["unmeasured"]) > 0:
+        print(
+            "\nWARNING: The outputs of these rules were deleted before they were measured, "
+            "their size is not part of the estimate:"
+        )
+        for rule in estimate["unmeasured"]:
+            print(f" - {rule}")
+    print("\nCritical path:")
+    for rule, duration in estimate["critical_path"]:
+        print(f" - {rule}: {format_duration(duration)}")
+    print(f"\nTotal work: {format_duration(estimate['work'])} of single-core jobs")
+    print(
+        f"Predicted runtime of a full rerun with {estimate['cores']} cores: {format_duration(estimate['runtime'])}"
+    )
+    print(
+        f"Predicted peak disk use of a full rerun: {format_bytes(int(estimate['disk']))}, "
+        f"of which {format_bytes(int(estimate['temporary_disk']))} temporary "
+        f"(on disk: {format_bytes(estimate['on_disk'])}, free: {format_bytes(estimate['free_disk'])})"
+    )
+    print("Outputs that already exist are not made again, so a normal run needs less.")
+    # a rerun replaces the outputs already on disk
+    if estimate["disk"] - estimate["on_disk"] > estimate["free_disk"]:
+        print("WARNING: The outputs may not fit on the disk.")
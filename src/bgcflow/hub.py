@@ -0,0 +1,319 @@
+"""Single server hosting the reports of every BGCFlow project."""
+import html
+import io
+import logging
+import os
+import posixpath
+import threading
+import time
+from functools import partial
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from bgcflow.cache import path_fingerprint
+from bgcflow.fileserver import LRUCache, ReportRequestHandler
+from bgcflow.mkdocs import build_static_report, get_report_dir
+
+log_format = "%(levelname)-8s %(asctime)s   %(message)s"
+date_format = "%d/%m %H:%M:%S"
+logging.basicConfig(format=log_format, datefmt=date_format, level=logging.DEBUG)
+
+# site directories with theme files that are identical for every project report
+theme_asset_dirs = ["assets/javascripts", "assets/stylesheets", "assets/bgcflow"]
+
+# files above this size are always streamed from disk
+max_cached_file_size = 1024 * 1024
+
+# inputs of a report build, a site is only rebuilt after one of them changed
+build_input_dirs = ["metadata", "docs", "tables"]
+
+# seconds between two checks of the build inputs of a served site
+build_check_interval = 5
+
+
+class ReportHub(object):
+    """
+    The projects served by a report hub and their lazily built static sites.
+
+    Small site files and the tables parsed by the `api/table` endpoint share one LRU cache, so
+    `max_memory` bounds both.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        projects (list): The project names to serve.
+        base_url (str): The public URL of the hub, used for links to result files. An empty string
+            links result files by root-relative paths, which resolve against the host of each client.
+        max_memory (int): The maximum size in bytes of the in-memory file and table cache.
+        build_options (dict, optional): Additional keyword arguments of `build_static_report`.
+    """
+
+    def __init__(self, bgcflow_dir, projects, base_url, max_memory, build_options=None):
+        """
+        Initializes the hub without building any site.
+
+        Args:
+            bgcflow_dir (str): The path to the BGCFlow directory.
+            projects (list): The project names to serve.
+            base_url (str): The public URL of the hub, used for links to result files, or an empty
+                string for root-relative links.
+            max_memory (int): The maximum size in bytes of the in-memory file and table cache.
+            build_options (dict, optional): Additional keyword arguments of `build_static_report`.
+        """
+        self.bgcflow_dir = Path(bgcflow_dir)
+        self.projects = list(projects)
+        self.base_url = base_url.rstrip("/")
+        self.cache = LRUCache(max_memory)
+        self.build_options = dict(build_options or {})
+        self.sites = {}
+        self.signatures = {}
+        self.checked = {}
+        self.errors = {}
+        self.theme_dir = None
+        # one mkdocs build at a time keeps the memory use of the hub bounded
+        self.build_lock = threading.Lock()
+
+    def report_dir(self, project):
+        """
+        Finds the result directory of a project.
+
+        Args:
+            project (str): The project name.
+
+        Returns:
+            Path: The report directory, or None if the project has no results.
+        """
+        try:
+            return get_report_dir(self.bgcflow_dir, project)
+        except AssertionError:
+            return None
+
+    def build_signature(self, project):
+        """
+        Fingerprints the inputs of the report build of a project.
+
+        Args:
+            project (str): The project name.
+
+        Returns:
+            list: The fingerprints of the build input directories, or None if the project has no results.
+        """
+        report_dir = self.report_dir(project)
+        if report_dir is None:
+            return None
+        return [path_fingerprint(report_dir / d) for d in build_input_dirs]
+
+    def site_dir(self, project):
+        """
+        Returns the static site of a project, building it on first access.
+
+        The build inputs of a built site are checked at most every `build_check_interval` seconds
+        and the site is rebuilt incrementally once they changed. A failed build is not retried until
+        the inputs of the report change.
+
+        Args:
+            project (str): The project name.
+
+        Returns:
+            Path: The site directory, or None if the build failed.
+        """
+        if (
+            project in self.sites
+            and time.monotonic() - self.checked[project] < build_check_interval
+        ):
+            return self.sites[project]
+        signature = self.build_signature(project)
+        if project in self.sites and self.signatures[project] == signature:
+            self.checked[project] = time.monotonic()
+            return self.sites[project]
+        failed = self.errors.get(project)
+        if failed is not None and failed["signature"] == signature:
+            return None
+        with self.build_lock:
+            # another request may have rebuilt the site meanwhile
+            signature = self.build_signature(project)
+            if project in self.sites and self.signatures[project] == signature:
+                return self.sites[project]
+            logging.info(f"Building report of project [{project}]...")
+            try:
+                site_dir = build_static_report(
+                    self.bgcflow_dir,
+                    project,
+                    fileserver=f"{self.base_url}/_files/{project}",
+                    table_api=True,
+                    **self.build_options,
+                )
+            except Exception as e:
+                logging.error(f"Unable to build report of [{project}]: {e}")
+                self.sites.pop(project, None)
+                self.errors[project] = {
+                    "error": str(e),
+                    "signature": self.build_signature(project),
+                }
+                return None
+            self.errors.pop(project, None)
+            # executed notebooks are written to docs, so the inputs are taken after the build
+            self.signatures[project] = self.build_signature(project)
+            self.checked[project] = time.monotonic()
+            self.sites[project] = site_dir
+            if self.theme_dir is None:
+                self.theme_dir = site_dir
+        return site_dir
+
+    def index_html(self):
+        """
+        Renders the landing page listing all projects.
+
+        Returns:
+            bytes: The HTML page.
+        """
+        items = []
+        for project in self.projects:
+            name = html.escape(project)
+            if self.report_dir(project) is None:
+                status = "no results"
+            elif project in self.errors:
+                status = "build failed"
+            elif project in self.sites:
+                status = "built"
+            else:
+                status = "built on first visit"
+            items.append(f'<li><a href="/{name}/">{name}</a> ({status})</li>')
+        return (
+            "<!DOCTYPE html><html><head><meta charset='utf-8'><title>BGCFlow Reports</title></head>"
+            f"<body><h1>BGCFlow Reports</h1><ul>{''.join(items)}</ul></body></html>"
+        ).encode("utf-8")
+
+
+class HubRequestHandler(ReportRequestHandler):
+    """
+    Serves the reports of several projects from one server.
+
+    Routes:
+        - `/`: list of projects.
+        - `/<project>/...`: the static report site of a project, built on first access. Theme assets
+          are served from a single shared copy for every project.
+        - `/_files/<project>/...`: the result files of a project, including its `api/table` endpoint.
+    """
+
+    def __init__(self, *args, hub=None, **kwargs):
+        """
+        Initializes the handler for a request.
+
+        Args:
+            hub (ReportHub): The projects served by the hub.
+        """
+        self.hub = hub
+        super().__init__(*args, table_cache=hub.cache, **kwargs)
+
+    def do_GET(self):
+        """
+        Serves a GET request.
+        """
+        if urlsplit(self.path).path == "/":
+            body = self.hub.index_html()
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        super().do_GET()
+
+    def translate_path(self, path):
+        """
+        Maps a URL path to a site, theme or result file.
+
+        Args:
+            path (str): The URL path.
+
+        Returns:
+            str: The file system path, or an empty string for unknown routes.
+        """
+        url_path = posixpath.normpath(unquote(urlsplit(path).path))
+        parts = [p for p in url_path.split("/") if p not in ["", ".", ".."]]
+        if len(parts) == 0:
+            return ""
+        if parts[0] == "_files" and len(parts) > 1 and parts[1] in self.hub.projects:
+            base_dir = self.hub.report_dir(parts[1])
+            rest = parts[2:]
+        elif parts[0] in self.hub.projects:
+            base_dir = self.hub.site_dir(parts[0])
+            rest = parts[1:]
+            relative = "/".join(rest)
+            theme_dir = self.hub.theme_dir
+            if theme_dir is not None and any(
+                relative.startswith(d + "/") for d in theme_asset_dirs
+            ):
+                if (theme_dir / relative).is_file():
+                    base_dir = theme_dir
+        else:
+            return ""
+        if base_dir is None:
+            return ""
+        translated = os.path.join(str(base_dir), *rest)
+        if path.split("?", 1)[0].endswith("/"):
+            translated += "/"
+        return translated
+
+    def open_file(self, path, fs):
+        """
+        Opens a file, from the in-memory cache if it is a small report site file.
+
+        Args:
+            path (str): The path of the file.
+            fs (os.stat_result): The status of the file.
+
+        Returns:
+            file: A binary file object.
+        """
+        cache = self.hub.cache
+        if not urlsplit(self.path).path.startswith("/_files/") and fs.st_size <= min(
+            max_cached_file_size, cache.max_bytes
+        ):
+
+            def read():
+                with open(path, "rb") as f:
+                    return f.read()
+
+            content = cache.get(("file", path, fs.st_mtime_ns, fs.st_size), read)
+            return io.BytesIO(content)
+        return super().open_file(path, fs)
+
+
+def serve_report_hub(
+    bgcflow_dir, projects, port=8001, bind="", max_memory=256, build_options=None
+):
+    """
+    Serves the reports of several projects from a single server until interrupted.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        projects (list): The project names to serve.
+        port (int, optional): The port to listen on. Defaults to 8001.
+        bind (str, optional): The address to bind to. Defaults to "" (all interfaces).
+        max_memory (int, optional): The maximum size of the in-memory file and table cache in MB. Defaults to 256.
+        build_options (dict, optional): Additional keyword arguments of `build_static_report`, e.g. to
+            execute the report notebooks. Defaults to None.
+    """
+    # result files are linked by root-relative paths, so remote clients resolve them against the
+    # host they reached the hub at
+    hub = ReportHub(
+        bgcflow_dir,
+        projects,
+        "",
+        max_memory * 1024 * 1024,
+        build_options,
+    )
+    handler = partial(HubRequestHandler, hub=hub, directory=str(hub.bgcflow_dir))
+    local_url = f"http://localhost:{port}"
+    with ThreadingHTTPServer((bind, port), handler) as httpd:
+        httpd.daemon_threads = True
+        logging.info(f"Serving {len(projects)} project report(s) at {local_url}")
+        for project in projects:
+            logging.info(f" - {local_url}/{project}/")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
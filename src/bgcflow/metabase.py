@@ -1,9 +1,339 @@
+import hashlib
 import json
-import subprocess
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import click
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from bgcflow.cache import load_json_state, save_json_state
+
+# Metabase session tokens reused across calls and commands, keyed by host and username
+token_cache_path = Path.home() / ".cache/bgcflow/metabase_sessions.json"
+
+# fingerprints of the models last synced from a dbt project, per Metabase database
+sync_state_file = ".bgcflow_metabase_sync.json"
+
+# dbt models parsed by dbt-metabase, reused across syncs while the model files are unchanged
+dbt_models_cache = {}
+dbt_models_lock = threading.Lock()
+
+# model properties that dbt-metabase exports to Metabase
+synced_model_keys = [
+    "name",
+    "alias",
+    "schema",
+    "description",
+    "meta",
+    "tags",
+    "columns",
+]
+
+
+class MetabaseClient(object):
+    """
+    A Metabase API client with a pooled session, retries and a cached session token.
+
+    Connections are kept alive between calls, idempotent requests are retried with exponential
+    backoff on connection errors and 429/5xx responses, and the session token is stored in
+    `token_cache` (readable by the owner only) so that later calls and commands do not log in again.
+
+    Args:
+        host (str): The URL of the Metabase server.
+        username (str): The Metabase username.
+        password (str, optional): The Metabase password. Only needed if no valid token is cached.
+        password_prompt (callable, optional): Returns the password when it is needed and not given.
+        token_cache (str or Path, optional): The token cache file. Defaults to `~/.cache/bgcflow/metabase_sessions.json`.
+        retries (int, optional): The number of retries of failed requests. Defaults to 3.
+        backoff (float, optional): The backoff factor between retries in seconds. Defaults to 0.5.
+        timeout (float, optional): The timeout of a request in seconds. Defaults to 30.
+        pool_size (int, optional): The maximum number of pooled connections. Defaults to 10.
+    """
+
+    def __init__(
+        self,
+        host,
+        username,
+        password=None,
+        password_prompt=None,
+        token_cache=None,
+        retries=3,
+        backoff=0.5,
+        timeout=30,
+        pool_size=10,
+    ):
+        """
+        Initializes the client without contacting the server.
+
+        Args:
+            host (str): The URL of the Metabase server.
+            username (str): The Metabase username.
+            password (str, optional): The Metabase password. Only needed if no valid token is cached.
+            password_prompt (callable, optional): Returns the password when it is needed and not given.
+            token_cache (str or Path, optional): The token cache file. Defaults to `~/.cache/bgcflow/metabase_sessions.json`.
+            retries (int, optional): The number of retries of failed requests. Defaults to 3.
+            backoff (float, optional): The backoff factor between retries in seconds. Defaults to 0.5.
+            timeout (float, optional): The timeout of a request in seconds. Defaults to 30.
+            pool_size (int, optional): The maximum number of pooled connections. Defaults to 10.
+        """
+        self.host = host.rstrip("/")
+        self.username = username
+        self.password = password
+        self.password_prompt = password_prompt
+        self.token_cache = Path(token_cache or token_cache_path)
+        self.timeout = timeout
+        self.token = None
+        self.lock = threading.Lock()
+
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            max_retries=retry, pool_connections=1, pool_maxsize=pool_size
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def cache_key(self):
+        """
+        str: The key of the session token in the token cache.
+        """
+        return f"{self.host}|{self.username}"
+
+    def read_token_cache(self):
+        """
+        Reads the cached session tokens.
+
+        Returns:
+            dict: The tokens, keyed by host and username.
+        """
+        try:
+            with open(self.token_cache, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def write_token_cache(self, tokens):
+        """
+        Writes the session tokens to the cache, readable by the owner only.
+
+        Args:
+            tokens (dict): The tokens, keyed by host and username.
+        """
+        self.token_cache.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        tmp_path = self.token_cache.with_name(
+            f".{self.token_cache.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(tokens, f, indent=2)
+        os.replace(tmp_path, self.token_cache)
+
+    def login(self):
+        """
+        Returns a valid session token, from the cache if possible.
+
+        A cached token is validated with `/api/user/current`. Otherwise a new session is created with
+        the username and password, and stored in the cache.
+
+        Returns:
+            str: The session token.
+        """
+        with self.lock:
+            if self.token is not None:
+                return self.token
+            token = self.read_token_cache().get(self.cache_key)
+            if token is not None and self.is_valid(token):
+                click.echo(" - Reusing cached Metabase session")
+                self.token = token
+                return token
+
+            if self.password is None:
+                if self.password_prompt is None:
+                    raise ValueError("A Metabase password is required to log in")
+                self.password = self.password_prompt()
+            response = self.session.post(
+                f"{self.host}/api/session",
+                json={"username": self.username, "password": self.password},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            self.token = response.json()["id"]
+            tokens = self.read_token_cache()
+            tokens[self.cache_key] = self.token
+            self.write_token_cache(tokens)
+            click.echo(" - Logged in to Metabase")
+            return self.token
+
+    def is_valid(self, token):
+        """
+        Checks whether a session token is still accepted by the server.
+
+        Args:
+            token (str): The session token.
+
+        Returns:
+            bool: True if the token is valid.
+        """
+        response = self.session.get(
+            f"{self.host}/api/user/current",
+            headers={"X-Metabase-Session": token},
+            timeout=self.timeout,
+        )
+        return response.status_code == 200
+
+    def request(self, method, path, **kwargs):
+        """
+        Sends an authenticated API request, logging in again once if the session expired.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The API path, e.g. `/api/database`.
+            **kwargs: Additional arguments for `requests.Session.request`.
+
+        Returns:
+            requests.Response: The response.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(2):
+            token = self.login()
+            response = self.session.request(
+                method,
+                f"{self.host}{path}",
+                headers={"X-Metabase-Session": token},
+                **kwargs,
+            )
+            if response.status_code != 401 or attempt > 0:
+                return response
+            with self.lock:
+                if self.token == token:
+                    self.token = None
+                    tokens = self.read_token_cache()
+                    tokens.pop(self.cache_key, None)
+                    self.write_token_cache(tokens)
+
+    def get(self, path, **kwargs):
+        """
+        Sends an authenticated GET request.
+
+        Args:
+            path (str): The API path.
+            **kwargs: Additional arguments for `requests.Session.request`.
+
+        Returns:
+            requests.Response: The response.
+        """
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        """
+        Sends an authenticated POST request.
+
+        Args:
+            path (str): The API path.
+            **kwargs: Additional arguments for `requests.Session.request`.
+
+        Returns:
+            requests.Response: The response.
+        """
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        """
+        Sends an authenticated PUT request.
+
+        Args:
+            path (str): The API path.
+            **kwargs: Additional arguments for `requests.Session.request`.
+
+        Returns:
+            requests.Response: The response.
+        """
+        return self.request("PUT", path, **kwargs)
+
+    def list_databases(self):
+        """
+        Lists the databases registered in Metabase.
+
+        Returns:
+            list: The databases, as returned by `/api/database`.
+        """
+        response = self.get("/api/database")
+        response.raise_for_status()
+        databases = response.json()
+        if isinstance(databases, dict):
+            databases = databases.get("data", [])
+        return databases
+
+    def get_metadata(self, database_id):
+        """
+        Gets the tables and fields of a database as known by Metabase.
+
+        Args:
+            database_id (int): The Metabase database id.
+
+        Returns:
+            dict: The database metadata, as returned by `/api/database/:id/metadata`.
+        """
+        response = self.get(
+            f"/api/database/{database_id}/metadata", params={"include_hidden": True}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def sync_schema(self, database_id, table_ids=None):
+        """
+        Asks Metabase to rescan the schema of some tables, or of a whole database.
+
+        Args:
+            database_id (int): The Metabase database id.
+            table_ids (list, optional): The ids of the tables to rescan. If empty or None, the whole
+                database is rescanned, which is needed to discover new tables.
+        """
+        paths = [f"/api/table/{table_id}/sync_schema" for table_id in table_ids or []]
+        if len(paths) == 0:
+            paths = [f"/api/database/{database_id}/sync_schema"]
+        for path in paths:
+            self.post(path).raise_for_status()
+
+    def wait_for_schema(self, database_id, is_ready, timeout=120, delay=0.5):
+        """
+        Polls the metadata of a database with exponential backoff until it is ready.
+
+        Args:
+            database_id (int): The Metabase database id.
+            is_ready (callable): Returns True when given the metadata of a ready database.
+            timeout (float, optional): Seconds to wait for the database. Defaults to 120.
+            delay (float, optional): Seconds before the second poll, doubled after each poll up to
+                10 seconds. Defaults to 0.5.
+
+        Returns:
+            dict: The metadata of the ready database.
+
+        Raises:
+            TimeoutError: If the database is not ready in time.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            metadata = self.get_metadata(database_id)
+            if is_ready(metadata):
+                return metadata
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(
+                    f"Metabase did not sync the schema of database {database_id} in {timeout}s"
+                )
+            time.sleep(delay)
+            delay = min(delay * 2, 10)
 
 
 def upload_and_sync_to_metabase(
@@ -18,6 +348,10 @@ def upload_and_sync_to_metabase(
     metabase_http: bool = True,
     metabase_database: str = None,
     dbt_excludes: list = None,
+    if_exists: str = "prompt",
+    client: MetabaseClient = None,
+    databases: list = None,
+    full_sync: bool = False,
 ) -> str:
     """
     Uploads a DuckDB database file generated by dbt to Metabase and syncs the dbt models.
@@ -33,13 +367,19 @@ def upload_and_sync_to_metabase(
         dbt_database (str): The name of the dbt database to use.
         metabase_http (bool): Whether to use HTTP instead of HTTPS to connect to Metabase.
         metabase_database (str): The name of the Metabase database to use. If None, the project name is used.
+        dbt_excludes (list): The dbt models to exclude from the synchronization.
+        if_exists (str): What to do if the database already exists in Metabase: "prompt", "overwrite" or "skip".
+        client (MetabaseClient): An authenticated Metabase client to reuse. If None, a new client is created.
+        databases (list): The databases already listed from Metabase. If None, they are fetched.
+        full_sync (bool): Sync every model, not only those changed since the last sync.
 
     Returns:
-        str: The output of the dbt-metabase command as a string.
+        str: "synced" if the database was uploaded and its models synced, "skipped" if the upload
+            was skipped or cancelled, "failed" if Metabase rejected the upload.
 
     Raises:
         AssertionError: If the dbt_dir or bgcflow_dir do not exist or are not directories.
-        subprocess.CalledProcessError: If the dbt-metabase command fails.
+        RuntimeError: If some dbt models could not be exported to Metabase.
     """
     # available dbt models in bgcflow_dbt-duckdb v0.2.1
     dbt_model_dict = {
@@ -77,43 +417,144 @@ def upload_and_sync_to_metabase(
 
     elif isinstance(dbt_dir, str):
         click.echo(f" - Accessing dbt project directory in: {dbt_dir}")
-        click.echo(
-            f" - Using all models for sync: {', '.join(list(dbt_model_dict.values()))}"
-        )
+        all_models = [m for models in dbt_model_dict.values() for m in models]
+        click.echo(f" - Using all models for sync: {', '.join(all_models)}")
         dbt_dir = Path(dbt_dir)
 
-    # Get Metabase session token
+    if client is None:
+        client = get_metabase_client(metabase_host, mb_username, mb_password)
+    if databases is None:
+        databases = client.list_databases()
+
+    response, session_token = upload_dbt_to_metabase(
+        project_name, bgcflow_dir, dbt_dir, client, if_exists, databases
+    )
+    if response is None:
+        return "skipped"
+    elif response != 200:
+        return "failed"
+    if metabase_database is None:
+        metabase_database = project_name
+    # a new Metabase database has none of the previously synced models
+    if not any(db["name"] == metabase_database for db in databases):
+        full_sync = True
+    sync_dbt_models_to_metabase(
+        dbt_dir,
+        dbt_database,
+        metabase_host,
+        metabase_database,
+        client.username,
+        client.password,
+        dbt_schema,
+        metabase_http,
+        dbt_excludes,
+        metabase_session_id=session_token,
+        full_sync=full_sync,
+        client=client,
+    )
+    return "synced"
+
+
+def get_metabase_client(
+    metabase_host: str, mb_username: str = None, mb_password: str = None
+) -> MetabaseClient:
+    """
+    Creates a Metabase client, prompting for the username if needed.
+
+    The password is only prompted for if no valid session token is cached.
+
+    Args:
+        metabase_host (str): The URL of the Metabase server.
+        mb_username (str): The Metabase username. If None, the user will be prompted to enter their username.
+        mb_password (str): The Metabase password. If None, the user will be prompted to enter their password when needed.
+
+    Returns:
+        MetabaseClient: The client.
+    """
     if mb_username is None:
         mb_username = click.prompt("Enter your Metabase username")
-    if mb_password is None:
-        mb_password = click.prompt("Enter your Metabase password", hide_input=True)
+    return MetabaseClient(
+        metabase_host,
+        mb_username,
+        mb_password,
+        password_prompt=lambda: click.prompt(
+            "Enter your Metabase password", hide_input=True
+        ),
+    )
 
-    response, session_token = upload_dbt_to_metabase(
-        project_name, bgcflow_dir, dbt_dir, metabase_host, mb_username, mb_password
+
+def sync_projects_to_metabase(
+    project_names: list,
+    bgcflow_dir: str,
+    metabase_host: str,
+    mb_username: str,
+    mb_password: str,
+    workers: int = 4,
+    if_exists: str = "skip",
+    **kwargs,
+) -> dict:
+    """
+    Uploads and syncs the DuckDB databases of several projects to Metabase concurrently.
+
+    The client logs in and lists the Metabase databases once, then at most `workers` projects are
+    uploaded and synced at the same time.
+
+    Args:
+        project_names (list): The names of the projects to sync.
+        bgcflow_dir (str): The root directory of the BGCFlow project.
+        metabase_host (str): The URL of the Metabase server.
+        mb_username (str): The Metabase username. If None, the user will be prompted to enter their username.
+        mb_password (str): The Metabase password. If None, the user will be prompted to enter their password when needed.
+        workers (int): The maximum number of projects synced at once.
+        if_exists (str): What to do if a database already exists in Metabase: "overwrite" or "skip".
+        **kwargs: Additional arguments for `upload_and_sync_to_metabase`.
+
+    Returns:
+        dict: For each project, the `status` ("synced", "skipped" or "failed") and the `error` message.
+    """
+    assert if_exists in [
+        "overwrite",
+        "skip",
+    ], "Syncing several projects requires if_exists to be 'overwrite' or 'skip'"
+    client = get_metabase_client(metabase_host, mb_username, mb_password)
+    databases = client.list_databases()
+
+    def sync_project(project_name):
+        try:
+            status = upload_and_sync_to_metabase(
+                project_name,
+                bgcflow_dir,
+                None,
+                metabase_host,
+                client.username,
+                client.password,
+                if_exists=if_exists,
+                client=client,
+                databases=databases,
+                **kwargs,
+            )
+            return {"status": status, "error": None}
+        except Exception as e:
+            click.echo(f" - Error syncing '{project_name}': {e}", err=True)
+            return {"status": "failed", "error": str(e)}
+
+    click.echo(
+        f" - Syncing {len(project_names)} project(s) with {workers} worker(s)..."
     )
-    if response == 200:
-        if metabase_database is None:
-            metabase_database = project_name
-        sync_dbt_models_to_metabase(
-            dbt_dir,
-            dbt_database,
-            metabase_host,
-            metabase_database,
-            mb_username,
-            mb_password,
-            dbt_schema,
-            metabase_http,
-            dbt_excludes,
-        )
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        results = dict(zip(project_names, executor.map(sync_project, project_names)))
+    for project_name, result in results.items():
+        click.echo(f" - {project_name}: {result['status']}")
+    return results
 
 
 def upload_dbt_to_metabase(
     project_name: str,
     bgcflow_dir: str,
     dbt_dir: str,
-    metabase_host: str,
-    mb_username: str,
-    mb_password: str,
+    client: MetabaseClient,
+    if_exists: str = "prompt",
+    databases: list = None,
 ) -> str:
     """
     Uploads a DuckDB database file generated by dbt to Metabase.
@@ -122,12 +563,12 @@ def upload_dbt_to_metabase(
         project_name (str): The name of the project to upload to Metabase.
         bgcflow_dir (str): The path to the BGCflow directory.
         dbt_dir (str): The path to the dbt directory containing the DuckDB database file.
-        metabase_host (str): The URL of the Metabase server.
-        mb_username (str): The username to use for authentication with Metabase.
-        mb_password (str): The password to use for authentication with Metabase.
+        client (MetabaseClient): The authenticated Metabase client.
+        if_exists (str, optional): What to do if the database already exists: "prompt", "overwrite" or "skip". Defaults to "prompt".
+        databases (list, optional): The databases already listed from Metabase. If None, they are fetched.
 
     Returns:
-        str: The HTTP status code of the request.
+        tuple: The HTTP status code of the request, or None if the upload was skipped, and the session token.
 
     Raises:
         AssertionError: If the DuckDB database file does not exist or is not a regular file.
@@ -138,39 +579,34 @@ def upload_dbt_to_metabase(
         duckdb_path.is_file()
     ), f"Error: {duckdb_path} does not exist or is not a regular file"
 
-    session_response = requests.post(
-        f"{metabase_host}/api/session",
-        json={"username": mb_username, "password": mb_password},
-    )
-    session_token = session_response.json()["id"]
-
     # Check if database already exists
-    database_response = requests.get(
-        f"{metabase_host}/api/database", headers={"X-Metabase-Session": session_token}
-    )
-    databases = database_response.json()
+    if databases is None:
+        databases = client.list_databases()
     database_id = None
-    for k, v in databases.items():
-        if k == "data":
-            for db in v:
-                if db["name"] == project_name:
-                    database_id = db["id"]
-                    break
-
-    # Prompt user to continue or cancel upload
+    for db in databases:
+        if db["name"] == project_name:
+            database_id = db["id"]
+            break
+
+    # Apply the policy for existing databases
     if database_id is not None:
-        user_input = input(
-            f" - WARNING: A database with the name '{project_name}' already exists in Metabase. Do you want to continue with the upload? (y/n) "
-        )
-        if user_input.lower() != "y":
-            click.echo(" - Database upload cancelled by user")
-            return
+        if if_exists == "skip":
+            click.echo(
+                f" - Database '{project_name}' already exists in Metabase, skipping upload"
+            )
+            return None, client.token
+        elif if_exists == "prompt":
+            user_input = input(
+                f" - WARNING: A database with the name '{project_name}' already exists in Metabase. Do you want to continue with the upload? (y/n) "
+            )
+            if user_input.lower() != "y":
+                click.echo(" - Database upload cancelled by user")
+                return None, client.token
 
     # Upload or update database in Metabase
     if database_id is None:
-        database_response = requests.post(
-            f"{metabase_host}/api/database",
-            headers={"X-Metabase-Session": session_token},
+        database_response = client.post(
+            "/api/database",
             json={
                 "engine": "duckdb",
                 "name": project_name,
@@ -185,9 +621,8 @@ def upload_dbt_to_metabase(
             )
 
     else:
-        database_response = requests.put(
-            f"{metabase_host}/api/database/{database_id}",
-            headers={"X-Metabase-Session": session_token},
+        database_response = client.put(
+            f"/api/database/{database_id}",
             json={
                 "engine": "duckdb",
                 "name": project_name,
@@ -201,7 +636,7 @@ def upload_dbt_to_metabase(
                 f" - Error updating database '{project_name}': {database_response.text}"
             )
 
-    return database_response.status_code, session_token
+    return database_response.status_code, client.token
 
 
 def sync_dbt_models_to_metabase(
@@ -214,9 +649,19 @@ def sync_dbt_models_to_metabase(
     dbt_schema: str = "main",
     metabase_http: bool = True,
     dbt_excludes: list = None,
-) -> str:
+    metabase_session_id: str = None,
+    full_sync: bool = False,
+    client: MetabaseClient = None,
+    sync_timeout: int = None,
+) -> dict:
     """
-    Synchronizes dbt models to Metabase using the dbt-metabase package.
+    Synchronizes dbt models to Metabase in-process with the dbt-metabase package.
+
+    Only models whose fingerprint changed since the last sync to the same Metabase database are
+    synced, unless `full_sync` is set or the dbt project has no up-to-date `target/manifest.json`.
+    Metabase first rescans the tables of these models, then the models are exported one by one
+    over the session of `client`, reporting the time spent on each model. The parsed dbt project
+    is reused by later syncs of the same project.
 
     Args:
         dbt_dir (str): The path to the dbt project directory.
@@ -226,45 +671,264 @@ def sync_dbt_models_to_metabase(
         metabase_password (str): The password of the Metabase account to use.
         metabase_database (str): The name of the Metabase database to use.
         dbt_schema (str, optional): The name of the dbt schema to use. Defaults to "main".
-        metabase_http (bool, optional): Whether to use HTTP instead of HTTPS for the Metabase connection. Defaults to False.
+        metabase_http (bool, optional): Whether to use HTTP instead of HTTPS for the Metabase connection. Defaults to True.
+        dbt_excludes (list, optional): The dbt models to exclude from the synchronization.
+        metabase_session_id (str, optional): A valid Metabase session token, so that the client does not log in again.
+        full_sync (bool, optional): Sync every model, not only those changed since the last sync. Defaults to False.
+        client (MetabaseClient, optional): An authenticated Metabase client to reuse. If None, a new client is created.
+        sync_timeout (int, optional): Seconds to wait for Metabase to rescan the models. Defaults to 120.
 
     Returns:
-        str: The output of the dbt-metabase command as a string.
+        dict: The export time in seconds of each synced model.
+
+    Raises:
+        RuntimeError: If some models could not be exported. The other models are recorded as synced.
+        TimeoutError: If Metabase does not rescan the models in time.
     """
+    from dbtmetabase.metabase import MetabaseClient as DbtMetabaseClient
+
     click.echo(" - Synchronizing dbt models schema to Metabase...")
+    dbt_dir = Path(dbt_dir)
+    if dbt_excludes is None:
+        dbt_excludes = []
+    fingerprints = {
+        k: v
+        for k, v in get_dbt_model_fingerprints(dbt_dir).items()
+        if k not in dbt_excludes
+    }
+    state_path = dbt_dir / sync_state_file
+    state_key = f"{metabase_host.rstrip('/')}|{metabase_database}"
+    sync_state = load_json_state(state_path)
+    previous = sync_state.get(state_key, {})
+    dbt_includes = None
+    if len(fingerprints) > 0 and not full_sync:
+        dbt_includes = sorted(
+            k for k, v in fingerprints.items() if previous.get(k) != v
+        )
+        if len(dbt_includes) == 0:
+            click.echo(" - All dbt models are up to date in Metabase")
+            return {}
+        click.echo(
+            f" - Syncing {len(dbt_includes)} new or changed model(s): {', '.join(dbt_includes)}"
+        )
+
+    models, aliases = read_dbt_models(dbt_dir, dbt_database, dbt_schema)
+    excluded = {m.upper() for m in dbt_excludes}
+    included = None if dbt_includes is None else {m.upper() for m in dbt_includes}
+    models = [
+        m
+        for m in models
+        if aliases.get(m.name.upper(), m.name.upper()) not in excluded
+        and (
+            included is None or aliases.get(m.name.upper(), m.name.upper()) in included
+        )
+    ]
+
+    if client is None:
+        client = MetabaseClient(metabase_host, metabase_user, metabase_password)
+        client.token = metabase_session_id
     if metabase_http:
         click.echo(" - Connecting with HTTP method...")
-        metabase_http = "--metabase_http"
     else:
         click.echo(" - Connecting with HTTPS method...")
-        metabase_http = "--metabase_https"
-    command = [
-        "dbt-metabase",
-        "models",
-        "--dbt_path",
-        str(dbt_dir),
-        "--dbt_database",
-        dbt_database,
-        "--metabase_host",
-        metabase_host.split("://")[-1],
-        "--metabase_user",
-        metabase_user,
-        "--metabase_password",
-        metabase_password,
-        "--metabase_database",
-        metabase_database,
-        "--dbt_schema",
-        dbt_schema,
-        metabase_http,
+    # dbt-metabase uses the session token and the pooled connections of the client
+    exporter = DbtMetabaseClient(
+        host=client.host.split("://")[-1],
+        user=client.username,
+        password=None,
+        session_id=client.login(),
+        use_http=metabase_http,
+    )
+    exporter.session.mount(
+        exporter.base_url, client.session.get_adapter(exporter.base_url)
+    )
+
+    start = time.perf_counter()
+    database_ids = [
+        db["id"]
+        for db in client.list_databases()
+        if db["name"].upper() == metabase_database.upper()
     ]
-    if dbt_excludes and len(dbt_excludes) > 0:
-        command += ["--dbt_excludes", *dbt_excludes]
+    if len(database_ids) == 0:
+        raise RuntimeError(f"Cannot find database '{metabase_database}' in Metabase")
+    database_id = database_ids[0]
+    wait_for_metabase_models(client, database_id, models, sync_timeout)
+    exporter.metadata = exporter.build_metadata(database_id)
+    click.echo(
+        f" - Metabase schema of '{metabase_database}' is ready ({time.perf_counter() - start:.1f}s)"
+    )
+
+    timings = {}
+    failed = []
+    for i, model in enumerate(models, 1):
+        name = aliases.get(model.name.upper(), model.name.upper()).lower()
+        start = time.perf_counter()
+        success = exporter.export_model(model, aliases)
+        updates = list(exporter.metadata.pop_updates())
+        for update in updates:
+            exporter.api(
+                "put", f"/api/{update['kind']}/{update['id']}", json=update["body"]
+            )
+        timings[name] = time.perf_counter() - start
+        if success:
+            status = f"{len(updates)} update(s)"
+        else:
+            status = "failed"
+            failed.append(name)
+        click.echo(f" - [{i}/{len(models)}] {name}: {status} ({timings[name]:.2f}s)")
 
-    # Run the command and capture the output
-    result = subprocess.run(
-        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+    # remember what was synced, models removed from the dbt project are forgotten
+    synced = {
+        k: v
+        for k, v in fingerprints.items()
+        if k not in failed and (dbt_includes is None or k in dbt_includes)
+    }
+    sync_state[state_key] = {
+        k: v for k, v in {**previous, **synced}.items() if k in fingerprints
+    }
+    save_json_state(state_path, sync_state)
+    click.echo(
+        f" - Synced {len(models) - len(failed)} model(s) in {sum(timings.values()):.1f}s"
     )
+    if len(failed) > 0:
+        raise RuntimeError(f"Could not export dbt model(s): {', '.join(failed)}")
+    return timings
+
+
+def wait_for_metabase_models(
+    client: MetabaseClient, database_id: int, models: list, timeout: int = None
+) -> dict:
+    """
+    Rescans the tables of the dbt models in Metabase and waits until Metabase knows all their columns.
 
-    #  the output
-    click.echo(result.stdout)
-    click.echo(result.stderr)
+    Only the tables already known by Metabase are rescanned. The whole database is rescanned if
+    a table is missing, e.g. after the first upload of the database.
+
+    Args:
+        client (MetabaseClient): The authenticated Metabase client.
+        database_id (int): The Metabase database id.
+        models (list): The dbt-metabase models to sync.
+        timeout (int, optional): Seconds to wait for Metabase. Defaults to 120.
+
+    Returns:
+        dict: The metadata of the database once it is ready.
+
+    Raises:
+        TimeoutError: If Metabase does not know every model in time.
+    """
+    expected = {
+        f"{m.schema.upper()}.{m.name.upper()}": {c.name.upper() for c in m.columns}
+        for m in models
+    }
+
+    def find_tables(metadata):
+        return {
+            f"{(t.get('schema') or 'public').upper()}.{t['name'].upper()}": t
+            for t in metadata.get("tables", [])
+        }
+
+    def is_ready(metadata):
+        if metadata.get("initial_sync_status", "complete") != "complete":
+            return False
+        tables = find_tables(metadata)
+        for key, columns in expected.items():
+            fields = {f["name"].upper() for f in tables.get(key, {}).get("fields", [])}
+            if key not in tables or not columns <= fields:
+                return False
+        return True
+
+    tables = find_tables(client.get_metadata(database_id))
+    if all(key in tables for key in expected):
+        click.echo(f" - Rescanning {len(expected)} table(s) in Metabase...")
+        client.sync_schema(database_id, [tables[key]["id"] for key in expected])
+    else:
+        click.echo(" - Rescanning the database in Metabase...")
+        client.sync_schema(database_id)
+    return client.wait_for_schema(database_id, is_ready, timeout=timeout or 120)
+
+
+def read_dbt_models(dbt_dir: str, dbt_database: str, dbt_schema: str = "main"):
+    """
+    Parses the models of a dbt project with dbt-metabase, reusing the last parse if the model files did not change.
+
+    Args:
+        dbt_dir (str): The path to the dbt project directory.
+        dbt_database (str): The name of the dbt database to use.
+        dbt_schema (str, optional): The name of the dbt schema to use. Defaults to "main".
+
+    Returns:
+        tuple: The dbt-metabase models and the mapping of model aliases to model names.
+    """
+    from dbtmetabase.models.interface import DbtInterface
+
+    dbt_dir = Path(dbt_dir).resolve()
+    signature = [dbt_database, dbt_schema] + sorted(
+        [str(p), p.stat().st_mtime_ns] for p in (dbt_dir / "models").rglob("*.yml")
+    )
+    with dbt_models_lock:
+        cached = dbt_models_cache.get(str(dbt_dir))
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+    start = time.perf_counter()
+    dbt = DbtInterface(path=str(dbt_dir), database=dbt_database, schema=dbt_schema)
+    parsed = dbt.read_models()
+    click.echo(
+        f" - Parsed {len(parsed[0])} dbt model(s) in {dbt_dir} ({time.perf_counter() - start:.2f}s)"
+    )
+    with dbt_models_lock:
+        dbt_models_cache[str(dbt_dir)] = (signature, parsed)
+    return parsed
+
+
+def get_dbt_model_fingerprints(dbt_dir: str) -> dict:
+    """
+    Fingerprints the dbt models of a project from its `target/manifest.json` and `target/catalog.json`.
+
+    A fingerprint covers what dbt-metabase exports for a model: its name, description, meta and
+    tags, its columns with their documentation, the column types from the catalog and the
+    relationships tests used for foreign keys.
+
+    Args:
+        dbt_dir (str): The path to the dbt project directory.
+
+    Returns:
+        dict: The fingerprint of each model, keyed by model name. Empty if the manifest is missing or
+            older than the model files, so that every model is synced.
+    """
+    dbt_dir = Path(dbt_dir)
+    manifest_path = dbt_dir / "target/manifest.json"
+    if not manifest_path.is_file():
+        return {}
+    manifest_mtime = manifest_path.stat().st_mtime
+    for model_file in (dbt_dir / "models").rglob("*"):
+        if model_file.suffix in [".yml", ".yaml", ".sql"]:
+            if model_file.stat().st_mtime > manifest_mtime:
+                click.echo(f" - {manifest_path} is outdated, syncing every model")
+                return {}
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    catalog = load_json_state(dbt_dir / "target/catalog.json")
+
+    relationships = {}
+    for node in manifest.get("nodes", {}).values():
+        test = node.get("test_metadata") or {}
+        if node.get("resource_type") == "test" and test.get("name") == "relationships":
+            for model_id in node.get("depends_on", {}).get("nodes", []):
+                relationships.setdefault(model_id, []).append(
+                    [node.get("column_name"), test.get("kwargs", {})]
+                )
+
+    fingerprints = {}
+    for unique_id, node in manifest.get("nodes", {}).items():
+        if node.get("resource_type") != "model":
+            continue
+        model = {k: node.get(k) for k in synced_model_keys}
+        model["config_meta"] = node.get("config", {}).get("meta")
+        model["catalog"] = catalog.get("nodes", {}).get(unique_id, {}).get("columns")
+        model["relationships"] = sorted(
+            relationships.get(unique_id, []), key=lambda r: json.dumps(r)
+        )
+        fingerprints[node["name"]] = hashlib.sha256(
+            json.dumps(model, sort_keys=True, default=str).encode()
+        ).hexdigest()
+    return fingerprints
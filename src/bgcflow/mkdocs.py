@@ -1,19 +1,32 @@
+import copy
+import hashlib
 import json
 import logging
+import os
+import re
 import shutil
 import signal
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pandas as pd
 import yaml
 from jinja2 import Template
 
+from bgcflow.cache import file_hash, load_json_state, save_json_state
+from bgcflow.notebook import execute_report_notebooks
+from bgcflow.services import ServiceSupervisor
+
 log_format = "%(levelname)-8s %(asctime)s   %(message)s"
 date_format = "%d/%m %H:%M:%S"
 logging.basicConfig(format=log_format, datefmt=date_format, level=logging.DEBUG)
 
+# quoted CSV paths in a page, e.g. `read_csv_html("tables/df_gtdb_meta.csv", "genomes")`
+csv_reference = re.compile(r"[\"']([^\"'\n]+\.csv)[\"']")
+
 
 class Dict2Class(object):
     """
@@ -71,65 +84,102 @@ def load_project_metadata(path_to_metadata):
     return p
 
 
-def write_mkdocs_file(data_input, output_file, action):
+def write_mkdocs_file(data_input, output_file, action, state=None):
     """
-    Writes data to a file in either YAML or plain text format.
+    Writes data to a file in either YAML or plain text format, only if its content changed.
+
+    The rendered content is compared by hash with the existing file, so unchanged files are not
+    touched. The hash of every written file is recorded in `state`. An existing file that differs
+    from the recorded hash was edited by hand and is backed up to `<file>.bak` before it is replaced.
 
     Args:
         data_input (dict or str): The data to write to the file.
         output_file (str or Path): The path to the file to write.
         action (str): The action to perform. Either "yaml" to write the data in YAML format, or "write" to write the data as plain text.
+        state (dict, optional): Hashes of previously written files, keyed by path. Updated in place.
+
+    Returns:
+        bool: True if the file was written.
     """
-    if output_file.exists():
-        overwrite = input(
-            f"WARNING: {output_file} already exists. Do you want to overwrite it? (y/n) "
-        )
-        if overwrite.lower() != "y":
-            print("Skipping file write.")
-        else:
-            # continue with writing the file
-            with open(output_file, "w", encoding="utf-8") as f:
-                if action == "yaml":
-                    yaml.dump(data_input, f)
-                elif action == "write":
-                    f.write(data_input)
+    output_file = Path(output_file)
+    if state is None:
+        state = {}
+    if action == "yaml":
+        content = yaml.dump(data_input)
+    elif action == "write":
+        content = data_input
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    if output_file.is_file():
+        existing_hash = file_hash(output_file)
+        if existing_hash == content_hash:
+            logging.debug(f"Unchanged: {output_file}")
+            state[str(output_file)] = content_hash
+            return False
+        if state.get(str(output_file)) != existing_hash:
+            backup = output_file.with_name(f"{output_file.name}.bak")
+            logging.warning(
+                f"{output_file} was not generated by BGCFlow or was edited. Keeping a copy in: {backup}"
+            )
+            shutil.copy(output_file, backup)
+
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(content)
+    state[str(output_file)] = content_hash
+    logging.debug(f"Updated: {output_file}")
+    return True
+
+
+def get_report_dir(bgcflow_dir: str, project_name: str) -> Path:
+    """
+    Finds the result directory of a BGCFlow project.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory, or to the project result directory itself.
+        project_name (str): The name of the BGCFlow project.
+
+    Returns:
+        Path: The directory containing `metadata/project_metadata.json`.
+
+    Raises:
+        AssertionError: If the project results cannot be found.
+    """
+    # is it a bgcflow data directory or just a result directory?
+    input_dir = Path(bgcflow_dir)
+    if (input_dir / "metadata/project_metadata.json").is_file():
+        report_dir = input_dir
     else:
-        # continue with writing the file
-        with open(output_file, "w", encoding="utf-8") as f:
-            if action == "yaml":
-                yaml.dump(data_input, f)
-            elif action == "write":
-                f.write(data_input)
+        report_dir = input_dir / f"data/processed/{project_name}"
+        assert (
+            report_dir / "metadata/project_metadata.json"
+        ).is_file(), "Unable to find BGCFlow results"
+    return report_dir
 
 
-def generate_mkdocs_report(
+def prepare_mkdocs_report(
     bgcflow_dir: str,
     project_name: str,
-    port: int = 8001,
     fileserver: str = "http://localhost:8002",
     ipynb: bool = True,
-) -> None:
+    table_api: bool = False,
+) -> Path:
     """
-    Generates an MkDocs report for a BGCFlow project.
+    Generates the MkDocs config, homepage, macros and assets of a BGCFlow project report.
 
     Args:
         bgcflow_dir (str): The path to the BGCFlow project directory.
-        project_name (str: The name of the BGCFlow project.
-        port (int, optional): The port number to use for the MkDocs server, by default 8001.
+        project_name (str): The name of the BGCFlow project.
         fileserver (str, optional): The URL of the file server to use, by default "http://localhost:8002".
         ipynb (bool, optional): Whether to use IPython notebooks for the reports, by default True.
+        table_api (bool, optional): Whether the file server is the built-in one, whose `api/table`
+            endpoint serves large tables page by page, by default False.
+
+    Returns:
+        Path: The report directory containing `mkdocs.yml`.
     """
     logging.info("Checking input folder..")
-
-    # is it a bgcflow data directory or just a result directory?
-    input_dir = Path(bgcflow_dir)
-    if (input_dir / "metadata/project_metadata.json").is_file():
-        report_dir = input_dir
-    else:
-        report_dir = input_dir / f"data/processed/{project_name}"
-        assert (
-            report_dir / "metadata/project_metadata.json"
-        ).is_file(), "Unable to find BGCFlow results"
+    report_dir = get_report_dir(bgcflow_dir, project_name)
     logging.debug(f"Found project_metadata. Using [{report_dir}] as report directory.")
 
     # Get project metadata
@@ -162,13 +212,18 @@ def generate_mkdocs_report(
             report_category_containers[report_category] = []
         report_category_containers[report_category].append({r: jupyter_template.name})
 
+    mkdocs_config = copy.deepcopy(mkdocs_template)
     for k, v in report_category_containers.items():
-        mkdocs_template["nav"].append({k: v})
+        mkdocs_config["nav"].append({k: v})
+
+    # hashes of previously generated files
+    scaffold_state_path = report_dir / ".bgcflow_scaffold.json"
+    scaffold_state = load_json_state(scaffold_state_path)
 
     # write mkdocs template
     mkdocs_yml = report_dir / "mkdocs.yml"
     logging.info(f"Generating mkdocs config at: {mkdocs_yml}")
-    write_mkdocs_file(mkdocs_template, mkdocs_yml, "yaml")
+    write_mkdocs_file(mkdocs_config, mkdocs_yml, "yaml", scaffold_state)
 
     # Generate index.md
     docs_dir = report_dir / "docs"
@@ -191,14 +246,17 @@ def generate_mkdocs_report(
     }
     j2_template = Template(index_template)
 
-    write_mkdocs_file(j2_template.render(data), mkdocs_index, "write")
+    write_mkdocs_file(j2_template.render(data), mkdocs_index, "write", scaffold_state)
 
     # generate main.py macros
     mkdocs_py = report_dir / "main.py"
     logging.info(f"Generating python macros at: {mkdocs_py}")
     j2_template = Template(macros_template)
     write_mkdocs_file(
-        j2_template.render({"file_server": fileserver}), mkdocs_py, "write"
+        j2_template.render({"file_server": fileserver, "table_api": bool(table_api)}),
+        mkdocs_py,
+        "write",
+        scaffold_state,
     )
 
     # generate custom javascripts
@@ -210,17 +268,18 @@ def generate_mkdocs_report(
 
     # extend main html
     override_dir = report_dir / "overrides"
-    override_dir.mkdir(exist_ok=True, parents=True)
     logging.info(f"Extends main html: {override_dir / 'main.html'}")
-    with open(override_dir / "main.html", "w") as f:
-        f.write(main_html)
+    write_mkdocs_file(main_html, override_dir / "main.html", "write", scaffold_state)
 
     # generate assets
     asset_path = docs_dir / "assets/bgcflow"
-    asset_path.mkdir(exist_ok=True, parents=True)
     logging.info("Generating assets...")
-    logo_path = asset_path / "BGCFlow_logo.svg"
-    shutil.copy(Path(__file__).parent / "outputs/svg/BGCFlow_logo.svg", logo_path)
+    with open(Path(__file__).parent / "outputs/svg/BGCFlow_logo.svg", "r") as f:
+        write_mkdocs_file(
+            f.read(), asset_path / "BGCFlow_logo.svg", "write", scaffold_state
+        )
+    write_mkdocs_file(table_js, asset_path / "tables.js", "write", scaffold_state)
+    save_json_state(scaffold_state_path, scaffold_state)
 
     # generate symlink
     # for r in ['antismash', 'bigscape']:
@@ -232,59 +291,355 @@ def generate_mkdocs_report(
     #                if symlink_path.is_symlink():
     #                    symlink_path.unlink()
     #                symlink_path.symlink_to(target_path.resolve())
+    return report_dir
 
-    # Running fileserver
-    if fileserver == "http://localhost:8002":
-        fs = subprocess.Popen(
-            [
-                "python",
-                "-m",
-                "http.server",
-                "--directory",
-                report_dir,
-                fileserver.split(":")[-1],
-            ],
-            stderr=subprocess.DEVNULL,
-        )
-        fs_run_by_bgcflow = True
-        logging.info(f"Running http file-server. Job id: {fs.pid}")
-    else:
-        fs_run_by_bgcflow = False
-    # dumping file server location
-    with open("bgcflow_wrapper.log", "w") as f:
-        log_port = {"report_server": port, "file_server": fileserver}
-        if fs_run_by_bgcflow:
-            log_port["pid"] = fs.pid
-        json.dump(log_port, f, indent=2)
 
+def generate_mkdocs_report(
+    bgcflow_dir: str,
+    project_name: str,
+    port: int = 8001,
+    fileserver: str = "http://localhost:8002",
+    ipynb: bool = True,
+    execute: bool = False,
+    workers: int = None,
+    timeout: int = 600,
+    cache: bool = True,
+    detach: bool = False,
+) -> None:
+    """
+    Generates an MkDocs report for a BGCFlow project and serves it.
+
+    The file server and `mkdocs serve` run as supervised services. Servers already running for the
+    same report are reused, and busy ports are replaced by free ones.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow project directory.
+        project_name (str: The name of the BGCFlow project.
+        port (int, optional): The port number to use for the MkDocs server, by default 8001.
+        fileserver (str, optional): The URL of the file server to use, by default "http://localhost:8002".
+        ipynb (bool, optional): Whether to use IPython notebooks for the reports, by default True.
+        execute (bool, optional): Execute the report notebooks in parallel before serving, by default False.
+        workers (int, optional): Maximum number of notebooks executed at once, by default the number of CPUs.
+        timeout (int, optional): Per-notebook execution timeout in seconds, by default 600.
+        cache (bool, optional): Reuse cached executions of unchanged notebooks, by default True.
+        detach (bool, optional): Leave the servers running in the background and return, by default False.
+            Otherwise the servers started by this call are stopped on exit.
+    """
+    report_dir = get_report_dir(bgcflow_dir, project_name).resolve()
+    supervisor = ServiceSupervisor(bgcflow_dir)
+    started = []
+    signal.signal(signal.SIGTERM, signal_handler)
     try:
-        signal.signal(signal.SIGINT, signal_handler)
-        subprocess.call(
-            f"(cd {str(report_dir)} && mkdocs serve -a localhost:{port})", shell=True
+        # Running fileserver, or reusing the one already serving this report
+        table_api = fileserver == "http://localhost:8002"
+        if table_api:
+            fs = supervisor.start(
+                f"file_server:{project_name}",
+                [
+                    sys.executable,
+                    "-m",
+                    "bgcflow.fileserver",
+                    "--directory",
+                    report_dir,
+                    "{port}",
+                ],
+                port=int(fileserver.split(":")[-1]),
+                key=str(report_dir),
+            )
+            fileserver = fs["url"]
+            if fs["started"]:
+                started.append(fs["name"])
+
+        prepare_mkdocs_report(bgcflow_dir, project_name, fileserver, ipynb, table_api)
+        if execute:
+            execute_report_notebooks(
+                report_dir, workers=workers, timeout=timeout, cache=cache
+            )
+
+        # mkdocs serve reloads the scaffolding, so a running server can be reused
+        report = supervisor.start(
+            f"report:{project_name}",
+            ["mkdocs", "serve", "-a", "localhost:{port}"],
+            port=port,
+            cwd=report_dir,
+            key=f"{report_dir}|{fileserver}",
+            timeout=600,
         )
-        if fs_run_by_bgcflow:
-            fs.kill()
-        # asset_path.rmdir()
-    except subprocess.CalledProcessError:
-        if fs_run_by_bgcflow:
-            fs.kill()
-        # asset_path.rmdir()
+        if report["started"]:
+            started.append(report["name"])
+        logging.info(f"Report of [{project_name}] available at: {report['url']}")
+        if detach:
+            logging.info("Use `bgcflow serve --shutdown` to stop the servers.")
+            return
+        supervisor.wait([report["name"]])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if not detach:
+            for name in reversed(started):
+                supervisor.stop(name)
+            print("\nThank you for using BGCFlow Report!")
     return
 
 
+def get_report_inputs(report_dir):
+    """
+    Hashes the inputs of an MkDocs report.
+
+    Global inputs (mkdocs config, macros, theme overrides and project metadata) affect every
+    page, while page inputs (markdown and notebooks in `docs`, and the tables a page reads) affect
+    a single page.
+
+    Args:
+        report_dir (Path): The report directory containing `mkdocs.yml`.
+
+    Returns:
+        tuple: Two dictionaries mapping relative paths to content hashes, for global and page inputs.
+    """
+    global_inputs = [report_dir / "mkdocs.yml", report_dir / "main.py"]
+    global_inputs += sorted((report_dir / "overrides").rglob("*"))
+    global_inputs += sorted((report_dir / "metadata").glob("*.json"))
+    global_hashes = {
+        str(f.relative_to(report_dir)): file_hash(f)
+        for f in global_inputs
+        if f.is_file()
+    }
+    page_hashes = {
+        str(f.relative_to(report_dir)): get_page_hash(f, report_dir)
+        for f in sorted((report_dir / "docs").rglob("*"))
+        if f.suffix in [".md", ".ipynb"] and f.is_file()
+    }
+    return global_hashes, page_hashes
+
+
+def get_page_hash(page, report_dir):
+    """
+    Hashes a report page together with the tables its macros read at build time.
+
+    Markdown pages render tables with macros such as `read_csv_html("tables/df_gtdb_meta.csv", ...)`,
+    which run in the report directory, so every quoted CSV path that exists relative to it is part
+    of the page input. Notebooks are rendered from their stored outputs and only depend on their own
+    content.
+
+    Args:
+        page (Path): The markdown or notebook page.
+        report_dir (Path): The report directory containing `mkdocs.yml`.
+
+    Returns:
+        str: The content hash of the page, combined with the hashes of the tables it references.
+    """
+    page_hash = file_hash(page)
+    if page.suffix != ".md":
+        return page_hash
+    tables = sorted(
+        {
+            table
+            for table in csv_reference.findall(page.read_text(encoding="utf-8"))
+            if (report_dir / table).is_file()
+        }
+    )
+    if len(tables) == 0:
+        return page_hash
+    h = hashlib.sha256(page_hash.encode("utf-8"))
+    for table in tables:
+        h.update(f"{table}:{file_hash(report_dir / table)}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def get_page_output(page, site_dir):
+    """
+    Finds the HTML file MkDocs builds from a page, assuming `use_directory_urls`.
+
+    Args:
+        page (str): The page path relative to the report directory, e.g. `docs/antismash.md`.
+        site_dir (Path): The site output directory.
+
+    Returns:
+        Path: The HTML file of the page.
+    """
+    page = Path(page).relative_to("docs")
+    if page.stem in ["index", "README"]:
+        return site_dir / page.parent / "index.html"
+    return site_dir / page.parent / page.stem / "index.html"
+
+
+def merge_search_index(site_dir, previous_index, pages):
+    """
+    Restores the search entries of the pages skipped by `mkdocs build --dirty`.
+
+    A dirty build only indexes the rebuilt pages, so the entries of the other pages are taken from
+    the index of the previous build.
+
+    Args:
+        site_dir (Path): The site output directory.
+        previous_index (dict): The search index before the dirty build.
+        pages (list): The pages of the report, relative to the report directory.
+    """
+    index_path = site_dir / "search/search_index.json"
+    index = load_json_state(index_path)
+    if len(index) == 0 or len(previous_index) == 0:
+        return
+    urls = set()
+    for page in pages:
+        url = get_page_output(page, site_dir).parent.relative_to(site_dir).as_posix()
+        urls.add("" if url == "." else f"{url}/")
+    rebuilt = {d["location"].split("#")[0] for d in index.get("docs", [])}
+    index["docs"] = index.get("docs", []) + [
+        d
+        for d in previous_index.get("docs", [])
+        if d["location"].split("#")[0] in urls - rebuilt
+    ]
+    save_json_state(index_path, index)
+
+
+def build_static_report(
+    bgcflow_dir: str,
+    project_name: str,
+    fileserver: str = "http://localhost:8002",
+    site_dir: str = None,
+    ipynb: bool = False,
+    full: bool = False,
+    execute: bool = False,
+    workers: int = None,
+    timeout: int = 600,
+    cache: bool = True,
+    table_api: bool = False,
+) -> Path:
+    """
+    Builds a deployable static MkDocs site of a BGCFlow project report.
+
+    Inputs are tracked by content hash in `.bgcflow_build.json`. A change in global inputs or in
+    the set of pages rebuilds the whole site, otherwise only pages whose markdown or notebook
+    changed are rebuilt with `mkdocs build --dirty`, and the search entries of the other pages
+    are kept from the previous build.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow project directory.
+        project_name (str): The name of the BGCFlow project.
+        fileserver (str, optional): The URL of the file server linked from the report, by default "http://localhost:8002".
+        site_dir (str, optional): The output directory of the site, by default `site` in the report directory.
+        ipynb (bool, optional): Whether to use IPython notebooks for the reports, by default False.
+        full (bool, optional): Force a full rebuild, by default False.
+        execute (bool, optional): Execute the report notebooks in parallel before building, by default False.
+        workers (int, optional): Maximum number of notebooks executed at once, by default the number of CPUs.
+        timeout (int, optional): Per-notebook execution timeout in seconds, by default 600.
+        cache (bool, optional): Reuse cached executions of unchanged notebooks, by default True.
+        table_api (bool, optional): Load large tables page by page from the `api/table` endpoint of
+            the built-in file server, by default False. Only use it if the site is served by BGCFlow.
+
+    Returns:
+        Path: The site directory.
+    """
+    report_dir = prepare_mkdocs_report(
+        bgcflow_dir, project_name, fileserver, ipynb, table_api
+    )
+    if execute:
+        execute_report_notebooks(
+            report_dir, workers=workers, timeout=timeout, cache=cache
+        )
+    if site_dir is None:
+        site_dir = report_dir / "site"
+    site_dir = Path(site_dir).resolve()
+
+    build_manifest_path = report_dir / ".bgcflow_build.json"
+    global_hashes, page_hashes = get_report_inputs(report_dir)
+    previous = load_json_state(build_manifest_path)
+
+    changed_pages = [
+        page
+        for page, h in page_hashes.items()
+        if previous.get("pages", {}).get(page) != h
+    ]
+    full_rebuild = (
+        full
+        or not (site_dir / "index.html").is_file()
+        or previous.get("site_dir") != str(site_dir)
+        or previous.get("global") != global_hashes
+        or set(previous.get("pages", {}).keys()) != set(page_hashes.keys())
+    )
+
+    if full_rebuild:
+        logging.info(f"Building full static report at: {site_dir}")
+        command = ["mkdocs", "build", "--clean", "--site-dir", str(site_dir)]
+    elif len(changed_pages) == 0:
+        logging.info(f"Static report is up to date: {site_dir}")
+        return site_dir
+    else:
+        logging.info(
+            f"Rebuilding {len(changed_pages)} changed page(s): {changed_pages}"
+        )
+        # mkdocs --dirty skips pages older than their output
+        now = time.time()
+        for page in page_hashes.keys():
+            output = get_page_output(page, site_dir)
+            if page in changed_pages:
+                output.unlink(missing_ok=True)
+            elif output.is_file():
+                os.utime(output, (now, now))
+        command = ["mkdocs", "build", "--dirty", "--site-dir", str(site_dir)]
+
+    previous_index = load_json_state(site_dir / "search/search_index.json")
+    logging.debug(f'Running command: {" ".join(command)}')
+    subprocess.run(command, cwd=report_dir, check=True)
+    if not full_rebuild:
+        merge_search_index(site_dir, previous_index, page_hashes.keys())
+
+    save_json_state(
+        build_manifest_path,
+        {"site_dir": str(site_dir), "global": global_hashes, "pages": page_hashes},
+    )
+    return site_dir
+
+
+def run_for_projects(func, bgcflow_dir, projects, max_workers=None, **kwargs):
+    """
+    Runs a report function for several projects in parallel, e.g. `prepare_mkdocs_report` or
+    `build_static_report`.
+
+    A failing project does not stop the others, its error is returned instead.
+
+    Args:
+        func (callable): The function to run, called as `func(bgcflow_dir, project_name, **kwargs)`.
+        bgcflow_dir (str): The path to the BGCFlow project directory.
+        projects (list): The project names.
+        max_workers (int, optional): Maximum number of projects processed at once. Defaults to the number of CPUs.
+        **kwargs: Additional keyword arguments passed to `func`.
+
+    Returns:
+        dict: For each project, a dictionary with the `status` ("ok" or "failed"), the `result` of
+            `func` and the `error` message.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count()
+
+    def run(project_name):
+        try:
+            return {
+                "status": "ok",
+                "result": func(bgcflow_dir, project_name, **kwargs),
+                "error": None,
+            }
+        except Exception as e:
+            logging.error(f"Project [{project_name}] failed: {e}")
+            return {"status": "failed", "result": None, "error": str(e)}
+
+    logging.info(
+        f"Processing {len(projects)} project(s) with {max_workers} worker(s)..."
+    )
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        results = dict(zip(projects, executor.map(run, projects)))
+    return results
+
+
 def signal_handler(signal, frame):
     """
-    A signal handler function that prints a message and exits the program.
+    A signal handler function that interrupts the program, so that the servers it started are stopped.
 
     Args:
         signal (int): The signal number.
         frame (FrameType): The current stack frame.
     """
-    print("\nThank you for using BGCFlow Report!")
-    # with open('bgcflow_wrapper.log', "r") as f:
-    #    log_port = json.load(f)
-    #    os.kill(log_port['pid'], signal.signal.SIGKILL)
-    sys.exit(0)
+    raise KeyboardInterrupt
 
 
 # template for mkdocs homepage
@@ -339,6 +694,7 @@ mkdocs_template = {
             },
         ]
     },
+    "extra_javascript": ["assets/bgcflow/tables.js"],
     "markdown_extensions": ["attr_list"],
     "nav": [{"Home": "index.md"}],
     "plugins": [
@@ -382,10 +738,26 @@ mkdocs_template = {
 
 # template for mkdocs macros
 macros_template = """
+import html
 import json
+import os
 import pandas as pd
+from functools import lru_cache
 from pathlib import Path
 
+report_dir = Path(__file__).parent
+
+file_server = "{{ file_server }}"
+
+# whether the file server answers `api/table` requests, i.e. it is the built-in file server
+table_api = {{ table_api }}
+
+# with the table api, tables with more rows are loaded page by page from the file server
+paginate_threshold = 1000
+
+# parsed csv tables, keyed by path and invalidated by modification time
+csv_cache = {}
+
 class Dict2Class(object):
 
     def __init__(self, my_dict):
@@ -400,43 +772,81 @@ class Dict2Class(object):
         return text
 
     def file_server(self):
-        return "{{ file_server }}"
+        return file_server
 
     def dependency_version(self):
-        dependency_versions_path = Path(__file__).parent / "metadata/dependency_versions.json"
-        if dependency_versions_path.is_file():
-            with open(dependency_versions_path, "r") as f:
-                dependency_versions = json.load(f)
-                return dependency_versions["antismash"]
-        else:
-            print("WARNING: Unable to find dependency_versions.json file. Are you using BGCFlow >= 0.7.1?")
-            print("WARNING: Assuming antismash version as 6.1.1")
-            return "6.1.1"
+        return self.antismash_version
+
+def read_dependency_version():
+    dependency_versions_path = report_dir / "metadata/dependency_versions.json"
+    if dependency_versions_path.is_file():
+        with open(dependency_versions_path, "r") as f:
+            dependency_versions = json.load(f)
+            return dependency_versions["antismash"]
+    else:
+        print("WARNING: Unable to find dependency_versions.json file. Are you using BGCFlow >= 0.7.1?")
+        print("WARNING: Assuming antismash version as 6.1.1")
+        return "6.1.1"
+
+def read_csv_cached(f):
+    path = Path(f).resolve()
+    mtime = path.stat().st_mtime_ns
+    cached = csv_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, pd.read_csv(path))
+        csv_cache[path] = cached
+    return cached[1]
 
 def define_env(env):
   "Hook function"
 
-  @env.macro
-  def project():
-      with open(Path(__file__).parent / "metadata/project_metadata.json", "r") as f:
+  # define_env runs once per build, so metadata is parsed once per build
+  @lru_cache(maxsize=None)
+  def load_project():
+      with open(report_dir / "metadata/project_metadata.json", "r") as f:
           project_metadata = json.load(f)
           p = list(project_metadata.values())[0]
           p['name'] = [i for i in project_metadata.keys()][0]
+          p['antismash_version'] = read_dependency_version()
           p = Dict2Class(p)
       return p
 
-  @env.macro
-  def read_csv_html(f, as_path):
-    df = pd.read_csv(f)
-    df = df.loc[:, ["genome_id", "source", "strain"]]
-    for i in df.index:
-        gid = df.loc[i, 'genome_id']
-        df.loc[i, "url"] = f"<a href='{as_path}/{gid}/'>link</a>"
+  @lru_cache(maxsize=None)
+  def render_csv_html(path, mtime, as_path):
+    df = read_csv_cached(path).loc[:, ["genome_id", "source", "strain"]].copy()
+    df["url"] = "<a href='" + str(as_path) + "/" + df["genome_id"].astype(str) + "/'>link</a>"
     html = df.to_html(table_id="myTable",
                       classes=["display"],
                       render_links=True,
                       escape=False).replace('border="1"','').replace('dataframe ', '')
     return html
+
+  @env.macro
+  def project():
+      return load_project()
+
+  @env.macro
+  def read_csv_json(f, as_path=None, columns=("genome_id", "source", "strain"), page_size=100):
+    table_path = os.path.relpath(os.path.abspath(f), report_dir)
+    headers = "".join(f"<th>{c}</th>" for c in columns)
+    # rows link to their genome page, so tables without genome_id get no links
+    if "genome_id" not in columns:
+        as_path = None
+    if as_path is not None:
+        headers += "<th>url</th>"
+    return (f'<div class="bgcflow-table" data-endpoint="{file_server}/api/table" '
+            f'data-path="{html.escape(table_path)}" data-columns="{html.escape(",".join(columns))}" '
+            f'data-link-path="{html.escape(as_path or "")}" data-page-size="{int(page_size)}">'
+            f'<table class="display"><thead><tr>{headers}</tr></thead><tbody></tbody></table></div>')
+
+  @env.macro
+  def read_csv_html(f, as_path, paginate=None):
+    path = Path(f).resolve()
+    if paginate is None:
+        paginate = table_api and len(read_csv_cached(path)) > paginate_threshold
+    if paginate:
+        return read_csv_json(f, as_path)
+    return render_csv_html(path, path.stat().st_mtime_ns, as_path)
 """
 
 # template for custom js
@@ -446,6 +856,104 @@ $(document).ready(function() {
 } );
 """
 
+# script for tables loaded page by page from the file server table endpoint
+table_js = """
+(function () {
+  function initTable(container) {
+    if (container.dataset.ready) {
+      return;
+    }
+    container.dataset.ready = "true";
+    var columns = container.dataset.columns.split(",");
+    var linkPath = container.dataset.linkPath;
+    var linkColumn = columns.indexOf("genome_id");
+    var state = {start: 0, length: parseInt(container.dataset.pageSize, 10), sort: "", order: "asc", search: ""};
+    var tbody = container.querySelector("tbody");
+
+    var search = document.createElement("input");
+    search.type = "search";
+    search.placeholder = "Filter rows...";
+    container.insertBefore(search, container.firstChild);
+    var controls = document.createElement("div");
+    var previous = document.createElement("button");
+    var next = document.createElement("button");
+    var status = document.createElement("span");
+    previous.textContent = "Previous";
+    next.textContent = "Next";
+    controls.append(previous, " ", status, " ", next);
+    container.appendChild(controls);
+
+    function render(data) {
+      tbody.replaceChildren();
+      data.rows.forEach(function (row) {
+        var tr = document.createElement("tr");
+        row.forEach(function (value) {
+          var td = document.createElement("td");
+          td.textContent = value === null ? "" : value;
+          tr.appendChild(td);
+        });
+        if (linkPath && linkColumn >= 0) {
+          var td = document.createElement("td");
+          var a = document.createElement("a");
+          a.href = linkPath + "/" + row[linkColumn] + "/";
+          a.textContent = "link";
+          td.appendChild(a);
+          tr.appendChild(td);
+        }
+        tbody.appendChild(tr);
+      });
+      var last = Math.min(data.start + state.length, data.filtered);
+      status.textContent = (data.filtered ? data.start + 1 : 0) + "-" + last + " of " + data.filtered +
+        (data.filtered !== data.total ? " (filtered from " + data.total + ")" : "");
+      previous.disabled = data.start === 0;
+      next.disabled = last >= data.filtered;
+    }
+
+    function load() {
+      var params = new URLSearchParams({
+        path: container.dataset.path, columns: columns.join(","), start: state.start,
+        length: state.length, sort: state.sort, order: state.order, search: state.search
+      });
+      fetch(container.dataset.endpoint + "?" + params.toString())
+        .then(function (response) { return response.json(); })
+        .then(render)
+        .catch(function () { status.textContent = "Unable to load table from " + container.dataset.endpoint; });
+    }
+
+    container.querySelectorAll("th").forEach(function (th, i) {
+      if (i >= columns.length) {
+        return;
+      }
+      th.style.cursor = "pointer";
+      th.addEventListener("click", function () {
+        state.order = state.sort === columns[i] && state.order === "asc" ? "desc" : "asc";
+        state.sort = columns[i];
+        state.start = 0;
+        load();
+      });
+    });
+    var timer = null;
+    search.addEventListener("input", function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () { state.search = search.value; state.start = 0; load(); }, 300);
+    });
+    previous.addEventListener("click", function () { state.start = Math.max(state.start - state.length, 0); load(); });
+    next.addEventListener("click", function () { state.start += state.length; load(); });
+    load();
+  }
+
+  function initTables() {
+    document.querySelectorAll("div.bgcflow-table").forEach(initTable);
+  }
+
+  if (typeof document$ !== "undefined") {
+    document$.subscribe(initTables);
+  } else {
+    document.addEventListener("DOMContentLoaded", initTables);
+  }
+})();
+"""
+
 # template for html overrides
 main_html = """
 {% extends "base.html" %}
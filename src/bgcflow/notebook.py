@@ -0,0 +1,424 @@
+"""Parallel execution of report notebooks."""
+import ast
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from bgcflow.cache import load_json_state, path_fingerprint, save_json_state
+from bgcflow.services import is_process_alive
+
+log_format = "%(levelname)-8s %(asctime)s   %(message)s"
+date_format = "%d/%m %H:%M:%S"
+logging.basicConfig(format=log_format, datefmt=date_format, level=logging.DEBUG)
+
+# serializes updates of the cache index between worker threads
+cache_index_lock = threading.Lock()
+
+# entries of a report directory written by the report build rather than by the workflow
+report_build_files = ["docs", "site", "overrides", "mkdocs.yml", "main.py"]
+
+# seconds a timed out notebook and its kernel get to exit before they are killed
+kill_grace_period = 5
+
+
+def read_notebook_code(notebook):
+    """
+    Reads the kernel and cell sources of a notebook, ignoring outputs and execution metadata.
+
+    Args:
+        notebook (str or Path): The notebook to read.
+
+    Returns:
+        tuple: The kernel name, and a list of `(cell_type, source)` tuples.
+    """
+    with open(notebook, "r", encoding="utf-8") as f:
+        content = json.load(f)
+    kernel = content.get("metadata", {}).get("kernelspec", {}).get("name")
+    cells = []
+    for cell in content.get("cells", []):
+        source = cell.get("source", "")
+        if isinstance(source, list):
+            source = "".join(source)
+        cells.append((cell.get("cell_type"), source))
+    return kernel, cells
+
+
+def find_notebook_inputs(notebook, cwd):
+    """
+    Finds the result files a notebook reads, from the string literals of its code cells.
+
+    Every string literal that names an existing file or directory relative to the kernel working
+    directory is considered an input, except directories containing the notebook or the working
+    directory itself.
+
+    Args:
+        notebook (str or Path): The notebook to scan.
+        cwd (str or Path): The working directory of the kernel.
+
+    Returns:
+        list: The input paths, resolved and sorted.
+    """
+    _, cells = read_notebook_code(notebook)
+    notebook = Path(notebook).resolve()
+    cwd = Path(cwd).resolve()
+    inputs = set()
+    for cell_type, source in cells:
+        if cell_type != "code":
+            continue
+        # drop IPython magics and shell escapes, which are not python syntax
+        lines = [
+            line
+            for line in source.splitlines()
+            if not line.lstrip().startswith(("%", "!"))
+        ]
+        try:
+            tree = ast.parse("\n".join(lines))
+        except SyntaxError:
+            continue
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Constant) or not isinstance(node.value, str):
+                continue
+            value = node.value.strip()
+            if value == "" or len(value) > 4096 or "\n" in value:
+                continue
+            try:
+                candidate = (cwd / value).resolve()
+                if not candidate.exists():
+                    continue
+            except (OSError, ValueError):
+                continue
+            if notebook.is_relative_to(candidate) or cwd.is_relative_to(candidate):
+                continue
+            inputs.add(candidate)
+    return sorted(inputs)
+
+
+def find_report_inputs(report_dir):
+    """
+    Lists the results of a report directory that its notebooks may read.
+
+    Notebooks build paths at run time (e.g. `Path("../") / "tables/df_gtdb_meta.csv"`), so every
+    result entry is treated as an input: tables, metadata and the linked result directories. The
+    files written by the report build and hidden state files are left out.
+
+    Args:
+        report_dir (str or Path): The report directory.
+
+    Returns:
+        list: The result paths, sorted.
+    """
+    return sorted(
+        path
+        for path in Path(report_dir).iterdir()
+        if path.name not in report_build_files
+        and not path.name.startswith(".")
+        and path.suffix != ".bak"
+    )
+
+
+def notebook_cache_key(notebook, cwd, to="notebook", extra_args=None, inputs=None):
+    """
+    Computes the cache key of a notebook execution.
+
+    The key combines the hash of the notebook source (not its outputs) with the fingerprints of the
+    result files it reads and the nbconvert output settings.
+
+    Args:
+        notebook (str or Path): The notebook to execute.
+        cwd (str or Path): The working directory of the kernel.
+        to (str, optional): The nbconvert output format. Defaults to "notebook".
+        extra_args (list, optional): Additional nbconvert arguments.
+        inputs (dict, optional): Fingerprints of further input paths, keyed by path.
+
+    Returns:
+        str: The hex digest of the cache key.
+    """
+    kernel, cells = read_notebook_code(notebook)
+    fingerprints = {
+        str(path): path_fingerprint(path)
+        for path in find_notebook_inputs(notebook, cwd)
+    }
+    fingerprints.update(inputs or {})
+    key = {
+        "kernel": kernel,
+        "cells": cells,
+        "to": to,
+        "extra_args": list(extra_args or []),
+        "inputs": fingerprints,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def execute_notebook(
+    notebook,
+    output=None,
+    to="notebook",
+    timeout=600,
+    cwd=None,
+    extra_args=None,
+    cache_dir=None,
+    inputs=None,
+):
+    """
+    Executes a Jupyter notebook with `jupyter nbconvert --execute` in its own kernel.
+
+    If `cache_dir` is set, successful executions are stored there under a key built from the
+    notebook source and the result files it reads. A later execution with the same key copies the
+    cached output instead of running the notebook. Input files are found from the string literals
+    of the notebook; paths built at run time must be given in `inputs`.
+
+    Args:
+        notebook (str or Path): The notebook to execute.
+        output (str or Path, optional): The output file. If None, the notebook is executed in place.
+        to (str, optional): The nbconvert output format. Defaults to "notebook".
+        timeout (int, optional): Seconds the whole notebook may run before it is killed. Defaults to 600.
+        cwd (str or Path, optional): The working directory of the kernel. Defaults to the notebook directory.
+        extra_args (list, optional): Additional nbconvert arguments, e.g. `["--no-input"]`.
+        cache_dir (str or Path, optional): Directory of the execution cache. Defaults to None (no caching).
+        inputs (dict, optional): Fingerprints of further input paths for the cache key, keyed by path.
+
+    Returns:
+        dict: The `notebook`, its `output`, the `status` ("ok", "cached", "failed" or "timeout"), the
+            run time in `seconds` and the `error` message if it did not succeed.
+    """
+    notebook = Path(notebook).resolve()
+    if cwd is None:
+        cwd = notebook.parent
+
+    if cache_dir is not None:
+        start = time.monotonic()
+        cache_dir = Path(cache_dir)
+        key = notebook_cache_key(notebook, cwd, to, extra_args, inputs)
+        target = notebook if output is None else Path(output).resolve()
+        cached = cache_dir / f"{key}{target.suffix}"
+        if cached.is_file():
+            logging.debug(f"Using cached execution of {notebook.name}: {key}")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(cached, target)
+            return {
+                "notebook": str(notebook),
+                "output": str(target),
+                "status": "cached",
+                "error": None,
+                "seconds": round(time.monotonic() - start, 2),
+            }
+        result = execute_notebook(notebook, output, to, timeout, cwd, extra_args)
+        if result["status"] == "ok":
+            store_cached_output(cache_dir, notebook, key, target)
+        return result
+    command = [
+        "jupyter",
+        "nbconvert",
+        "--execute",
+        "--to",
+        to,
+        f"--ExecutePreprocessor.timeout={timeout}",
+    ]
+    if output is None:
+        command.append("--inplace")
+    else:
+        output = Path(output).resolve()
+        command += ["--output", output.name, "--output-dir", str(output.parent)]
+    if extra_args is not None:
+        command += list(extra_args)
+    command.append(str(notebook))
+
+    result = {"notebook": str(notebook), "output": str(output or notebook)}
+    logging.debug(f'Running command: {" ".join(command)}')
+    start = time.monotonic()
+    # nbconvert runs in its own session so that it can be killed with everything it started
+    process = subprocess.Popen(
+        command,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        start_new_session=True,
+    )
+    try:
+        _, stderr = process.communicate(timeout=timeout)
+        if process.returncode == 0:
+            result.update({"status": "ok", "error": None})
+        else:
+            error = stderr.strip().splitlines()
+            result.update({"status": "failed", "error": "\n".join(error[-5:])})
+    except subprocess.TimeoutExpired:
+        kill_process_tree(process)
+        result.update(
+            {"status": "timeout", "error": f"Execution exceeded {timeout} seconds"}
+        )
+    result["seconds"] = round(time.monotonic() - start, 2)
+    return result
+
+
+def find_child_processes(pid):
+    """
+    Finds the processes started by a process, directly or through its children.
+
+    Args:
+        pid (int): The parent process id.
+
+    Returns:
+        list: The process ids of the descendants.
+    """
+    children = {}
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[-1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    descendants = []
+    pending = [pid]
+    while pending:
+        for child in children.get(pending.pop(), []):
+            descendants.append(child)
+            pending.append(child)
+    return descendants
+
+
+def kill_process_tree(process, timeout=kill_grace_period):
+    """
+    Terminates a process started in its own session, and the process groups of its descendants.
+
+    Jupyter kernels are started in a session of their own, so killing the process group of
+    nbconvert alone would leave them running.
+
+    Args:
+        process (subprocess.Popen): The process to stop.
+        timeout (int, optional): Seconds to wait before killing the processes. Defaults to 5.
+    """
+    groups = {process.pid}
+    for pid in find_child_processes(process.pid):
+        with contextlib.suppress(ProcessLookupError):
+            groups.add(os.getpgid(pid))
+
+    def stopped():
+        return process.poll() is not None and not any(
+            is_process_alive(group) for group in groups
+        )
+
+    for sig in [signal.SIGTERM, signal.SIGKILL]:
+        if stopped():
+            break
+        for group in groups:
+            with contextlib.suppress(ProcessLookupError, PermissionError):
+                os.killpg(group, sig)
+        deadline = time.monotonic() + timeout
+        while not stopped() and time.monotonic() < deadline:
+            time.sleep(0.1)
+    process.communicate()
+
+
+def store_cached_output(cache_dir, notebook, key, output):
+    """
+    Stores an executed notebook output in the cache, replacing older entries of the same notebook.
+
+    Args:
+        cache_dir (Path): Directory of the execution cache.
+        notebook (Path): The executed notebook.
+        key (str): The cache key of the execution.
+        output (Path): The output file to store.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cached = cache_dir / f"{key}{output.suffix}"
+    shutil.copyfile(output, cached)
+    with cache_index_lock:
+        index_path = cache_dir / "index.json"
+        index = load_json_state(index_path)
+        entry = f"{notebook}:{output}"
+        previous = index.get(entry)
+        if previous is not None and previous != cached.name:
+            (cache_dir / previous).unlink(missing_ok=True)
+        index[entry] = cached.name
+        save_json_state(index_path, index)
+
+
+def execute_notebooks(jobs, workers=None, timeout=600):
+    """
+    Executes independent notebooks concurrently, one nbconvert process and kernel per notebook.
+
+    Args:
+        jobs (list): Keyword arguments for `execute_notebook`, one dictionary per notebook.
+        workers (int, optional): Maximum number of notebooks running at once. Defaults to the number of CPUs.
+        timeout (int, optional): Default per-notebook timeout in seconds. Defaults to 600.
+
+    Returns:
+        list: The result of each notebook, in the order of `jobs`.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    jobs = [{"timeout": timeout, **job} for job in jobs]
+    logging.info(f"Executing {len(jobs)} notebook(s) with {workers} worker(s)...")
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [executor.submit(execute_notebook, **job) for job in jobs]
+        results = [future.result() for future in futures]
+    log_execution_summary(results)
+    return results
+
+
+def log_execution_summary(results):
+    """
+    Logs a summary of notebook executions, including the errors of failed notebooks.
+
+    Args:
+        results (list): Results returned by `execute_notebook`.
+
+    Returns:
+        bool: True if every notebook executed successfully.
+    """
+    failed = [r for r in results if r["status"] not in ["ok", "cached"]]
+    cached = [r for r in results if r["status"] == "cached"]
+    logging.info(
+        f"Executed {len(results) - len(failed)} of {len(results)} notebook(s) successfully ({len(cached)} from cache)."
+    )
+    for r in results:
+        logging.debug(f" - {Path(r['notebook']).name}: {r['status']} ({r['seconds']}s)")
+    for r in failed:
+        logging.error(f"Notebook {r['notebook']} {r['status']}:\n{r['error']}")
+    return len(failed) == 0
+
+
+def execute_report_notebooks(report_dir, workers=None, timeout=600, cache=True):
+    """
+    Executes the notebooks of a report (`docs/*.ipynb`) in place, in parallel.
+
+    Args:
+        report_dir (str or Path): The report directory.
+        workers (int, optional): Maximum number of notebooks running at once. Defaults to the number of CPUs.
+        timeout (int, optional): Per-notebook timeout in seconds. Defaults to 600.
+        cache (bool, optional): Reuse executions cached in `.bgcflow_cache/notebooks` when the notebook and
+            the project results are unchanged. Defaults to True.
+
+    Returns:
+        list: The result of each notebook.
+    """
+    report_dir = Path(report_dir)
+    cache_dir = None
+    inputs = None
+    if cache:
+        cache_dir = report_dir / ".bgcflow_cache/notebooks"
+        # fingerprinted once, every notebook of the report depends on the whole result tree
+        inputs = {
+            str(path.resolve()): path_fingerprint(path)
+            for path in find_report_inputs(report_dir)
+        }
+    jobs = [
+        {
+            "notebook": notebook,
+            "cwd": report_dir / "docs",
+            "cache_dir": cache_dir,
+            "inputs": inputs,
+        }
+        for notebook in sorted((report_dir / "docs").glob("*.ipynb"))
+    ]
+    return execute_notebooks(jobs, workers=workers, timeout=timeout)
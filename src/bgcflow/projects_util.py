@@ -1,4 +1,8 @@
+import errno
+import fcntl
+import fnmatch
 import logging
+import os
 import shutil
 import subprocess
 from pathlib import Path
@@ -11,6 +15,9 @@ log_format = "%(levelname)-8s %(asctime)s   %(message)s"
 date_format = "%d/%m %H:%M:%S"
 logging.basicConfig(format=log_format, datefmt=date_format, level=logging.DEBUG)
 
+# ioctl request number of FICLONE (linux/fs.h), used to create reflinks
+FICLONE = 0x40049409
+
 
 def generate_global_config(bgcflow_dir, global_config):
     """
@@ -238,6 +245,35 @@ def generate_project(
         yaml.dump(main_config, file, sort_keys=False)
 
 
+def list_project_names(bgcflow_dir):
+    """
+    List the names of the projects defined in the BGCFlow global config.
+
+    Args:
+        bgcflow_dir (str or pathlib.PosixPath): The directory where the BGCFlow configuration is located.
+
+    Returns:
+        list: The project names, or None if the global config file does not exist.
+    """
+    bgcflow_dir = Path(bgcflow_dir)
+    global_config = bgcflow_dir / "config/config.yaml"
+    if not global_config.is_file():
+        return None
+    with open(global_config, "r") as file:
+        config_yaml = yaml.safe_load(file)
+    available_projects = []
+    for p in config_yaml["projects"]:
+        if "pep" in p.keys():
+            p["name"] = p.pop("pep")
+        if p["name"].endswith(".yaml") or p["name"].endswith(".yml"):
+            with open(bgcflow_dir / p["name"], "r") as pep_file:
+                pep_yaml = yaml.safe_load(pep_file)
+                available_projects.append(pep_yaml["name"])
+        else:
+            available_projects.append(p["name"])
+    return available_projects
+
+
 def projects_util(**kwargs):
     """
     Utility function for managing BGCflow projects.
@@ -275,12 +311,157 @@ def projects_util(**kwargs):
         bgcflow_init(bgcflow_dir, global_config)
 
 
+def reflink_file(source, destination):
+    """
+    Create a copy-on-write clone (reflink) of a file.
+
+    Only works on filesystems supporting FICLONE (e.g. btrfs, XFS) when source and destination
+    are on the same filesystem.
+
+    Args:
+        source (str or pathlib.PosixPath): The file to clone.
+        destination (str or pathlib.PosixPath): The path of the clone.
+
+    Raises:
+        OSError: If the filesystem does not support reflinks.
+    """
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.unlink(destination)
+            raise
+    shutil.copystat(source, destination)
+
+
+def dedupe_copy(source, destination, mode="auto", excludes=None):
+    """
+    Copy a directory tree while resolving symlinks, sharing file data where possible.
+
+    Every file (symlinks are followed) is recreated in the destination as a reflink or, only in
+    "hardlink" mode, a hardlink when source and destination share a filesystem, and is copied byte
+    by byte otherwise. Hardlinks share the inode with the source, so editing a copied file also
+    edits the original; "auto" therefore never hardlinks.
+
+    Args:
+        source (str or pathlib.PosixPath): The directory to copy.
+        destination (str or pathlib.PosixPath): The directory to copy into. The source directory is
+            created inside it, mirroring `rsync source destination`.
+        mode (str, optional): One of "auto" or "reflink" (reflink, then copy) or "hardlink"
+            (hardlink, then copy). Defaults to "auto".
+        excludes (list, optional): Glob patterns of paths relative to `source` to skip.
+
+    Returns:
+        dict: Number of files per copy method and the number of bytes saved.
+    """
+    assert mode in [
+        "auto",
+        "reflink",
+        "hardlink",
+    ], f"Invalid dedupe mode {mode}. Choose between 'auto', 'reflink' or 'hardlink'"
+    source = Path(source)
+    target_root = Path(destination) / source.name
+    if excludes is None:
+        excludes = []
+
+    stats = {"reflink": 0, "hardlink": 0, "copy": 0, "bytes_total": 0, "bytes_saved": 0}
+    methods = {
+        "auto": ["reflink"],
+        "reflink": ["reflink"],
+        "hardlink": ["hardlink"],
+    }[mode]
+    # resolved directories from the source down to each directory left to walk
+    ancestors = {}
+    for root, dirs, files in os.walk(source, followlinks=True):
+        root = Path(root)
+        relative_root = root.relative_to(source)
+
+        # guard against symlink loops, i.e. links to a directory of their own path. Other
+        # links to an already copied directory are copied again, like `rsync -L` does.
+        real_root = root.resolve()
+        chain = ancestors.pop(root, frozenset())
+        if real_root in chain:
+            dirs[:] = []
+            continue
+        chain = chain | {real_root}
+
+        dirs[:] = [
+            d
+            for d in dirs
+            if not any(
+                fnmatch.fnmatch((relative_root / d).as_posix(), e) for e in excludes
+            )
+        ]
+        for d in dirs:
+            ancestors[root / d] = chain
+        target_dir = target_root / relative_root
+        target_dir.mkdir(parents=True, exist_ok=True)
+
+        for f in files:
+            source_file = (root / f).resolve()
+            target_file = target_dir / f
+            if not source_file.is_file():
+                logging.warning(f"Skipping broken link or special file: {root / f}")
+                continue
+            if target_file.exists() or target_file.is_symlink():
+                target_file.unlink()
+
+            size = source_file.stat().st_size
+            stats["bytes_total"] += size
+            same_device = source_file.stat().st_dev == target_dir.stat().st_dev
+            method = "copy"
+            for m in methods if same_device else []:
+                try:
+                    if m == "reflink":
+                        reflink_file(source_file, target_file)
+                    else:
+                        os.link(source_file, target_file)
+                    method = m
+                    break
+                except OSError as e:
+                    if e.errno not in [
+                        errno.EOPNOTSUPP,
+                        errno.ENOTTY,
+                        errno.EINVAL,
+                        errno.EXDEV,
+                        errno.EPERM,
+                        errno.EMLINK,
+                    ]:
+                        raise
+            if method == "copy":
+                shutil.copy2(source_file, target_file)
+            else:
+                stats["bytes_saved"] += size
+            stats[method] += 1
+
+    return stats
+
+
+def format_bytes(size):
+    """
+    Format a number of bytes in a human readable unit.
+
+    Args:
+        size (int): Number of bytes.
+
+    Returns:
+        str: The size with a binary unit suffix, e.g. `1.5 GiB`.
+    """
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if abs(size) < 1024 or unit == "TiB":
+            break
+        size = size / 1024
+    return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+
+
 def copy_final_output(**kwargs):
     """
     Copy final project output files to a specified destination.
 
     This function facilitates the copying of processed project output files to a designated destination. It can
-    also preserve symbolic links during the copy process if specified.
+    also preserve symbolic links during the copy process if specified. When resolving symlinks, the copy can be
+    deduplicated with reflinks or hardlinks instead of duplicating the interim files.
 
     Args:
         **kwargs (dict): Keyword argument for the function.
@@ -290,12 +471,15 @@ def copy_final_output(**kwargs):
         project (str): The name of the project whose output should be copied.
         resolve_symlinks (str, optional): Indicate whether to preserve symbolic links. Defaults to False.
         destination (str): The destination directory where the output should be copied.
+        dedupe (str, optional): Use "auto", "reflink" or "hardlink" to share file data with the source
+            instead of copying it when resolving symlinks. Defaults to None (plain rsync copy).
     """
     bgcflow_dir = Path(kwargs["bgcflow_dir"]).resolve()
     project_output = bgcflow_dir / f"data/processed/{kwargs['project']}"
     assert (
         project_output.is_dir()
     ), f"ERROR: Cannot find project [{kwargs['project']}] results. Run `bgcflow init` to find available projects."
+    resolve_symlinks = ""
     if "resolve_symlinks" in kwargs.keys():
         assert kwargs["resolve_symlinks"] in [
             "True",
@@ -303,8 +487,27 @@ def copy_final_output(**kwargs):
         ], f'Invalid argument {kwargs["resolve_symlinks"]} in --resolve-symlinks. Choose between "True" or "False"'
         if kwargs["resolve_symlinks"] == "True":
             resolve_symlinks = "-L"
-    else:
-        resolve_symlinks = ""
+
+    dedupe = kwargs.get("dedupe")
+    if dedupe is not None and dedupe != "none":
+        assert (
+            resolve_symlinks == "-L"
+        ), "Deduplicated copies require --resolve-symlinks True"
+        logging.debug(f"Copying {project_output} with dedupe mode: {dedupe}")
+        stats = dedupe_copy(
+            project_output,
+            kwargs["destination"],
+            mode=dedupe,
+            excludes=["bigscape/*/cache"],
+        )
+        logging.info(
+            f"Reflinked {stats['reflink']}, hardlinked {stats['hardlink']} and copied {stats['copy']} files."
+        )
+        logging.info(
+            f"Bytes saved: {format_bytes(stats['bytes_saved'])} of {format_bytes(stats['bytes_total'])}"
+        )
+        return stats
+
     exclude_copy = f"{str(project_output.stem)}/bigscape/*/cache"
     command = [
         "rsync",
@@ -315,5 +518,6 @@ def copy_final_output(**kwargs):
         str(project_output),
         kwargs["destination"],
     ]
+    command = [c for c in command if c != ""]
     logging.debug(f'Running command: {" ".join(command)}')
     subprocess.call(command)
@@ -0,0 +1,191 @@
+"""Cached and searchable catalog of the rules described in BGCFlow `workflow/rules.yaml`."""
+import difflib
+import hashlib
+import json
+import re
+from pathlib import Path
+
+import yaml
+
+from bgcflow.cache import load_json_state, save_json_state
+
+# parsed rule files and their search index, keyed by the path of the rule file
+rule_cache_dir = Path.home() / ".cache/bgcflow/rules"
+
+# weight of a word found in each field of a rule
+field_weights = {"name": 3, "description": 2, "references": 1}
+
+
+def tokenize(text):
+    """
+    Splits a text into lowercase words, including the parts of names like `bigscape-cluster`.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        list: The words with at least two characters.
+    """
+    return [w for w in re.split(r"[^a-z0-9]+", str(text).lower()) if len(w) > 1]
+
+
+class RuleCatalog(object):
+    """
+    The rules available in a BGCFlow directory, with an inverted index for searching them.
+
+    Parsing `rules.yaml` and building the index is done once per version of the file; the result
+    is cached as JSON in `cache_dir`, which is much faster to load than YAML.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+        cache_dir (str, optional): The cache directory. Defaults to `~/.cache/bgcflow/rules`.
+    """
+
+    def __init__(self, bgcflow_dir=".", cache_dir=None):
+        """
+        Loads the rules of a BGCFlow directory, from the cache if the rule file did not change.
+
+        Args:
+            bgcflow_dir (str): The path to the BGCFlow directory.
+            cache_dir (str, optional): The cache directory. Defaults to `~/.cache/bgcflow/rules`.
+
+        Raises:
+            FileNotFoundError: If the BGCFlow directory has no `workflow/rules.yaml`.
+        """
+        self.rule_file = (Path(bgcflow_dir) / "workflow/rules.yaml").resolve()
+        stat = self.rule_file.stat()
+        signature = [stat.st_size, stat.st_mtime_ns]
+        key = hashlib.sha256(str(self.rule_file).encode()).hexdigest()[:16]
+        cache_path = Path(cache_dir or rule_cache_dir) / f"{key}.json"
+
+        cached = load_json_state(cache_path)
+        if cached.get("signature") == signature:
+            self.rules = cached["rules"]
+            self.index = cached["index"]
+            return
+        with open(self.rule_file, "r") as f:
+            self.rules = yaml.safe_load(f) or {}
+        self.index = self.build_index(self.rules)
+        # the cache is only an optimization, e.g. the home directory may be read-only
+        try:
+            save_json_state(
+                cache_path,
+                {"signature": signature, "rules": self.rules, "index": self.index},
+            )
+        except OSError:
+            pass
+
+    @staticmethod
+    def build_index(rules):
+        """
+        Builds the inverted index of words found in the rule names, descriptions and references.
+
+        Args:
+            rules (dict): The rules, keyed by name.
+
+        Returns:
+            dict: For each word, the score of every rule containing it.
+        """
+        index = {}
+        for name, rule in rules.items():
+            rule = rule or {}
+            fields = {
+                "name": name,
+                "description": rule.get("description", ""),
+                "references": " ".join(map(str, rule.get("references") or [])),
+            }
+            for field, text in fields.items():
+                for word in set(tokenize(text)):
+                    scores = index.setdefault(word, {})
+                    scores[name] = max(scores.get(name, 0), field_weights[field])
+        return index
+
+    def __contains__(self, name):
+        """
+        Checks whether a rule exists.
+        """
+        return name in self.rules
+
+    def names(self):
+        """
+        Lists the rule names.
+
+        Returns:
+            list: The rule names, in the order of `rules.yaml`.
+        """
+        return list(self.rules.keys())
+
+    def get(self, name):
+        """
+        Returns a rule by its exact name.
+
+        Args:
+            name (str): The rule name.
+
+        Returns:
+            dict: The rule description, references and other fields.
+
+        Raises:
+            KeyError: If the rule does not exist. The message suggests similar rule names.
+        """
+        if name not in self.rules:
+            message = f"Cannot find rule '{name}'."
+            suggestions = self.suggest(name)
+            if len(suggestions) > 0:
+                message += f" Did you mean: {', '.join(suggestions)}?"
+            raise KeyError(message)
+        return self.rules[name] or {}
+
+    def suggest(self, name, n=3):
+        """
+        Finds the rule names closest to a misspelled name.
+
+        Args:
+            name (str): The misspelled name.
+            n (int, optional): The maximum number of suggestions. Defaults to 3.
+
+        Returns:
+            list: The closest rule names.
+        """
+        return difflib.get_close_matches(name, self.names(), n=n, cutoff=0.6)
+
+    def search(self, query, limit=10):
+        """
+        Searches rules by words of their name, description and references.
+
+        Each word of the query matches the indexed words that are equal, start with it, or are
+        close to it (to tolerate typos). Matches in the name count more than matches in the
+        description, which count more than matches in the references.
+
+        Args:
+            query (str): The search text.
+            limit (int, optional): The maximum number of results. Defaults to 10.
+
+        Returns:
+            list: Tuples of the rule name and its score, best matches first.
+        """
+        scores = {}
+        vocabulary = list(self.index.keys())
+        for word in tokenize(query):
+            matches = {w: 1.0 for w in vocabulary if w.startswith(word)}
+            for w in difflib.get_close_matches(word, vocabulary, n=5, cutoff=0.75):
+                ratio = difflib.SequenceMatcher(None, word, w).ratio()
+                matches[w] = max(matches.get(w, 0), ratio)
+            for w, similarity in matches.items():
+                for name, weight in self.index[w].items():
+                    scores[name] = scores.get(name, 0) + weight * similarity
+        results = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(name, round(score, 2)) for name, score in results[:limit]]
+
+    def to_json(self, names=None):
+        """
+        Serializes rules as JSON.
+
+        Args:
+            names (list, optional): The rules to include. Defaults to every rule.
+
+        Returns:
+            str: The rules, keyed by name, as indented JSON.
+        """
+        names = self.names() if names is None else names
+        return json.dumps({name: self.get(name) for name in names}, indent=2)
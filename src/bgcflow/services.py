@@ -0,0 +1,397 @@
+"""Supervisor of the background servers started by BGCFlow (file server, MkDocs, Panoptes, Metabase)."""
+import contextlib
+import fcntl
+import logging
+import os
+import signal
+import socket
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+from bgcflow.cache import load_json_state, save_json_state
+
+log_format = "%(levelname)-8s %(asctime)s   %(message)s"
+date_format = "%d/%m %H:%M:%S"
+logging.basicConfig(format=log_format, datefmt=date_format, level=logging.DEBUG)
+
+# number of ports tried after a busy preferred port
+port_search_range = 100
+
+
+def find_free_port(port=None, bind=""):
+    """
+    Finds a port that no server is listening on.
+
+    Args:
+        port (int, optional): The preferred port. The following ports are tried if it is busy. Defaults to any free port.
+        bind (str, optional): The address the server will bind to. Defaults to "" (all interfaces).
+
+    Returns:
+        int: A free port.
+
+    Raises:
+        OSError: If no free port is found.
+    """
+    candidates = [0] if not port else range(port, port + port_search_range)
+    for candidate in candidates:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            try:
+                s.bind((bind, candidate))
+            except OSError:
+                continue
+            return s.getsockname()[1]
+    raise OSError(f"No free port found in {port}-{port + port_search_range - 1}")
+
+
+def is_process_alive(pid):
+    """
+    Checks whether a process is running.
+
+    Args:
+        pid (int): The process id.
+
+    Returns:
+        bool: True if the process exists and is not a zombie.
+    """
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            return f.read().rsplit(")", 1)[-1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+def process_start_time(pid):
+    """
+    Identifies a process by its start time, which differs from a later process reusing its id.
+
+    Args:
+        pid (int): The process id.
+
+    Returns:
+        str: The boot id and the start time of the process in clock ticks since boot, or None if the
+            process does not exist or `/proc` is not available.
+    """
+    try:
+        with open("/proc/sys/kernel/random/boot_id", "r") as f:
+            boot_id = f.read().strip()
+        with open(f"/proc/{pid}/stat", "r") as f:
+            # fields after the command name, which may contain spaces; starttime is field 22
+            start_time = f.read().rsplit(")", 1)[-1].split()[19]
+    except (OSError, IndexError):
+        return None
+    return f"{boot_id}:{start_time}"
+
+
+def is_healthy(health_url, timeout=2):
+    """
+    Checks whether a server answers on its health URL.
+
+    Args:
+        health_url (str): The URL to request, e.g. `http://localhost:8002/`.
+        timeout (float, optional): Seconds to wait for an answer. Defaults to 2.
+
+    Returns:
+        bool: True if the server answered without a server error.
+    """
+    try:
+        return requests.get(health_url, timeout=timeout).status_code < 500
+    except requests.exceptions.RequestException:
+        return False
+
+
+class ServiceSupervisor(object):
+    """
+    Starts, reuses and stops the background servers of a BGCFlow directory.
+
+    Services are recorded in `.bgcflow_services/services.json` with their process id and start time,
+    port and the `key` describing what they serve. A running and healthy service with the same name
+    and key is reused instead of being started again. Every service runs in its own process group, so
+    stopping it also stops the processes it spawned. A recorded process whose start time no longer
+    matches, e.g. a process id reused after a reboot, is forgotten without being signalled.
+
+    Args:
+        bgcflow_dir (str): The path to the BGCFlow directory.
+    """
+
+    def __init__(self, bgcflow_dir="."):
+        """
+        Initializes the supervisor of a BGCFlow directory.
+
+        Args:
+            bgcflow_dir (str): The path to the BGCFlow directory.
+        """
+        self.service_dir = Path(bgcflow_dir).resolve() / ".bgcflow_services"
+        self.state_path = self.service_dir / "services.json"
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        Serializes changes of the service state between BGCFlow processes.
+        """
+        self.service_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.service_dir / "lock", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self):
+        """
+        Reads the recorded services.
+
+        Returns:
+            dict: The services, keyed by name.
+        """
+        return load_json_state(self.state_path)
+
+    def is_alive(self, service):
+        """
+        Checks whether the process of a recorded service is still the one started by BGCFlow.
+
+        Args:
+            service (dict): The recorded service.
+
+        Returns:
+            bool: True if the process is alive and started when it was recorded. External services
+                are always considered alive.
+        """
+        if service.get("external"):
+            return True
+        pid = service.get("pid")
+        return is_process_alive(pid) and process_start_time(pid) == service.get(
+            "process_start"
+        )
+
+    def is_running(self, service):
+        """
+        Checks whether a recorded service is alive and healthy.
+
+        Args:
+            service (dict): The recorded service.
+
+        Returns:
+            bool: True if the service can be used.
+        """
+        if not self.is_alive(service):
+            return False
+        return is_healthy(service["health_url"])
+
+    def status(self):
+        """
+        Returns the recorded services and forgets those that are no longer running.
+
+        Returns:
+            dict: The running services, keyed by name.
+        """
+        with self.lock():
+            services = self.load()
+            running = {k: v for k, v in services.items() if self.is_running(v)}
+            if running != services:
+                save_json_state(self.state_path, running)
+        return running
+
+    def start(
+        self,
+        name,
+        command,
+        port=None,
+        cwd=None,
+        key=None,
+        health_path="/",
+        timeout=60,
+        fixed_port=False,
+        reuse_external=False,
+    ):
+        """
+        Starts a service, or reuses it if it is already running with the same key.
+
+        Args:
+            name (str): The service name, e.g. `file_server:<project>`.
+            command (list): The command to run. `{port}` in an argument is replaced by the port.
+            port (int, optional): The preferred port. A free port is picked if it is busy. Defaults to any free port.
+            cwd (str, optional): The working directory of the service.
+            key (str, optional): What the service serves, e.g. a directory. A running service with another key is restarted.
+            health_path (str, optional): The URL path answering once the service is ready. Defaults to "/".
+            timeout (int, optional): Seconds to wait for the service to become healthy. Defaults to 60.
+            fixed_port (bool, optional): Never change the port, e.g. when the service picks its own port. Defaults to False.
+            reuse_external (bool, optional): Reuse a healthy server on the preferred port that was not started
+                by BGCFlow, e.g. a Panoptes instance started by hand. Defaults to False.
+
+        Returns:
+            dict: The service, with `started` True if it was started by this call.
+
+        Raises:
+            RuntimeError: If the service exits or does not become healthy in time.
+        """
+        with self.lock():
+            services = self.load()
+            service = services.get(name)
+            if service is not None:
+                if service.get("key") == key and self.is_running(service):
+                    logging.info(
+                        f"Reusing running service [{name}] at {service['url']}"
+                    )
+                    return {**service, "started": False}
+                self._stop(service)
+                services.pop(name)
+                save_json_state(self.state_path, services)
+
+            if port and reuse_external:
+                url = f"http://localhost:{port}"
+                if is_healthy(f"{url}{health_path}"):
+                    logging.info(f"Reusing external service [{name}] at {url}")
+                    service = {
+                        "name": name,
+                        "pid": None,
+                        "port": port,
+                        "url": url,
+                        "health_url": f"{url}{health_path}",
+                        "key": key,
+                        "external": True,
+                    }
+                    services[name] = service
+                    save_json_state(self.state_path, services)
+                    return {**service, "started": False}
+
+            if not fixed_port:
+                free_port = find_free_port(port)
+                if port and free_port != port:
+                    logging.warning(
+                        f"Port {port} is busy, starting [{name}] on port {free_port}"
+                    )
+                port = free_port
+            url = f"http://localhost:{port}"
+            command = [str(c).replace("{port}", str(port)) for c in command]
+            log_file = self.service_dir / f"{name.replace('/', '_')}.log"
+            logging.info(f"Starting service [{name}]: {' '.join(command)}")
+            with open(log_file, "w") as log:
+                process = subprocess.Popen(
+                    command,
+                    cwd=cwd,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    stdin=subprocess.DEVNULL,
+                    start_new_session=True,
+                )
+            service = {
+                "name": name,
+                "pid": process.pid,
+                "process_start": process_start_time(process.pid),
+                "port": port,
+                "url": url,
+                "health_url": f"{url}{health_path}",
+                "key": key,
+                "command": command,
+                "cwd": str(cwd) if cwd is not None else None,
+                "log": str(log_file),
+                "since": datetime.now().isoformat(timespec="seconds"),
+                "external": False,
+            }
+            services[name] = service
+            save_json_state(self.state_path, services)
+
+        deadline = time.monotonic() + timeout
+        while not is_healthy(service["health_url"], timeout=1):
+            if process.poll() is not None or time.monotonic() > deadline:
+                self.stop(name)
+                with open(log_file, "r") as f:
+                    output = "".join(f.readlines()[-10:])
+                raise RuntimeError(
+                    f"Service [{name}] did not start. Last output:\n{output}"
+                )
+            time.sleep(0.25)
+        logging.info(f"Service [{name}] is running at {url} (pid {process.pid})")
+        return {**service, "started": True}
+
+    def _stop(self, service, timeout=10):
+        """
+        Terminates the process group of a service, killing it if it does not exit in time.
+
+        Nothing is signalled if the process id now belongs to another process.
+
+        Args:
+            service (dict): The recorded service.
+            timeout (int, optional): Seconds to wait before killing the processes. Defaults to 10.
+        """
+        pid = service.get("pid")
+        if service.get("external") or not is_process_alive(pid):
+            return
+        if not self.is_alive(service):
+            logging.warning(
+                f"Process {pid} of service [{service['name']}] is not the recorded one, forgetting it"
+            )
+            return
+        logging.info(f"Stopping service [{service['name']}] (pid {pid})")
+        try:
+            os.killpg(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        deadline = time.monotonic() + timeout
+        while is_process_alive(pid) and time.monotonic() < deadline:
+            with contextlib.suppress(ChildProcessError):
+                os.waitpid(pid, os.WNOHANG)
+            time.sleep(0.1)
+        if is_process_alive(pid):
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(pid, signal.SIGKILL)
+        with contextlib.suppress(ChildProcessError):
+            os.waitpid(pid, os.WNOHANG)
+
+    def stop(self, name):
+        """
+        Stops a service and forgets it.
+
+        Args:
+            name (str): The service name.
+
+        Returns:
+            bool: True if the service was recorded.
+        """
+        with self.lock():
+            services = self.load()
+            service = services.pop(name, None)
+            if service is not None:
+                self._stop(service)
+            save_json_state(self.state_path, services)
+        return service is not None
+
+    def stop_all(self):
+        """
+        Stops every recorded service.
+
+        Returns:
+            list: The names of the stopped services.
+        """
+        names = list(self.load().keys())
+        for name in names:
+            self.stop(name)
+        return names
+
+    def wait(self, names):
+        """
+        Blocks until one of the services exits or the user interrupts.
+
+        Args:
+            names (list): The service names to watch.
+        """
+        while True:
+            services = self.load()
+            for name in names:
+                service = services.get(name)
+                if service is None or not self.is_alive(service):
+                    logging.warning(f"Service [{name}] is no longer running")
+                    return
+            time.sleep(1)
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from git import Actor, Repo
+
+from bgcflow.bgcflow import (
+    cloner,
+    get_conda_prefix,
+    list_worktrees,
+    prune_worktrees,
+    shared_conda_prefix,
+)
+
+
+def make_upstream(path, n_commits=3):
+    """Create a git repository with a BGCFlow-like layout and a few commits."""
+    repo = Repo.init(path, initial_branch="main")
+    actor = Actor("BGCFlow", "bgcflow@example.com")
+    for i in range(n_commits):
+        rule_file = Path(path) / "workflow/rules.yaml"
+        rule_file.parent.mkdir(exist_ok=True)
+        rule_file.write_text(f"rule_{i}:\n  description: rule {i}\n")
+        repo.index.add([str(rule_file)])
+        repo.index.commit(f"commit {i}", author=actor, committer=actor)
+    return repo
+
+
+class TestCloner(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.upstream = self.tmp_dir / "upstream"
+        make_upstream(self.upstream)
+        self.mirror = self.tmp_dir / "cache/mirror/bgcflow.git"
+        patches = [
+            mock.patch("bgcflow.bgcflow.bgcflow_repository", str(self.upstream)),
+            mock.patch("bgcflow.bgcflow.mirror_dir", self.mirror),
+            mock.patch(
+                "bgcflow.bgcflow.worktree_registry", self.tmp_dir / "worktrees.json"
+            ),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def clone(self, name, **kwargs):
+        destination = self.tmp_dir / name
+        cloner(destination=destination, branch="main", **kwargs)
+        return Repo(destination)
+
+    def test_reference_and_offline(self):
+        repo = self.clone("referenced", reference=True)
+        alternates = Path(repo.git_dir) / "objects/info/alternates"
+        self.assertEqual(alternates.read_text().strip(), str(self.mirror / "objects"))
+        self.assertEqual(int(repo.git.rev_list("--count", "HEAD")), 3)
+
+        # the upstream is unreachable, the mirror is enough
+        shutil.rmtree(self.upstream)
+        repo = self.clone("offline", offline=True, depth=1)
+        self.assertEqual(repo.remotes.origin.url, str(self.upstream))
+        self.assertEqual(repo.head.commit.message, "commit 2")
+        self.assertTrue(repo.git.rev_parse("--is-shallow-repository") == "true")
+
+    def test_mirror_keeps_borrowed_objects(self):
+        # a file:// URL makes git borrow objects instead of copying the local repository
+        with mock.patch("bgcflow.bgcflow.bgcflow_repository", self.upstream.as_uri()):
+            repo = self.clone("referenced", reference=True)
+            self.assertTrue(repo.git.count_objects().startswith("0 objects"))
+            # the upstream history is rewritten, the next mirror update drops its commits
+            Repo(self.upstream).git.reset("--hard", "HEAD~2")
+            dissociated = self.clone("dissociated", dissociate=True)
+        alternates = Path(dissociated.git_dir) / "objects/info/alternates"
+        self.assertFalse(alternates.exists())
+
+        # objects older than the default expiry of the garbage collection
+        for path in (self.mirror / "objects").rglob("*"):
+            if path.is_file():
+                os.utime(path, (0, 0))
+        Repo(self.mirror).git.gc()
+        repo.git.fsck("--full")
+        self.assertEqual(repo.head.commit.message, "commit 2")
+
+    def test_worktrees(self):
+        Repo(self.upstream).create_tag("v1.0", ref="HEAD~1")
+        main = self.clone("main", worktree="main").working_tree_dir
+        old = self.clone("old", worktree="v1.0").working_tree_dir
+        self.assertIn("rule_1", (Path(old) / "workflow/rules.yaml").read_text())
+        # the history stays in the mirror
+        self.assertTrue((Path(old) / ".git").is_file())
+        self.assertEqual(get_conda_prefix(old), str(shared_conda_prefix))
+        self.assertIsNone(get_conda_prefix(self.upstream))
+
+        worktrees = list_worktrees()
+        self.assertEqual(
+            {w["ref"]: w["exists"] for w in worktrees.values()},
+            {"main": True, "v1.0": True},
+        )
+        self.assertTrue(all(w["head"] == w["commit"] for w in worktrees.values()))
+
+        shutil.rmtree(old)
+        self.assertEqual(prune_worktrees(), [str(Path(old).resolve())])
+        self.assertEqual(list(list_worktrees()), [str(Path(main).resolve())])
+        self.assertEqual(len(Repo(self.mirror).git.worktree("list").splitlines()), 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from bgcflow.projects_util import copy_final_output, dedupe_copy
+
+
+class TestDedupeCopy(unittest.TestCase):
+    def setUp(self):
+        self.bgcflow_dir = Path(tempfile.mkdtemp())
+        interim = self.bgcflow_dir / "data/interim/antismash/genome1"
+        interim.mkdir(parents=True)
+        (interim / "genome1.gbk").write_text("LOCUS genome1\n" * 100)
+
+        self.project_output = self.bgcflow_dir / "data/processed/test_project"
+        (self.project_output / "antismash").mkdir(parents=True)
+        (self.project_output / "antismash/genome1").symlink_to(interim)
+        (self.project_output / "bigscape/result_1/cache").mkdir(parents=True)
+        (self.project_output / "bigscape/result_1/cache/big.pkl").write_text("cache")
+        (self.project_output / "bigscape/result_1/index.html").write_text("html")
+        self.destination = self.bgcflow_dir / "results"
+
+    def test_hardlink_copy(self):
+        stats = dedupe_copy(
+            self.project_output,
+            self.destination,
+            mode="hardlink",
+            excludes=["bigscape/*/cache"],
+        )
+        copied = self.destination / "test_project/antismash/genome1/genome1.gbk"
+        self.assertTrue(copied.is_file())
+        self.assertFalse(copied.is_symlink())
+        self.assertEqual(
+            os.stat(copied).st_ino,
+            os.stat(
+                self.bgcflow_dir / "data/interim/antismash/genome1/genome1.gbk"
+            ).st_ino,
+        )
+        self.assertFalse(
+            (self.destination / "test_project/bigscape/result_1/cache").exists()
+        )
+        self.assertEqual(stats["hardlink"], 2)
+        self.assertEqual(stats["bytes_saved"], stats["bytes_total"])
+
+    def test_links_to_same_directory(self):
+        interim = self.bgcflow_dir / "data/interim/antismash/genome1"
+        (self.project_output / "antismash/latest").symlink_to(interim)
+        # a link to its own ancestor is not followed
+        (interim / "loop").symlink_to(interim.parent)
+        stats = dedupe_copy(self.project_output, self.destination, mode="hardlink")
+        for name in ["genome1", "latest"]:
+            self.assertTrue(
+                (
+                    self.destination / f"test_project/antismash/{name}/genome1.gbk"
+                ).is_file()
+            )
+        # latest/loop/genome1 is latest itself
+        self.assertTrue(
+            (self.destination / "test_project/antismash/latest/loop").is_dir()
+        )
+        self.assertFalse(
+            (self.destination / "test_project/antismash/latest/loop/genome1").exists()
+        )
+        self.assertEqual(stats["hardlink"], 4)
+
+    def test_copy_final_output_auto(self):
+        stats = copy_final_output(
+            bgcflow_dir=self.bgcflow_dir,
+            project="test_project",
+            destination=str(self.destination),
+            resolve_symlinks="True",
+            dedupe="auto",
+        )
+        self.assertEqual(stats["reflink"] + stats["copy"], 2)
+        # a copy never shares its inode with the original results
+        self.assertEqual(stats["hardlink"], 0)
+        copied = self.destination / "test_project/antismash/genome1/genome1.gbk"
+        self.assertNotEqual(
+            os.stat(copied).st_ino,
+            os.stat(
+                self.bgcflow_dir / "data/interim/antismash/genome1/genome1.gbk"
+            ).st_ino,
+        )
+        self.assertTrue(
+            (self.destination / "test_project/bigscape/result_1/index.html").is_file()
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.bgcflow_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,300 @@
+import importlib.util
+import io
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import duckdb
+
+from bgcflow.database import (
+    connect_catalog,
+    export_parquet,
+    query_database,
+    record_database_state,
+    refresh_catalog,
+    update_database,
+)
+from tests.test_mkdocs_report import make_report_project
+
+
+def write_seqfu_table(report_dir, rows):
+    """Write a seqfu result table with the given (genome_id, genus, contigs) rows."""
+    (report_dir / "tables").mkdir(exist_ok=True)
+    lines = ["genome_id,genus,contigs"] + [",".join(map(str, r)) for r in rows]
+    (report_dir / "tables/df_seqfu_stats.csv").write_text("\n".join(lines) + "\n")
+
+
+def make_project_database(bgcflow_dir, project_name, rows):
+    """Create a report directory with a seqfu table and the DuckDB database built from it."""
+    report_dir = make_report_project(bgcflow_dir, project_name)
+    write_seqfu_table(report_dir, rows)
+    duckdb_path = report_dir / "dbt/antiSMASH_7.1.0/dbt_bgcflow.duckdb"
+    duckdb_path.parent.mkdir(parents=True)
+    with duckdb.connect(str(duckdb_path)) as con:
+        con.execute(
+            "CREATE TABLE seqfu_stats AS SELECT * FROM read_csv_auto(?)",
+            [str(report_dir / "tables/df_seqfu_stats.csv")],
+        )
+    return report_dir, duckdb_path
+
+
+def write_dbt_manifest(dbt_dir):
+    """Write the manifest of a dbt project whose source and model names differ from the CSV tables."""
+    (dbt_dir / "models").mkdir(exist_ok=True)
+    (dbt_dir / "models/sources.yml").write_text("version: 2\n")
+    manifest = {
+        "sources": {
+            "source.dbt_bgcflow.bgcflow.seqfu": {
+                "source_name": "bgcflow",
+                "name": "seqfu",
+                "meta": {"external_location": "../../../tables/df_{name}_stats.csv"},
+            }
+        },
+        "nodes": {
+            "model.dbt_bgcflow.seqfu_stats": {
+                "resource_type": "model",
+                "name": "seqfu_stats",
+                "raw_code": "SELECT * FROM {{ source('bgcflow', 'seqfu') }}",
+                "depends_on": {"nodes": ["source.dbt_bgcflow.bgcflow.seqfu"]},
+            },
+            "model.dbt_bgcflow.genus_summary": {
+                "resource_type": "model",
+                "name": "genus_summary",
+                "raw_code": "SELECT genus, count(*) FROM {{ ref('seqfu_stats') }} GROUP BY 1",
+                "depends_on": {"nodes": ["model.dbt_bgcflow.seqfu_stats"]},
+            },
+            "model.dbt_bgcflow.checkm": {
+                "resource_type": "model",
+                "name": "checkm",
+                "raw_code": "SELECT * FROM read_csv_auto('../../../tables/df_checkm.csv')",
+            },
+        },
+    }
+    (dbt_dir / "target").mkdir(exist_ok=True)
+    (dbt_dir / "target/manifest.json").write_text(json.dumps(manifest))
+
+
+class TestIncrementalDatabase(unittest.TestCase):
+    def setUp(self):
+        self.bgcflow_dir = Path(tempfile.mkdtemp())
+        self.report_dir, self.duckdb_path = make_project_database(
+            self.bgcflow_dir,
+            "project",
+            [("g1", "Streptomyces", 10), ("g2", "Bacillus", 3)],
+        )
+
+    def test_update_database(self):
+        dbt_dir = self.duckdb_path.parent
+        write_dbt_manifest(dbt_dir)
+        tables = self.report_dir / "tables"
+        (tables / "df_checkm.csv").write_text("genome_id,completeness\ng1,99\n")
+        (tables / "df_gtdb.csv").write_text("genome_id,genus\ng1,Streptomyces\n")
+        with duckdb.connect(str(self.duckdb_path)) as con:
+            con.execute(
+                "CREATE TABLE genus_summary AS SELECT genus, count(*) AS n FROM seqfu_stats GROUP BY 1"
+            )
+            con.execute(
+                f"CREATE VIEW checkm AS SELECT * FROM read_csv_auto('{tables / 'df_checkm.csv'}')"
+            )
+
+        # a full build is needed without the state of a previous build
+        self.assertIsNone(update_database(self.bgcflow_dir, "project"))
+        record_database_state(self.bgcflow_dir, "project")
+        self.assertEqual(
+            update_database(self.bgcflow_dir, "project"),
+            {"tables": [], "merged": {}, "select": []},
+        )
+
+        def update(returncode=0):
+            with mock.patch("bgcflow.database.subprocess.run") as run:
+                run.return_value.returncode = returncode
+                run.return_value.stdout = run.return_value.stderr = ""
+                return update_database(self.bgcflow_dir, "project"), run
+
+        def rows():
+            with duckdb.connect(str(self.duckdb_path), read_only=True) as con:
+                return con.execute(
+                    "SELECT genome_id, contigs FROM seqfu_stats ORDER BY 1"
+                ).fetchall()
+
+        # the rows of the changed genomes are merged into the table loaded from the CSV, whatever
+        # their names, and only the tables built from it are rebuilt by dbt
+        write_seqfu_table(
+            self.report_dir,
+            [("g1", "Streptomyces", 10), ("g2", "Bacillus", 4), ("g3", "Bacillus", 1)],
+        )
+        result, run = update()
+        self.assertEqual(
+            result,
+            {
+                "tables": ["tables/df_seqfu_stats.csv"],
+                "merged": {"seqfu_stats": {"updated": 2, "removed": 0}},
+                "select": ["genus_summary"],
+            },
+        )
+        self.assertEqual(rows(), [("g1", 10), ("g2", 4), ("g3", 1)])
+        self.assertEqual(
+            run.call_args.args[0], ["dbt", "build", "--select", "genus_summary"]
+        )
+        self.assertEqual(run.call_args.kwargs["cwd"], dbt_dir)
+        result, run = update()
+        self.assertEqual(result["tables"], [])
+        run.assert_not_called()
+
+        write_seqfu_table(
+            self.report_dir, [("g2", "Bacillus", 4), ("g3", "Bacillus", 1)]
+        )
+        result, _ = update()
+        self.assertEqual(result["merged"]["seqfu_stats"], {"updated": 0, "removed": 1})
+        self.assertEqual(rows(), [("g2", 4), ("g3", 1)])
+
+        # views read the result table and need no update
+        (tables / "df_checkm.csv").write_text("genome_id,completeness\ng1,98\n")
+        result, run = update()
+        self.assertEqual(result["merged"], {})
+        run.assert_not_called()
+
+        # a failed dbt build needs a full build
+        write_seqfu_table(self.report_dir, [("g2", "Bacillus", 5)])
+        result, _ = update(returncode=1)
+        self.assertIsNone(result)
+
+        # a changed table that no dbt node reads needs a full build
+        (tables / "df_gtdb.csv").write_text("genome_id,genus\ng1,Bacillus\n")
+        result, run = update()
+        self.assertIsNone(result)
+        run.assert_not_called()
+
+    def test_export_parquet(self):
+        with duckdb.connect(str(self.duckdb_path)) as con:
+            con.execute("CREATE VIEW genome_ids AS SELECT genome_id FROM seqfu_stats")
+        output_dir = self.bgcflow_dir / "export"
+        results = export_parquet(self.bgcflow_dir, "project", output_dir, workers=2)
+        self.assertEqual(results, {"genome_ids": "exported", "seqfu_stats": "exported"})
+        self.assertTrue(
+            (output_dir / "seqfu_stats/project=project/genus=Bacillus").is_dir()
+        )
+        self.assertTrue((output_dir / "genome_ids/project=project").is_dir())
+        with duckdb.connect() as con:
+            rows = con.execute(
+                "SELECT genome_id, genus, project FROM read_parquet(?, hive_partitioning=true) ORDER BY 1",
+                [str(output_dir / "seqfu_stats/**/*.parquet")],
+            ).fetchall()
+        self.assertEqual(
+            rows, [("g1", "Streptomyces", "project"), ("g2", "Bacillus", "project")]
+        )
+
+        results = export_parquet(self.bgcflow_dir, "project", output_dir)
+        self.assertEqual(results, {"genome_ids": "skipped", "seqfu_stats": "skipped"})
+        with duckdb.connect(str(self.duckdb_path)) as con:
+            con.execute("UPDATE seqfu_stats SET contigs = 11 WHERE genome_id = 'g1'")
+        results = export_parquet(self.bgcflow_dir, "project", output_dir)
+        self.assertEqual(results, {"genome_ids": "skipped", "seqfu_stats": "exported"})
+        self.assertEqual(
+            sorted(p.name for p in output_dir.iterdir()),
+            [".bgcflow_export.json", "genome_ids", "seqfu_stats"],
+        )
+
+        # duplicate rows change the fingerprint of a table
+        with duckdb.connect(str(self.duckdb_path)) as con:
+            con.execute("DROP VIEW genome_ids")
+            con.execute(
+                "UPDATE seqfu_stats SET genome_id = 'g1', genus = 'Bacillus', contigs = 1"
+            )
+        results = export_parquet(self.bgcflow_dir, "project", output_dir)
+        self.assertEqual(results, {"seqfu_stats": "exported"})
+        with duckdb.connect(str(self.duckdb_path)) as con:
+            con.execute("UPDATE seqfu_stats SET genome_id = 'g2'")
+        results = export_parquet(self.bgcflow_dir, "project", output_dir)
+        self.assertEqual(results, {"seqfu_stats": "exported"})
+
+    def test_query_database(self):
+        sql = "SELECT genome_id, contigs FROM seqfu_stats ORDER BY genome_id"
+
+        def run(output_format):
+            output = io.StringIO()
+            n_rows = query_database(
+                self.bgcflow_dir, "project", sql, output, output_format, batch_size=1
+            )
+            self.assertEqual(n_rows, 2)
+            return output.getvalue()
+
+        table = run("table").splitlines()
+        self.assertEqual(table[0].split(" | "), ["genome_id", "contigs"])
+        self.assertEqual(table[3].split(), ["g2", "|", "3"])
+        self.assertEqual(
+            run("csv").splitlines(), ["genome_id,contigs", "g1,10", "g2,3"]
+        )
+        self.assertEqual(
+            [json.loads(line) for line in run("json").splitlines()],
+            [{"genome_id": "g1", "contigs": 10}, {"genome_id": "g2", "contigs": 3}],
+        )
+
+        # the database is opened read-only
+        with self.assertRaises(duckdb.Error):
+            query_database(
+                self.bgcflow_dir, "project", "DROP TABLE seqfu_stats", io.StringIO()
+            )
+
+    @unittest.skipIf(importlib.util.find_spec("pyarrow") is None, "requires pyarrow")
+    def test_query_arrow(self):
+        import pyarrow as pa
+
+        output = io.BytesIO()
+        sql = "SELECT contigs FROM seqfu_stats ORDER BY genome_id"
+        query_database(self.bgcflow_dir, "project", sql, output, "arrow")
+        arrow = pa.ipc.open_stream(output.getvalue()).read_all()
+        self.assertEqual(arrow.column("contigs").to_pylist(), [10, 3])
+
+    def tearDown(self):
+        shutil.rmtree(self.bgcflow_dir)
+
+
+class TestCatalog(unittest.TestCase):
+    def setUp(self):
+        self.bgcflow_dir = Path(tempfile.mkdtemp())
+        make_project_database(self.bgcflow_dir, "project_a", [("g1", "Bacillus", 1)])
+        _, self.duckdb_path = make_project_database(
+            self.bgcflow_dir, "project_b", [("g2", "Nocardia", 2)]
+        )
+
+    def query(self, sql):
+        with connect_catalog(self.bgcflow_dir) as con:
+            return con.execute(sql).fetchall()
+
+    def test_catalog(self):
+        projects = ["project_a", "project_b", "missing"]
+        summary = refresh_catalog(self.bgcflow_dir, projects)
+        self.assertEqual(summary["added"], ["project_a", "project_b"])
+        self.assertEqual(summary["views"], ["seqfu_stats"])
+        self.assertEqual(
+            self.query("SELECT project, genome_id FROM seqfu_stats ORDER BY 1"),
+            [("project_a", "g1"), ("project_b", "g2")],
+        )
+
+        summary = refresh_catalog(self.bgcflow_dir, projects)
+        self.assertEqual(summary["unchanged"], ["project_a", "project_b"])
+        self.assertEqual(summary["views"], [])
+
+        with duckdb.connect(str(self.duckdb_path)) as con:
+            con.execute("CREATE TABLE checkm AS SELECT 'g2' AS genome_id, 99 AS score")
+        summary = refresh_catalog(self.bgcflow_dir, projects)
+        self.assertEqual(summary["updated"], ["project_b"])
+        self.assertEqual(summary["views"], ["checkm", "seqfu_stats"])
+        self.assertEqual(self.query("SELECT * FROM checkm"), [("project_b", "g2", 99)])
+
+        summary = refresh_catalog(self.bgcflow_dir, ["project_a"])
+        self.assertEqual(summary["removed"], ["project_b"])
+        self.assertEqual(self.query("SELECT count(*) FROM seqfu_stats"), [(1,)])
+        with self.assertRaises(duckdb.Error):
+            self.query("SELECT * FROM checkm")
+
+    def tearDown(self):
+        shutil.rmtree(self.bgcflow_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
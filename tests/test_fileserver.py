@@ -0,0 +1,129 @@
+import gzip
+import shutil
+import tempfile
+import threading
+import unittest
+from functools import partial
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+from bgcflow.fileserver import LRUCache, ReportRequestHandler, load_table, table_size
+
+
+class TestReportFileServer(unittest.TestCase):
+    def setUp(self):
+        self.report_dir = Path(tempfile.mkdtemp())
+        self.content = b"0123456789" * 100
+        (self.report_dir / "network.json").write_bytes(self.content)
+        with gzip.open(self.report_dir / "network.json.gz", "wb") as f:
+            f.write(self.content)
+        (self.report_dir / "tables").mkdir()
+        (self.report_dir / "tables/genomes.csv").write_text(
+            "genome_id,genus,strain\n"
+            + "".join(
+                f"genome{i},{'Streptomyces' if i % 2 else 'Nocardia'},s{i}\n"
+                for i in range(250)
+            )
+        )
+        handler = partial(ReportRequestHandler, directory=str(self.report_dir))
+        self.httpd = ThreadingHTTPServer(("localhost", 0), handler)
+        self.url = f"http://localhost:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def test_range(self):
+        response = requests.get(
+            f"{self.url}/network.json", headers={"Range": "bytes=10-19"}
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.content[10:20])
+        self.assertEqual(response.headers["Content-Range"], "bytes 10-19/1000")
+
+        response = requests.get(
+            f"{self.url}/network.json", headers={"Range": "bytes=-5"}
+        )
+        self.assertEqual(response.content, self.content[-5:])
+
+        response = requests.get(
+            f"{self.url}/network.json", headers={"Range": "bytes=2000-"}
+        )
+        self.assertEqual(response.status_code, 416)
+
+    def test_validation(self):
+        response = requests.get(
+            f"{self.url}/network.json", headers={"Accept-Encoding": "identity"}
+        )
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        last_modified = response.headers["Last-Modified"]
+
+        response = requests.get(
+            f"{self.url}/network.json",
+            headers={"Accept-Encoding": "identity", "If-None-Match": etag},
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = requests.get(
+            f"{self.url}/network.json",
+            headers={"Accept-Encoding": "identity", "If-Modified-Since": last_modified},
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_precompressed(self):
+        response = requests.get(
+            f"{self.url}/network.json", headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Content-Type"], "application/json")
+        self.assertEqual(response.content, self.content)
+
+    def test_table_endpoint(self):
+        response = requests.get(
+            f"{self.url}/api/table",
+            params={
+                "path": "tables/genomes.csv",
+                "start": 10,
+                "length": 5,
+                "sort": "strain",
+                "order": "desc",
+                "search": "streptomyces",
+                "columns": "genome_id,strain",
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual(page["total"], 250)
+        self.assertEqual(page["filtered"], 125)
+        self.assertEqual(page["columns"], ["genome_id", "strain"])
+        self.assertEqual(len(page["rows"]), 5)
+        self.assertEqual(page["rows"][0], ["genome81", "s81"])
+
+        response = requests.get(
+            f"{self.url}/api/table",
+            params={"path": "tables/genomes.csv", "sort": "unknown"},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_table_cache_limit(self):
+        genomes = self.report_dir / "tables/genomes.csv"
+        other = self.report_dir / "tables/other.csv"
+        shutil.copy(genomes, other)
+        one_table = table_size(load_table(genomes, LRUCache(0)))
+        cache = LRUCache(int(one_table * 1.5))
+        df, _ = load_table(genomes, cache)
+        self.assertIs(load_table(genomes, cache)[0], df)
+        # the second table evicts the least recently used one
+        load_table(other, cache)
+        self.assertEqual(len(cache.items), 1)
+        self.assertLessEqual(cache.size, cache.max_bytes)
+        self.assertIsNot(load_table(genomes, cache)[0], df)
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        shutil.rmtree(self.report_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
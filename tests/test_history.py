@@ -0,0 +1,291 @@
+import base64
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import yaml
+
+from bgcflow.bgcflow import snakemake_wrapper
+from bgcflow.history import (
+    estimate_run,
+    find_new_records,
+    get_genome_targets,
+    get_project_plan,
+    read_history,
+    record_output_sizes,
+    recording_output_sizes,
+)
+
+
+def write_record(bgcflow_dir, output, rule, duration, inputs=(), size=100):
+    """Write an output file and the Snakemake metadata record of the job that made it."""
+    (bgcflow_dir / output).parent.mkdir(parents=True, exist_ok=True)
+    (bgcflow_dir / output).write_bytes(b"x" * size)
+    record = {
+        "rule": rule,
+        "job_hash": hash((rule, output)),
+        "starttime": 1000.0,
+        "endtime": 1000.0 + duration,
+        "input": list(inputs),
+        "incomplete": False,
+    }
+    metadata_dir = bgcflow_dir / ".snakemake/metadata"
+    metadata_dir.mkdir(parents=True, exist_ok=True)
+    name = base64.urlsafe_b64encode(output.encode()).decode()
+    (metadata_dir / name).write_text(json.dumps(record))
+
+
+def make_bgcflow_history(bgcflow_dir, genome_ids, rules):
+    """Create a BGCFlow directory with one PEP project and the history of a previous run."""
+    (bgcflow_dir / "workflow/rules").mkdir(parents=True)
+    (bgcflow_dir / "workflow/rules.yaml").write_text(
+        "prokka:\n  description: prokka\nbigscape:\n  description: bigscape\n"
+    )
+    (bgcflow_dir / "workflow/rules/prokka.smk").write_text(
+        "rule prokka:\n"
+        "  output:\n"
+        "    gbk='data/interim/prokka/{strains}/{strains}.gbk',\n"
+        "    gff=temp('data/interim/prokka/{strains}/{strains}_genomic.gff'),\n"
+        "    copy='data/processed/{name}/genbank/{strains}.gbk',\n"
+        "  log: 'logs/prokka/{strains}.log'\n"
+        "  shell: ''\n"
+    )
+    (bgcflow_dir / "workflow/rules/bigscape.smk").write_text(
+        "rule bigscape:\n"
+        "  output: directory('data/interim/bigscape/{name}')\n"
+        "  shell: ''\n\n"
+        "rule copy_bigscape:\n"
+        "  shell: ''\n"
+    )
+    project_dir = bgcflow_dir / "config/project"
+    project_dir.mkdir(parents=True)
+    (project_dir / "samples.csv").write_text(
+        "genome_id,source\n" + "".join(f"{g},ncbi\n" for g in genome_ids)
+    )
+    pep = {"name": "project", "sample_table": "samples.csv", "rules": rules}
+    with open(project_dir / "project_config.yaml", "w") as f:
+        yaml.dump(pep, f)
+    config = {
+        "projects": [{"name": "config/project/project_config.yaml"}],
+        "rules": {"prokka": "TRUE"},
+    }
+    with open(bgcflow_dir / "config/config.yaml", "w") as f:
+        yaml.dump(config, f)
+
+    gbks = []
+    for genome_id, duration in [("g1", 10), ("g2", 20)]:
+        gbks.append(f"data/interim/prokka/{genome_id}/{genome_id}.gbk")
+        write_record(bgcflow_dir, gbks[-1], "prokka", duration)
+    write_record(
+        bgcflow_dir,
+        "data/interim/bigscape/project/index.html",
+        "bigscape",
+        60,
+        inputs=gbks,
+        size=1000,
+    )
+
+
+class TestEstimate(unittest.TestCase):
+    def setUp(self):
+        self.bgcflow_dir = Path(tempfile.mkdtemp())
+        make_bgcflow_history(
+            self.bgcflow_dir,
+            ["g1", "g2", "g3"],
+            {"prokka": "FALSE", "bigscape": "TRUE", "checkm": True},
+        )
+
+    def test_project_plan(self):
+        plan = get_project_plan(self.bgcflow_dir)
+        self.assertEqual(
+            plan,
+            {
+                "project": {
+                    "genome_ids": ["g1", "g2", "g3"],
+                    "rules": ["bigscape", "checkm"],
+                }
+            },
+        )
+        self.assertEqual(len(read_history(self.bgcflow_dir)), 3)
+
+    def test_estimate_run(self):
+        estimate = estimate_run(self.bgcflow_dir, cores=2)
+        # prokka runs upstream of bigscape, once per genome
+        self.assertEqual(
+            estimate["rules"],
+            {
+                "prokka": {"jobs": 3, "duration": 15, "size": 300, "temporary": False},
+                "bigscape": {
+                    "jobs": 1,
+                    "duration": 60,
+                    "size": 1000,
+                    "temporary": False,
+                },
+            },
+        )
+        self.assertEqual(estimate["without_history"], ["checkm", "copy_bigscape"])
+        self.assertEqual(estimate["critical_path"], [("prokka", 15), ("bigscape", 60)])
+        self.assertEqual(estimate["work"], 105)
+        # 30 seconds of work off the critical path are shared by 2 cores
+        self.assertEqual(estimate["runtime"], 90)
+        self.assertEqual(estimate["disk"], 1300)
+        self.assertEqual(estimate["on_disk"], 1200)
+
+    def test_temporary_outputs(self):
+        record_output_sizes(self.bgcflow_dir)
+        # snakemake deletes the temp() outputs of prokka once bigscape finished
+        for genome_id in ["g1", "g2"]:
+            shutil.rmtree(self.bgcflow_dir / f"data/interim/prokka/{genome_id}")
+        estimate = estimate_run(self.bgcflow_dir, cores=2)
+        self.assertEqual(
+            estimate["rules"]["prokka"],
+            {"jobs": 3, "duration": 15, "size": 300, "temporary": True},
+        )
+        self.assertEqual(estimate["disk"], 1300)
+        self.assertEqual(estimate["temporary_disk"], 300)
+        self.assertEqual(estimate["on_disk"], 1000)
+        self.assertEqual(estimate["unmeasured"], [])
+
+        (self.bgcflow_dir / ".snakemake/bgcflow_output_sizes.json").unlink()
+        estimate = estimate_run(self.bgcflow_dir, cores=2)
+        self.assertEqual(estimate["unmeasured"], ["prokka"])
+
+    def test_recording_output_sizes(self):
+        output = "data/interim/checkm/g3/g3.txt"
+        with recording_output_sizes(self.bgcflow_dir, interval=0.1):
+            write_record(self.bgcflow_dir, output, "checkm", 5, size=42)
+            time.sleep(0.5)
+            (self.bgcflow_dir / output).unlink()
+        sizes = json.loads(
+            (self.bgcflow_dir / ".snakemake/bgcflow_output_sizes.json").read_text()
+        )
+        # only the outputs of the jobs finished during the run are measured
+        self.assertEqual(sizes, {output: 42})
+
+    def test_find_new_records(self):
+        metadata_dir = self.bgcflow_dir / ".snakemake/metadata"
+        seen = {}
+        self.assertGreater(len(find_new_records(metadata_dir, seen)), 0)
+        self.assertEqual(find_new_records(metadata_dir, seen), [])
+
+        # snakemake replaces a record by renaming a new file over it
+        output = "data/interim/prokka/g1/g1.gbk"
+        name = base64.urlsafe_b64encode(output.encode()).decode()
+        (metadata_dir / "tmp_record").write_text("{}")
+        os.replace(metadata_dir / "tmp_record", metadata_dir / name)
+        self.assertEqual(find_new_records(metadata_dir, seen), [metadata_dir / name])
+        self.assertEqual(find_new_records(metadata_dir, seen), [])
+
+    def test_genome_targets(self):
+        targets = get_genome_targets(self.bgcflow_dir, ["g3"])
+        # bigscape runs once per project, so it has no output of its own for g3
+        self.assertEqual(targets["targets"], [])
+        self.assertEqual(targets["without_history"], ["checkm", "copy_bigscape"])
+
+        with open(self.bgcflow_dir / "config/project/project_config.yaml", "w") as f:
+            yaml.dump({"name": "project", "rules": {"prokka": True}}, f)
+        targets = get_genome_targets(self.bgcflow_dir, ["g1", "g3"])
+        self.assertEqual(
+            targets["targets"],
+            ["data/interim/prokka/g1/g1.gbk", "data/interim/prokka/g3/g3.gbk"],
+        )
+        with self.assertRaises(ValueError):
+            get_genome_targets(self.bgcflow_dir, ["g9"])
+
+        (self.bgcflow_dir / "workflow/Snakefile").write_text("")
+        kwargs = {
+            "bgcflow_dir": str(self.bgcflow_dir),
+            "workflow": "workflow/Snakefile",
+            "monitor_on": False,
+            "wms_monitor": None,
+            "cores": 1,
+            "dryrun": True,
+            "unlock": False,
+            "until": None,
+            "profile": None,
+            "touch": False,
+            "antismash_mode": "bacteria",
+            "genome": "g3",
+        }
+        with mock.patch("bgcflow.bgcflow.subprocess.call") as call:
+            snakemake_wrapper(**kwargs)
+        self.assertTrue(
+            call.call_args.args[0].endswith("data/interim/prokka/g3/g3.gbk")
+        )
+
+    def test_genome_targets_without_rule(self):
+        with open(self.bgcflow_dir / "config/project/project_config.yaml", "w") as f:
+            yaml.dump(
+                {
+                    "name": "project",
+                    "sample_table": "samples.csv",
+                    "rules": {"prokka": True},
+                },
+                f,
+            )
+        for output in [
+            "data/interim/prokka/g1/g1_genomic.gff",
+            # no rule output matches the logs and the table of both genomes
+            "logs/prokka/g1/g1_stderr.txt",
+            "data/interim/prokka/g1_g2.tsv",
+        ]:
+            write_record(self.bgcflow_dir, output, "prokka", 1)
+        with self.assertLogs(level="WARNING"):
+            targets = get_genome_targets(self.bgcflow_dir, ["g3"])
+        self.assertEqual(
+            targets["targets"],
+            ["data/interim/prokka/g3/g3.gbk", "data/interim/prokka/g3/g3_genomic.gff"],
+        )
+        self.assertEqual(targets["skipped"], ["logs/prokka/g3/g3_stderr.txt"])
+
+    def test_genome_targets_of_two_projects(self):
+        with open(self.bgcflow_dir / "config/project/project_config.yaml", "w") as f:
+            yaml.dump(
+                {
+                    "name": "project",
+                    "sample_table": "samples.csv",
+                    "rules": {"prokka": True},
+                },
+                f,
+            )
+        project_b = self.bgcflow_dir / "config/project_b"
+        project_b.mkdir()
+        (project_b / "samples.csv").write_text("genome_id,source\ng4,ncbi\n")
+        with open(project_b / "project_config.yaml", "w") as f:
+            yaml.dump({"name": "project_b", "rules": {"prokka": True}}, f)
+        with open(self.bgcflow_dir / "config/config.yaml", "w") as f:
+            yaml.dump(
+                {
+                    "projects": [
+                        {"name": "config/project/project_config.yaml"},
+                        {"name": "config/project_b/project_config.yaml"},
+                    ]
+                },
+                f,
+            )
+        write_record(
+            self.bgcflow_dir, "data/processed/project/genbank/g1.gbk", "prokka", 1
+        )
+
+        # the genome of project_b gets no output in the directory of the other project
+        targets = get_genome_targets(self.bgcflow_dir, ["g3", "g4"])
+        self.assertEqual(
+            targets["targets"],
+            [
+                "data/interim/prokka/g3/g3.gbk",
+                "data/interim/prokka/g4/g4.gbk",
+                "data/processed/project/genbank/g3.gbk",
+            ],
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.bgcflow_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import shutil
+import tempfile
+import threading
+import unittest
+from functools import partial
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from bgcflow.hub import HubRequestHandler, ReportHub
+from bgcflow.mkdocs import build_static_report
+from tests.test_mkdocs_report import make_report_project
+
+
+class TestReportHub(unittest.TestCase):
+    def setUp(self):
+        self.bgcflow_dir = Path(tempfile.mkdtemp())
+        make_report_project(self.bgcflow_dir, "project_a")
+        make_report_project(self.bgcflow_dir, "project_b")
+        self.httpd = ThreadingHTTPServer(("localhost", 0), None)
+        self.url = f"http://localhost:{self.httpd.server_address[1]}"
+        self.hub = ReportHub(
+            self.bgcflow_dir, ["project_a", "project_b", "missing"], "", 1024**2
+        )
+        self.httpd.RequestHandlerClass = partial(
+            HubRequestHandler, hub=self.hub, directory=str(self.bgcflow_dir)
+        )
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def test_hub(self):
+        response = requests.get(self.url)
+        self.assertIn("project_a", response.text)
+        self.assertIn("missing</a> (no results)", response.text)
+        self.assertEqual(self.hub.sites, {})
+
+        response = requests.get(f"{self.url}/project_a/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("project_a", self.hub.sites)
+        self.assertNotIn("project_b", self.hub.sites)
+
+        response = requests.get(f"{self.url}/project_b/antismash/")
+        self.assertEqual(response.status_code, 200)
+        # result files are linked relative to the host the client reached the hub at
+        self.assertIn(
+            'file_server = "/_files/project_b"',
+            (self.hub.sites["project_b"].parent / "main.py").read_text(),
+        )
+
+        response = requests.get(
+            f"{self.url}/_files/project_b/metadata/dependency_versions.json"
+        )
+        self.assertEqual(response.json(), {"antismash": "7.1.0"})
+
+        response = requests.get(f"{self.url}/unknown/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_shared_memory_budget(self):
+        tables_dir = self.hub.report_dir("project_a") / "tables"
+        tables_dir.mkdir()
+        (tables_dir / "genomes.csv").write_text(
+            "genome_id,genus\n" + "".join(f"g{i},Streptomyces\n" for i in range(100))
+        )
+        self.hub.cache.max_bytes = 64 * 1024
+        requests.get(f"{self.url}/project_a/")
+        response = requests.get(
+            f"{self.url}/_files/project_a/api/table",
+            params={"path": "tables/genomes.csv"},
+        )
+        self.assertEqual(response.json()["total"], 100)
+        kinds = {key[0] for key in self.hub.cache.items}
+        self.assertEqual(kinds, {"file", "table"})
+        self.assertLessEqual(self.hub.cache.size, self.hub.cache.max_bytes)
+
+    def test_failed_build(self):
+        with mock.patch(
+            "bgcflow.hub.build_static_report", side_effect=RuntimeError("broken")
+        ) as build:
+            for _ in range(2):
+                response = requests.get(f"{self.url}/project_a/")
+                self.assertEqual(response.status_code, 404)
+            self.assertEqual(build.call_count, 1)
+            self.assertIn("build failed", requests.get(self.url).text)
+
+            # the build is retried once the report inputs changed
+            (self.hub.report_dir("project_a") / "docs/seqfu.md").write_text("# fixed\n")
+            requests.get(f"{self.url}/project_a/")
+            self.assertEqual(build.call_count, 2)
+
+    @mock.patch("bgcflow.hub.build_check_interval", 0)
+    def test_rebuild_on_change(self):
+        with mock.patch(
+            "bgcflow.hub.build_static_report", wraps=build_static_report
+        ) as build:
+            requests.get(f"{self.url}/project_a/")
+            requests.get(f"{self.url}/project_a/seqfu/")
+            self.assertEqual(build.call_count, 1)
+
+            (self.hub.report_dir("project_a") / "docs/seqfu.md").write_text(
+                "# seqfu\nupdated\n"
+            )
+            response = requests.get(f"{self.url}/project_a/seqfu/")
+            self.assertEqual(build.call_count, 2)
+            self.assertIn("updated", response.text)
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        shutil.rmtree(self.bgcflow_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,299 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urlsplit
+
+from dbtmetabase.models.interface import DbtInterface
+
+from bgcflow.metabase import (
+    MetabaseClient,
+    sync_dbt_models_to_metabase,
+    sync_projects_to_metabase,
+    upload_dbt_to_metabase,
+)
+from tests.test_mkdocs_report import make_report_project
+
+
+class MockMetabase(object):
+    """A minimal in-memory Metabase API."""
+
+    def __init__(self):
+        self.tokens = set()
+        self.logins = 0
+        self.databases = {}
+        self.tables = []
+        # tables that appear once a rescan of the database finished
+        self.new_tables = []
+        self.syncing = False
+        self.stale_polls = 0
+        self.requests = []
+        self.lock = threading.Lock()
+
+
+class MockMetabaseHandler(BaseHTTPRequestHandler):
+    metabase = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def handle_request(self, method):
+        mb = self.metabase
+        path = urlsplit(self.path).path
+        payload = self.read_json()
+        with mb.lock:
+            mb.requests.append((method, path))
+            if method == "POST" and path == "/api/session":
+                if payload.get("password") != "secret":
+                    return self.send_json(401, {"message": "bad credentials"})
+                mb.logins += 1
+                token = f"token-{mb.logins}"
+                mb.tokens.add(token)
+                return self.send_json(200, {"id": token})
+            if self.headers.get("X-Metabase-Session") not in mb.tokens:
+                return self.send_json(401, {"message": "Unauthenticated"})
+            if path == "/api/user/current":
+                return self.send_json(200, {"email": "user@example.com"})
+            if method == "GET" and path == "/api/database":
+                return self.send_json(200, {"data": list(mb.databases.values())})
+            if method == "POST" and path == "/api/database":
+                database_id = len(mb.databases) + 1
+                mb.databases[database_id] = {"id": database_id, **payload}
+                return self.send_json(200, mb.databases[database_id])
+            if method == "POST" and path.endswith("/sync_schema"):
+                # a rescan finishes after the next metadata request
+                mb.syncing = True
+                mb.stale_polls = 1
+                return self.send_json(200, {"status": "ok"})
+            if method == "GET" and path.endswith("/metadata"):
+                if mb.syncing and mb.stale_polls > 0:
+                    mb.stale_polls -= 1
+                elif mb.syncing and path.startswith("/api/database/"):
+                    mb.tables += mb.new_tables
+                    mb.new_tables = []
+                    mb.syncing = False
+                return self.send_json(200, {"tables": mb.tables})
+            if method == "PUT" and path.startswith(("/api/table/", "/api/field/")):
+                return self.send_json(200, payload)
+            if method == "PUT" and path.startswith("/api/database/"):
+                database_id = int(path.split("/")[-1])
+                mb.databases[database_id].update(payload)
+                return self.send_json(200, mb.databases[database_id])
+        self.send_json(404, {"message": "not found"})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+
+def start_mock_metabase():
+    """Start a mock Metabase server in a background thread."""
+    metabase = MockMetabase()
+    handler = type("Handler", (MockMetabaseHandler,), {"metabase": metabase})
+    httpd = ThreadingHTTPServer(("localhost", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, metabase, f"http://localhost:{httpd.server_address[1]}"
+
+
+def write_dbt_project(dbt_dir, genomes_description="Genomes"):
+    """Write the schema and manifest of a dbt project with two models and a relationships test."""
+    (dbt_dir / "models").mkdir(parents=True, exist_ok=True)
+    schema = {
+        "models": [
+            {
+                "name": name,
+                "description": description,
+                "columns": [{"name": "genome_id", "description": "Genome"}],
+            }
+            for name, description in [
+                ("genomes", genomes_description),
+                ("checkm", "CheckM"),
+            ]
+        ]
+    }
+    with open(dbt_dir / "models/schema.yml", "w") as f:
+        json.dump(schema, f)
+    manifest = {
+        "nodes": {
+            "model.bgcflow.genomes": {
+                "resource_type": "model",
+                "name": "genomes",
+                "description": genomes_description,
+                "columns": {"genome_id": {"name": "genome_id", "description": ""}},
+            },
+            "model.bgcflow.checkm": {
+                "resource_type": "model",
+                "name": "checkm",
+                "description": "CheckM",
+                "columns": {"genome_id": {"name": "genome_id", "description": ""}},
+            },
+            "test.bgcflow.relationships_checkm": {
+                "resource_type": "test",
+                "column_name": "genome_id",
+                "test_metadata": {
+                    "name": "relationships",
+                    "kwargs": {"to": "ref('genomes')", "field": "genome_id"},
+                },
+                "depends_on": {"nodes": ["model.bgcflow.checkm"]},
+            },
+        }
+    }
+    (dbt_dir / "target").mkdir(parents=True, exist_ok=True)
+    with open(dbt_dir / "target/manifest.json", "w") as f:
+        json.dump(manifest, f)
+
+
+class TestMetabaseClient(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.token_cache = self.tmp_dir / "cache/metabase_sessions.json"
+        self.httpd, self.metabase, self.url = start_mock_metabase()
+
+    def client(self, password="secret"):
+        return MetabaseClient(
+            self.url, "user", password, token_cache=self.token_cache, backoff=0
+        )
+
+    def test_token_cache(self):
+        self.assertEqual(self.client().list_databases(), [])
+        self.assertEqual(self.metabase.logins, 1)
+        self.assertEqual(os.stat(self.token_cache).st_mode & 0o777, 0o600)
+
+        # a new client reuses the cached token without the password
+        self.client(password=None).list_databases()
+        self.assertEqual(self.metabase.logins, 1)
+
+        # an expired token is replaced
+        self.metabase.tokens.clear()
+        self.client().list_databases()
+        self.assertEqual(self.metabase.logins, 2)
+
+    def test_upload(self):
+        dbt_dir = self.tmp_dir / "dbt"
+        dbt_dir.mkdir()
+        (dbt_dir / "dbt_bgcflow.duckdb").write_text("")
+        client = self.client()
+        status, token = upload_dbt_to_metabase("project", ".", dbt_dir, client)
+        self.assertEqual(status, 200)
+        self.assertEqual(token, "token-1")
+        self.assertEqual(self.metabase.databases[1]["name"], "project")
+
+    @mock.patch("bgcflow.metabase.sync_dbt_models_to_metabase")
+    def test_sync_projects(self, sync_models):
+        for project_name in ["project_a", "project_b"]:
+            report_dir = make_report_project(self.tmp_dir, project_name)
+            dbt_dir = report_dir / "dbt/antiSMASH_7.1.0"
+            dbt_dir.mkdir(parents=True)
+            (dbt_dir / "dbt_bgcflow.duckdb").write_text("")
+        self.metabase.databases[1] = {"id": 1, "name": "project_a"}
+
+        with mock.patch("bgcflow.metabase.token_cache_path", self.token_cache):
+            results = sync_projects_to_metabase(
+                ["project_a", "project_b", "missing"],
+                self.tmp_dir,
+                self.url,
+                "user",
+                "secret",
+                workers=3,
+                if_exists="skip",
+            )
+        self.assertEqual(results["project_a"]["status"], "skipped")
+        self.assertEqual(results["project_b"]["status"], "synced")
+        self.assertEqual(results["missing"]["status"], "failed")
+        self.assertEqual(sync_models.call_count, 1)
+        self.assertEqual(sync_models.call_args.kwargs["metabase_session_id"], "token-1")
+        self.assertEqual(self.metabase.logins, 1)
+        self.assertEqual(self.metabase.requests.count(("GET", "/api/database")), 1)
+
+    def test_incremental_model_sync(self):
+        dbt_dir = self.tmp_dir / "dbt"
+        write_dbt_project(dbt_dir)
+        self.metabase.databases[1] = {"id": 1, "name": "project"}
+        self.metabase.new_tables = [
+            {
+                "id": table_id,
+                "name": name,
+                "schema": "main",
+                "fields": [
+                    {"id": table_id, "name": "genome_id", "fk_target_field_id": None}
+                ],
+            }
+            for table_id, name in [(1, "genomes"), (2, "checkm")]
+        ]
+        client = self.client()
+        read_models = mock.patch(
+            "dbtmetabase.models.interface.DbtInterface.read_models",
+            autospec=True,
+            side_effect=DbtInterface.read_models,
+        )
+
+        def sync(full_sync=False):
+            return sync_dbt_models_to_metabase(
+                dbt_dir,
+                "dbt_bgcflow",
+                self.url,
+                "project",
+                "user",
+                None,
+                full_sync=full_sync,
+                client=client,
+            )
+
+        with read_models as parse:
+            # the tables are unknown, so the database is rescanned until they appear
+            self.assertEqual(sorted(sync()), ["checkm", "genomes"])
+            self.assertIn(
+                ("POST", "/api/database/1/sync_schema"), self.metabase.requests
+            )
+            self.assertIn(("PUT", "/api/table/1"), self.metabase.requests)
+            self.assertEqual(sync(), {})
+            write_dbt_project(dbt_dir, genomes_description="All genomes")
+            self.metabase.requests.clear()
+            self.assertEqual(list(sync()), ["genomes"])
+            # only the table of the changed model is rescanned
+            sync_requests = [r for r in self.metabase.requests if "sync" in r[1]]
+            self.assertEqual(sync_requests, [("POST", "/api/table/1/sync_schema")])
+            self.assertEqual(sorted(sync(full_sync=True)), ["checkm", "genomes"])
+        # the project is parsed again only after its model files changed
+        self.assertEqual(parse.call_count, 2)
+        self.assertEqual(self.metabase.logins, 1)
+
+    def test_wait_for_schema(self):
+        self.metabase.databases[1] = {"id": 1, "name": "project"}
+        client = self.client()
+        with self.assertRaises(TimeoutError):
+            client.wait_for_schema(1, lambda m: False, timeout=0.3, delay=0.05)
+        polls = self.metabase.requests.count(("GET", "/api/database/1/metadata"))
+        # 0.05 + 0.1 seconds of backoff fit in the timeout, the next 0.2 do not
+        self.assertEqual(polls, 3)
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+import importlib.util
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+from jinja2 import Template
+
+from bgcflow.mkdocs import (
+    build_static_report,
+    get_page_output,
+    macros_template,
+    prepare_mkdocs_report,
+    run_for_projects,
+)
+
+
+def make_report_project(bgcflow_dir, project_name="test_project"):
+    """Create a minimal BGCFlow report directory."""
+    report_dir = bgcflow_dir / f"data/processed/{project_name}"
+    (report_dir / "metadata").mkdir(parents=True)
+    (report_dir / "docs").mkdir(parents=True)
+    project_metadata = {
+        project_name: {
+            "description": "Test project description",
+            "sample_size": 2,
+            "references": ["reference 1"],
+            "bgcflow_version": "0.8.0",
+            "rule_used": {
+                "antismash": {"category": "Genome Mining", "description": "antiSMASH"},
+                "seqfu": {"category": "Quality Control", "description": "seqfu"},
+            },
+        }
+    }
+    with open(report_dir / "metadata/project_metadata.json", "w") as f:
+        json.dump(project_metadata, f)
+    with open(report_dir / "metadata/dependency_versions.json", "w") as f:
+        json.dump({"antismash": "7.1.0"}, f)
+    (report_dir / "docs/antismash.md").write_text("# antiSMASH\n{{ project().name }}\n")
+    (report_dir / "docs/seqfu.md").write_text("# seqfu\n")
+    return report_dir
+
+
+class TestStaticReport(unittest.TestCase):
+    def setUp(self):
+        self.bgcflow_dir = Path(tempfile.mkdtemp())
+        self.report_dir = make_report_project(self.bgcflow_dir)
+
+    def test_get_page_output(self):
+        site_dir = Path("site")
+        self.assertEqual(
+            get_page_output("docs/index.md", site_dir), site_dir / "index.html"
+        )
+        self.assertEqual(
+            get_page_output("docs/antismash.ipynb", site_dir),
+            site_dir / "antismash/index.html",
+        )
+
+    def test_incremental_build(self):
+        site_dir = build_static_report(self.bgcflow_dir, "test_project")
+        self.assertTrue((site_dir / "antismash/index.html").is_file())
+        with open(self.report_dir / ".bgcflow_build.json", "r") as f:
+            build_manifest = json.load(f)
+        self.assertIn("docs/seqfu.md", build_manifest["pages"])
+
+        with mock.patch("bgcflow.mkdocs.subprocess.run") as run:
+            build_static_report(self.bgcflow_dir, "test_project")
+            run.assert_not_called()
+
+            (self.report_dir / "docs/seqfu.md").write_text("# seqfu\nupdated\n")
+            build_static_report(self.bgcflow_dir, "test_project")
+            self.assertIn("--dirty", run.call_args.args[0])
+            self.assertFalse((site_dir / "seqfu/index.html").exists())
+            self.assertTrue((site_dir / "antismash/index.html").is_file())
+
+    def test_table_changes_rebuild_page(self):
+        (self.report_dir / "tables").mkdir()
+        table = self.report_dir / "tables/df_seqfu.csv"
+        table.write_text("genome_id,source,strain\ngenome1,ncbi,A\n")
+        (self.report_dir / "docs/seqfu.md").write_text(
+            '# seqfu\n{{ read_csv_html("tables/df_seqfu.csv", "genomes") }}\n'
+        )
+        site_dir = build_static_report(self.bgcflow_dir, "test_project")
+        self.assertIn("genome1", (site_dir / "seqfu/index.html").read_text())
+
+        with mock.patch("bgcflow.mkdocs.subprocess.run") as run:
+            table.write_text("genome_id,source,strain\ngenome2,ncbi,B\n")
+            build_static_report(self.bgcflow_dir, "test_project")
+            self.assertIn("--dirty", run.call_args.args[0])
+            self.assertFalse((site_dir / "seqfu/index.html").exists())
+            self.assertTrue((site_dir / "antismash/index.html").is_file())
+
+    def test_incremental_search_index(self):
+        site_dir = build_static_report(self.bgcflow_dir, "test_project")
+        (self.report_dir / "docs/seqfu.md").write_text("# seqfu\nupdated\n")
+        build_static_report(self.bgcflow_dir, "test_project")
+        with open(site_dir / "search/search_index.json", "r") as f:
+            docs = json.load(f)["docs"]
+        locations = {d["location"].split("#")[0] for d in docs}
+        self.assertEqual(locations, {"", "antismash/", "seqfu/"})
+        self.assertTrue(any("updated" in d["text"] for d in docs))
+
+    def test_idempotent_scaffolding(self):
+        prepare_mkdocs_report(self.bgcflow_dir, "test_project", ipynb=False)
+        generated = ["mkdocs.yml", "main.py", "docs/index.md", "overrides/main.html"]
+        mtimes = {f: (self.report_dir / f).stat().st_mtime_ns for f in generated}
+
+        (self.report_dir / "main.py").write_text("# edited by hand\n")
+        mtimes.pop("main.py")
+        prepare_mkdocs_report(self.bgcflow_dir, "test_project", ipynb=False)
+        for f, mtime in mtimes.items():
+            self.assertEqual((self.report_dir / f).stat().st_mtime_ns, mtime)
+        self.assertEqual(
+            (self.report_dir / "main.py.bak").read_text(), "# edited by hand\n"
+        )
+        self.assertIn("define_env", (self.report_dir / "main.py").read_text())
+
+        results = run_for_projects(
+            prepare_mkdocs_report,
+            self.bgcflow_dir,
+            ["test_project", "missing"],
+            ipynb=False,
+        )
+        self.assertEqual(results["test_project"]["result"], self.report_dir)
+        self.assertEqual(results["missing"]["status"], "failed")
+
+    def test_macros(self):
+        main_py = self.report_dir / "main.py"
+        main_py.write_text(
+            Template(macros_template).render(
+                {"file_server": "http://localhost:8002", "table_api": False}
+            )
+        )
+        spec = importlib.util.spec_from_file_location("main", main_py)
+        macros = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(macros)
+        # large tables are only paginated if the built-in file server serves the page
+        macros.paginate_threshold = 1
+
+        class Env:
+            def __init__(self):
+                self.macros = {}
+
+            def macro(self, f):
+                self.macros[f.__name__] = f
+                return f
+
+        env = Env()
+        macros.define_env(env)
+        project = env.macros["project"]()
+        self.assertIs(project, env.macros["project"]())
+        self.assertEqual(project.name, "test_project")
+        self.assertEqual(project.dependency_version(), "7.1.0")
+
+        samples = self.report_dir / "samples.csv"
+        pd.DataFrame(
+            {
+                "genome_id": ["g1", "g2"],
+                "source": ["ncbi", "custom"],
+                "strain": ["a", "b"],
+            }
+        ).to_csv(samples, index=False)
+        html = env.macros["read_csv_html"](samples, "antismash")
+        self.assertIn("<a href='antismash/g2/'>link</a>", html)
+
+        html = env.macros["read_csv_html"](samples, "antismash", paginate=True)
+        self.assertIn('data-path="samples.csv"', html)
+        self.assertIn('data-endpoint="http://localhost:8002/api/table"', html)
+        self.assertIn('data-link-path="antismash"', html)
+        self.assertIn("<th>url</th>", html)
+        # tables without a genome_id column have no row links
+        html = env.macros["read_csv_json"](
+            samples, "antismash", columns=("source", "strain")
+        )
+        self.assertIn('data-link-path=""', html)
+        self.assertNotIn("<th>url</th>", html)
+        macros.table_api = True
+        html = env.macros["read_csv_html"](samples, "antismash")
+        self.assertIn('data-path="samples.csv"', html)
+
+    def tearDown(self):
+        shutil.rmtree(self.bgcflow_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import nbformat
+
+from bgcflow.notebook import (
+    execute_notebook,
+    execute_notebooks,
+    execute_report_notebooks,
+)
+from bgcflow.services import is_process_alive
+
+
+def write_notebook(path, source):
+    """Write a notebook with a single code cell."""
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells.append(nbformat.v4.new_code_cell(source))
+    nbformat.write(notebook, path)
+
+
+class TestExecuteNotebooks(unittest.TestCase):
+    def setUp(self):
+        self.report_dir = Path(tempfile.mkdtemp())
+        write_notebook(self.report_dir / "ok.ipynb", "print(1 + 1)")
+        write_notebook(self.report_dir / "failed.ipynb", "raise ValueError('broken')")
+
+    def test_execute_notebooks(self):
+        results = execute_notebooks(
+            [
+                {"notebook": self.report_dir / "ok.ipynb"},
+                {"notebook": self.report_dir / "failed.ipynb"},
+            ],
+            workers=2,
+            timeout=120,
+        )
+        self.assertEqual([r["status"] for r in results], ["ok", "failed"])
+        self.assertIn("broken", results[1]["error"])
+        executed = nbformat.read(self.report_dir / "ok.ipynb", as_version=4)
+        self.assertEqual(executed.cells[0].outputs[0]["text"], "2\n")
+
+    def test_execution_cache(self):
+        (self.report_dir / "genomes.csv").write_text("genome_id\ngenome1\n")
+        write_notebook(
+            self.report_dir / "table.ipynb",
+            "print(open('genomes.csv').read().count('genome'))",
+        )
+        cache_dir = self.report_dir / ".bgcflow_cache/notebooks"
+        result = execute_notebook(self.report_dir / "table.ipynb", cache_dir=cache_dir)
+        self.assertEqual(result["status"], "ok")
+        result = execute_notebook(self.report_dir / "table.ipynb", cache_dir=cache_dir)
+        self.assertEqual(result["status"], "cached")
+
+        (self.report_dir / "genomes.csv").write_text("genome_id\ngenome1\ngenome2\n")
+        result = execute_notebook(self.report_dir / "table.ipynb", cache_dir=cache_dir)
+        self.assertEqual(result["status"], "ok")
+        executed = nbformat.read(self.report_dir / "table.ipynb", as_version=4)
+        self.assertEqual(executed.cells[0].outputs[0]["text"], "3\n")
+        self.assertEqual(len(list(cache_dir.glob("*.ipynb"))), 1)
+
+    def test_report_execution_cache(self):
+        report_dir = self.report_dir / "report"
+        (report_dir / "docs").mkdir(parents=True)
+        (report_dir / "tables").mkdir()
+        (report_dir / "tables/df_genomes.csv").write_text("genome_id\ngenome1\n")
+        # the input path is built at run time, so it is not found in the notebook source
+        write_notebook(
+            report_dir / "docs/genomes.ipynb",
+            "from pathlib import Path\n"
+            "table = Path('../') / 'tables/df_genomes.csv'\n"
+            "print(table.read_text().count('genome'))",
+        )
+        statuses = []
+        for _ in range(2):
+            results = execute_report_notebooks(report_dir, workers=1, timeout=120)
+            statuses.append(results[0]["status"])
+        self.assertEqual(statuses, ["ok", "cached"])
+
+        (report_dir / "tables/df_genomes.csv").write_text(
+            "genome_id\ngenome1\ngenome2\n"
+        )
+        results = execute_report_notebooks(report_dir, workers=1, timeout=120)
+        self.assertEqual(results[0]["status"], "ok")
+        executed = nbformat.read(report_dir / "docs/genomes.ipynb", as_version=4)
+        self.assertEqual(executed.cells[0].outputs[0]["text"], "3\n")
+
+    def test_timeout_kills_kernel(self):
+        notebook = nbformat.v4.new_notebook()
+        notebook.cells.append(
+            nbformat.v4.new_code_cell(
+                "import os, time\n"
+                "with open('kernel.pid', 'w') as f:\n"
+                "    f.write(str(os.getpid()))"
+            )
+        )
+        # no cell exceeds the per-cell timeout of nbconvert, only the whole notebook does
+        for _ in range(3):
+            notebook.cells.append(nbformat.v4.new_code_cell("time.sleep(10)"))
+        nbformat.write(notebook, self.report_dir / "slow.ipynb")
+        result = execute_notebook(self.report_dir / "slow.ipynb", timeout=15)
+        self.assertEqual(result["status"], "timeout")
+        kernel_pid = int((self.report_dir / "kernel.pid").read_text())
+        self.assertFalse(is_process_alive(kernel_pid))
+
+    def tearDown(self):
+        shutil.rmtree(self.report_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.report_benchmark import (
+    benchmark_case,
+    compare_results,
+    make_synthetic_project,
+)
+
+
+class TestReportBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = Path(tempfile.mkdtemp())
+
+    def test_make_synthetic_project(self):
+        report_dir = make_synthetic_project(self.work_dir, "synthetic", 3, 10)
+        self.assertEqual(len(list((report_dir / "docs").glob("rule_*.md"))), 3)
+        self.assertEqual(
+            len((report_dir / "tables/df_rule_002.csv").read_text().splitlines()), 11
+        )
+
+    def test_benchmark_case(self):
+        result = benchmark_case(2, 20, repeat=1, build=False, work_dir=self.work_dir)
+        self.assertEqual(
+            list(result["steps"].keys()),
+            ["scaffold_cold", "scaffold_warm", "render_pages"],
+        )
+        self.assertEqual(list(self.work_dir.iterdir()), [])
+
+        slower = {
+            "results": [
+                {
+                    "rules": 2,
+                    "genomes": 20,
+                    "steps": {
+                        step: {"median": t["median"] * 2}
+                        for step, t in result["steps"].items()
+                    },
+                }
+            ]
+        }
+        rows = compare_results({"results": [result]}, slower)
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(r["regression"] for r in rows))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import io
+import json
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest import mock
+
+import yaml
+
+from bgcflow.bgcflow import get_all_rules
+from bgcflow.rules import RuleCatalog
+
+rules = {
+    "antismash": {
+        "description": "Identifies biosynthetic gene clusters.",
+        "references": ["Blin et al. antiSMASH 7.0"],
+    },
+    "bigscape": {
+        "description": "Builds gene cluster families from antiSMASH results.",
+        "references": ["Navarro-Munoz et al. BiG-SCAPE"],
+    },
+    "checkm": {
+        "description": "Assesses the quality of genomes.",
+        "references": ["Parks et al. CheckM"],
+    },
+}
+
+
+class TestRuleCatalog(unittest.TestCase):
+    def setUp(self):
+        self.bgcflow_dir = Path(tempfile.mkdtemp())
+        (self.bgcflow_dir / "workflow").mkdir()
+        with open(self.bgcflow_dir / "workflow/rules.yaml", "w") as f:
+            yaml.safe_dump(rules, f)
+        self.cache_dir = self.bgcflow_dir / "cache"
+        # no test may write to the default cache, or relative to the working directory
+        patch = mock.patch("bgcflow.rules.rule_cache_dir", self.cache_dir)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def catalog(self):
+        return RuleCatalog(self.bgcflow_dir, cache_dir=self.cache_dir)
+
+    def test_search(self):
+        catalog = self.catalog()
+        self.assertEqual(catalog.names(), ["antismash", "bigscape", "checkm"])
+        # a match in the name ranks above matches in descriptions
+        self.assertEqual(
+            [name for name, _ in catalog.search("antismash")],
+            ["antismash", "bigscape"],
+        )
+        self.assertEqual(catalog.search("genome qualty")[0][0], "checkm")
+        self.assertEqual(catalog.search("families")[0][0], "bigscape")
+        self.assertEqual(catalog.search("unrelated"), [])
+
+        with self.assertRaisesRegex(KeyError, "Did you mean: antismash"):
+            catalog.get("antismsh")
+
+    def test_cache(self):
+        self.catalog()
+        with mock.patch("bgcflow.rules.yaml.safe_load") as safe_load:
+            self.assertEqual(self.catalog().get("checkm"), rules["checkm"])
+        safe_load.assert_not_called()
+
+    def test_get_all_rules(self):
+        def run(**kwargs):
+            output = io.StringIO()
+            options = {"describe": None, "cite": None, "search": None, "json": False}
+            with redirect_stdout(output):
+                get_all_rules(bgcflow_dir=self.bgcflow_dir, **{**options, **kwargs})
+            return output.getvalue()
+
+        self.assertIn("Did you mean: checkm?", run(describe="chekm"))
+        self.assertIn(" - bigscape: Builds", run(search="familes"))
+        results = json.loads(run(search="gene clusters", json=True))
+        self.assertEqual(results[0]["name"], "antismash")
+        self.assertEqual(
+            json.loads(run(cite="checkm", json=True)), {"checkm": rules["checkm"]}
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.bgcflow_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
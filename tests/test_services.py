@@ -0,0 +1,103 @@
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import requests
+
+from bgcflow.cache import save_json_state
+from bgcflow.services import (
+    ServiceSupervisor,
+    find_free_port,
+    is_process_alive,
+    process_start_time,
+)
+
+
+class TestServiceSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.bgcflow_dir = Path(tempfile.mkdtemp())
+        (self.bgcflow_dir / "index.html").write_text("hello")
+        self.supervisor = ServiceSupervisor(self.bgcflow_dir)
+        self.command = [
+            sys.executable,
+            "-m",
+            "bgcflow.fileserver",
+            "--directory",
+            self.bgcflow_dir,
+            "{port}",
+        ]
+
+    def test_start_reuse_stop(self):
+        # keep the preferred port busy to force another one
+        with socket.socket() as busy:
+            busy.bind(("", 0))
+            busy.listen()
+            port = busy.getsockname()[1]
+            service = self.supervisor.start(
+                "file_server", self.command, port=port, key="a"
+            )
+        self.assertTrue(service["started"])
+        self.assertNotEqual(service["port"], port)
+        self.assertEqual(requests.get(f"{service['url']}/index.html").text, "hello")
+
+        reused = self.supervisor.start("file_server", self.command, port=port, key="a")
+        self.assertFalse(reused["started"])
+        self.assertEqual(reused["pid"], service["pid"])
+        self.assertEqual(list(self.supervisor.status().keys()), ["file_server"])
+
+        restarted = self.supervisor.start("file_server", self.command, key="b")
+        self.assertTrue(restarted["started"])
+        self.assertFalse(is_process_alive(service["pid"]))
+
+        self.assertEqual(self.supervisor.stop_all(), ["file_server"])
+        self.assertFalse(is_process_alive(restarted["pid"]))
+        self.assertEqual(self.supervisor.status(), {})
+
+    def test_failed_start(self):
+        with self.assertRaises(RuntimeError):
+            self.supervisor.start(
+                "broken", [sys.executable, "-c", "raise SystemExit(1)"], timeout=10
+            )
+        self.assertEqual(self.supervisor.load(), {})
+
+    def test_reused_pid(self):
+        # a recorded service whose process id now belongs to an unrelated process
+        process = subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(60)"],
+            start_new_session=True,
+        )
+        self.addCleanup(process.wait)
+        self.addCleanup(process.kill)
+        service = {
+            "name": "file_server",
+            "pid": process.pid,
+            "process_start": "another boot:1",
+            "port": 1,
+            "url": "http://localhost:1",
+            "health_url": "http://localhost:1/",
+            "key": "a",
+            "external": False,
+        }
+        save_json_state(self.supervisor.state_path, {"file_server": service})
+        self.assertIsNotNone(process_start_time(process.pid))
+        self.assertFalse(self.supervisor.is_alive(service))
+
+        self.assertEqual(self.supervisor.stop_all(), ["file_server"])
+        self.assertIsNone(process.poll())
+        self.assertEqual(self.supervisor.load(), {})
+
+    def test_find_free_port(self):
+        port = find_free_port()
+        self.assertEqual(find_free_port(port), port)
+
+    def tearDown(self):
+        self.supervisor.stop_all()
+        shutil.rmtree(self.bgcflow_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()